@@ -0,0 +1,179 @@
+"""Published artifacts: manifests, finalize (atomic publish, compaction, blob dedupe)."""
+import os, json, subprocess, uuid, pathlib, shutil, time, hashlib, mimetypes, re
+from typing import Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+
+from app.core import RENDERS_DIR, log, write_atomic
+from app.media import probe_duration
+from app.hls import HLS_DIR, HLS_PLAYLIST
+
+# ---------- Published artifacts ----------
+# A job directory never changes once the job is finished, so its artifacts are served under
+# job-scoped URLs as immutable: strong ETag (sha256 of the content), a one-year max-age and byte
+# ranges. manifest.json is written last, atomically; until it exists the job is unfinished and
+# its files are not served (202 while it is running, 404 otherwise).
+MANIFEST = "manifest.json"
+PUBLISHED_ARTIFACTS = ("out.mp4", "captions.vtt", "thumb.jpg", HLS_PLAYLIST)
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+JOB_ID_RE = re.compile(r"^[0-9a-f]{8}$")
+ARTIFACT_MEDIA_TYPES = {
+    ".mp4": "video/mp4",
+    ".m4s": "video/iso.segment",
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".vtt": "text/vtt",
+    ".jpg": "image/jpeg",
+}
+
+def file_sha256(path: pathlib.Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def publish_manifest(workdir: pathlib.Path, hashes: Optional[dict] = None) -> dict:
+    """Hash the finished artifacts and write manifest.json, which marks the job as published."""
+    hashes = hashes or {}
+    artifacts = {}
+    for name in PUBLISHED_ARTIFACTS:
+        p = workdir / name
+        if p.is_file():
+            artifacts[name] = {"sha256": hashes.get(name) or file_sha256(p), "size": p.stat().st_size}
+    manifest = {"jobId": workdir.name, "publishedAt": time.time(), "duration": probe_duration(workdir / "out.mp4"),
+                "artifacts": artifacts}
+    write_atomic(workdir / MANIFEST, json.dumps(manifest, indent=2))
+    return manifest
+
+def load_manifest(workdir: pathlib.Path) -> Optional[dict]:
+    try:
+        return json.loads((workdir / MANIFEST).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+def published_result(workdir: pathlib.Path) -> dict:
+    """The /generate body of a finished job."""
+    return {
+        "jobId": workdir.name,
+        "videoUrl": f"/renders/{workdir.name}/out.mp4",
+        "subsUrl":  f"/renders/{workdir.name}/captions.vtt"
+    }
+
+def _artifact_response(request: Request, path: pathlib.Path, headers: dict) -> Response:
+    etag = headers.get("ETag")
+    if etag and etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    media_type = ARTIFACT_MEDIA_TYPES.get(path.suffix) or mimetypes.guess_type(path.name)[0]
+    return FileResponse(path, headers=headers, media_type=media_type)
+
+# ---------- Finalize: atomic publish, compaction, dedupe ----------
+# After a successful job only the published artifacts, the code and the logs stay in the job dir.
+# Large artifacts are stored once in a content-addressed blob store (_blobs/<sha[:2]>/<sha><ext>)
+# and hard-linked into every job dir that produced identical bytes; a blob whose only remaining
+# link is the store itself is reclaimed by the GC.
+BLOBS_DIR = RENDERS_DIR / "_blobs"
+INTERMEDIATE_DIRS = ("media", "videos", "sections", "Tex", "texts", "__pycache__")
+INTERMEDIATE_GLOBS = ("speech_chunk_*.mp3", "narration_preview.mp3", "silent.mp4", "merged.mp4",
+                      "*_section[0-9]*.py", "*_sectioned.py", f"{HLS_DIR}/*/part_*.m3u8", ".*.tmp")
+DEDUPE_ARTIFACTS = ("out.mp4", "narration.mp3")
+
+def link_to_blob(path: pathlib.Path, sha: str) -> bool:
+    """Replace path by a hard link to its content-addressed blob. False if links are unsupported."""
+    blob = BLOBS_DIR / sha[:2] / (sha + path.suffix)
+    tmp = path.with_name(f".{path.name}.tmp")
+    try:
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        if not blob.exists():
+            blob_tmp = blob.with_name(f".{blob.name}.{uuid.uuid4().hex[:8]}.tmp")
+            os.link(path, blob_tmp)
+            os.replace(blob_tmp, blob)
+            return True
+        tmp.unlink(missing_ok=True)
+        os.link(blob, tmp)
+        os.replace(tmp, path)
+        return True
+    except OSError as e:
+        log.warning("Blob dedupe of %s skipped: %s", path, e)
+        tmp.unlink(missing_ok=True)
+        return False
+
+def remove_intermediates(workdir: pathlib.Path) -> int:
+    """Delete what manim, pydub and the stream segmenter left behind. Returns bytes freed."""
+    freed = 0
+    doomed = [workdir / d for d in INTERMEDIATE_DIRS]
+    for pattern in INTERMEDIATE_GLOBS:
+        doomed += list(workdir.glob(pattern))
+    for p in doomed:
+        if p.is_dir():
+            freed += _scan_job_dir(p)[0]
+            shutil.rmtree(p, ignore_errors=True)
+        elif p.is_file():
+            freed += p.stat().st_size
+            p.unlink(missing_ok=True)
+    return freed
+
+def make_thumbnail(workdir: pathlib.Path) -> Optional[pathlib.Path]:
+    """Small poster frame for the gallery, taken a second in (or from the middle of short videos)."""
+    video = workdir / "out.mp4"
+    thumb = workdir / "thumb.jpg"
+    at = min(1.0, (probe_duration(video) or 0.0) / 2)
+    tmp = workdir / ".thumb.tmp.jpg"
+    try:
+        subprocess.run(["ffmpeg", "-y", "-ss", f"{at:.2f}", "-i", str(video), "-frames:v", "1", "-vf", "scale=320:-2", str(tmp)],
+                       check=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, timeout=60)
+        os.replace(tmp, thumb)
+        return thumb
+    except Exception as e:
+        log.warning("Thumbnail for %s failed: %s", workdir.name, e)
+        tmp.unlink(missing_ok=True)
+        return None
+
+def finalize_job(workdir: pathlib.Path, merged_path: pathlib.Path) -> dict:
+    """
+    Publish a successful job: atomically rename the muxed video to out.mp4, drop intermediates,
+    dedupe large artifacts into the blob store and write manifest.json last.
+    """
+    os.replace(merged_path, workdir / "out.mp4")
+    freed = remove_intermediates(workdir)
+    make_thumbnail(workdir)
+    hashes = {}
+    for name in DEDUPE_ARTIFACTS:
+        p = workdir / name
+        if p.is_file():
+            hashes[name] = file_sha256(p)
+            link_to_blob(p, hashes[name])
+    manifest = publish_manifest(workdir, hashes)
+    log.info("Job %s finalized (%d bytes of intermediates removed)", workdir.name, freed)
+    return manifest
+
+def prune_orphan_blobs(dry_run: bool = False) -> Tuple[int, int]:
+    """Delete blobs no job dir links to any more. Returns (count, bytes)."""
+    count = size = 0
+    if not BLOBS_DIR.is_dir():
+        return 0, 0
+    for blob in BLOBS_DIR.glob("*/*"):
+        try:
+            st = blob.stat()
+        except OSError:
+            continue
+        if blob.name.startswith(".") or st.st_nlink > 1:
+            continue
+        count += 1
+        size += st.st_size
+        if not dry_run:
+            blob.unlink(missing_ok=True)
+    return count, size
+
+def _scan_job_dir(workdir: pathlib.Path) -> Tuple[int, float]:
+    """(total bytes, newest mtime) of everything under a job dir."""
+    total, newest = 0, workdir.stat().st_mtime
+    for root, _, files in os.walk(workdir):
+        for name in files:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            total += st.st_size
+            newest = max(newest, st.st_mtime)
+    return total, newest
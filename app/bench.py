@@ -0,0 +1,391 @@
+"""
+Offline end-to-end pipeline benchmark over the recorded jobs in app/renders.
+
+Every job dir with a scene file and captions.vtt is replayed through
+sanitize -> compile -> render -> TTS -> mux, with the OpenAI client replaced by a local
+stub that returns deterministic audio. Per stage it records wall time, CPU time (this
+process + child processes), peak RSS and output size, and writes everything as JSON so two
+runs can be compared:
+
+    python -m app.bench run --out before.json
+    python -m app.bench run --out after.json
+    python -m app.bench compare before.json after.json
+
+`python -m app.bench sanitize` is a micro-benchmark of sanitize_and_fix_code alone over the
+recorded scene files; its report has the same shape, so `compare` works on it too.
+
+`python -m app.bench prompts` compares the system prompt variants (PROMPT_VARIANT) on the real
+jobs in the job index: success and first-pass success rates, end-to-end and generate-call
+latency, and prompt/cached/completion tokens per job.
+
+`python -m app.bench imports` measures the cold import of app.main in fresh interpreters
+(python -X importtime) and lists its slowest direct imports. With --max-seconds it exits non-zero
+when the median import takes longer, so CI can fail on import-time regressions:
+
+    python -m app.bench imports --repeat 5 --max-seconds 1.5 --out imports.json
+"""
+import os, sys, json, time, pathlib, platform, argparse, tempfile, shutil, statistics, subprocess, traceback, re
+from typing import List, Optional
+
+os.environ.setdefault("OPENAI_API_KEY", "bench-stub")  # the OpenAI client needs a key once it is built
+os.environ.setdefault("RENDER_CACHE_MAX_BYTES", "0")  # every run must really render
+
+from app import artifacts, core, index, media, render, sanitize, schemas, toolchain  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows: no child rusage, CPU/RSS of manim/ffmpeg are not reported
+    resource = None
+
+STAGES = ("sanitize", "compile", "render", "tts", "mux")
+CUE_RE = re.compile(r"^(\d+):(\d\d):(\d\d)\.(\d{3}) --> (\d+):(\d\d):(\d\d)\.(\d{3})")
+
+# ---------- Stub TTS ----------
+class _StubSpeech:
+    def __init__(self, text: str):
+        self.text = text
+
+    def stream_to_file(self, path: str):
+        from pydub.generators import Sine
+        # 60 ms per character of a pitch derived from the text: deterministic, realistic length
+        pitch = 220 + sum(map(ord, self.text)) % 440
+        Sine(pitch).to_audio_segment(duration=max(200, 60 * len(self.text))).export(path, format="mp3")
+
+class StubOpenAI:
+    """Just enough of the OpenAI client for build_narration_segments()."""
+
+    class audio:
+        class speech:
+            @staticmethod
+            def create(model: str, voice: str, input: str, response_format: str = "mp3"):
+                return _StubSpeech(input)
+
+# ---------- Corpus ----------
+def parse_vtt(text: str) -> List[schemas.SubtitleCue]:
+    cues = []
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        m = CUE_RE.match(line.strip())
+        if not m:
+            continue
+        g = [int(x) for x in m.groups()]
+        start = g[0] * 3600 + g[1] * 60 + g[2] + g[3] / 1000
+        end = g[4] * 3600 + g[5] * 60 + g[6] + g[7] / 1000
+        text_lines = []
+        for follow in lines[i + 1:]:
+            if not follow.strip():
+                break
+            text_lines.append(follow.strip())
+        cues.append(schemas.SubtitleCue(start=start, end=end, text=" ".join(text_lines)))
+    return cues
+
+def scene_name_of(code: str) -> Optional[str]:
+    m = re.search(r"^class\s+(\w+)\s*\(\s*[\w.]*Scene\s*\)", code, flags=re.MULTILINE)
+    return m.group(1) if m else None
+
+def load_corpus(corpus: pathlib.Path, only: Optional[List[str]] = None) -> List[dict]:
+    payloads = []
+    for workdir in sorted(corpus.iterdir()):
+        if not workdir.is_dir() or not artifacts.JOB_ID_RE.match(workdir.name):
+            continue
+        if only and workdir.name not in only:
+            continue
+        code_files = sorted(p for p in workdir.glob("*.py") if "_section" not in p.stem)
+        vtt = workdir / "captions.vtt"
+        if not code_files or not vtt.is_file():
+            continue
+        code = code_files[0].read_text(encoding="utf-8", errors="replace")
+        scene = scene_name_of(code)
+        if scene is None:
+            continue
+        payloads.append({
+            "job": workdir.name,
+            "file_name": code_files[0].name,
+            "scene_name": scene,
+            "code": code,
+            "cues": parse_vtt(vtt.read_text(encoding="utf-8", errors="replace")),
+        })
+    return payloads
+
+# ---------- Measurement ----------
+def _usage():
+    wall = time.perf_counter()
+    if resource is None:
+        return wall, time.process_time(), None, None
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = own.ru_utime + own.ru_stime + kids.ru_utime + kids.ru_stime
+    return wall, cpu, own.ru_maxrss, kids.ru_maxrss
+
+class StageTimer:
+    """Measures one stage; peak RSS is the high-water mark of this process and of any child so far."""
+
+    def __init__(self, results: dict, name: str):
+        self.results = results
+        self.name = name
+        self.output_bytes = None
+
+    def __enter__(self):
+        self.start = _usage()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = _usage()
+        entry = {
+            "ok": exc_type is None,
+            "wall": round(end[0] - self.start[0], 4),
+            "cpu": round(end[1] - self.start[1], 4),
+            "peakRssKb": end[2],
+            "childPeakRssKb": end[3],
+            "bytes": self.output_bytes,
+        }
+        if exc_type is not None:
+            entry["error"] = "".join(traceback.format_exception_only(exc_type, exc)).strip()[-2000:]
+        self.results[self.name] = entry
+        return True  # a failed stage is recorded, later stages are skipped by the caller
+
+def bench_job(payload: dict, workroot: pathlib.Path, render: bool, timeout: float) -> dict:
+    workdir = workroot / payload["job"]
+    workdir.mkdir(parents=True, exist_ok=True)
+    stages = {}
+    code = None
+    with StageTimer(stages, "sanitize") as t:
+        code = sanitize.sanitize_and_fix_code(payload["code"])
+        t.output_bytes = len(code.encode("utf-8"))
+    if not stages["sanitize"]["ok"]:
+        return stages
+    with StageTimer(stages, "compile"):
+        compile(code, payload["file_name"], "exec")
+    if not stages["compile"]["ok"]:
+        return stages
+    (workdir / payload["file_name"]).write_text(code, encoding="utf-8")
+
+    video = None
+    if render:
+        with StageTimer(stages, "render") as t:
+            _, video = render.render_scene(workdir, payload["file_name"], payload["scene_name"], timeout, payload["cues"])
+            if video is None:
+                raise RuntimeError("render finished without out.mp4")
+            t.output_bytes = video.stat().st_size
+        if not stages["render"]["ok"]:
+            return stages
+
+    audio_path = workdir / "narration.mp3"
+    with StageTimer(stages, "tts") as t:
+        segments, prev_end = media.build_narration_segments(payload["cues"], workdir, {}, tts_client=StubOpenAI)
+        media.mix_narration(segments, prev_end, video or workdir / "missing.mp4", audio_path)
+        t.output_bytes = audio_path.stat().st_size
+    if video is None or not stages["tts"]["ok"]:
+        return stages
+
+    merged = workdir / "merged.mp4"
+    with StageTimer(stages, "mux") as t:
+        media.mux_narration(video, audio_path, merged)
+        t.output_bytes = merged.stat().st_size
+    return stages
+
+def summarize(jobs: List[dict]) -> dict:
+    summary = {}
+    for stage in STAGES:
+        entries = [j["stages"][stage] for j in jobs if stage in j["stages"]]
+        ok = [e for e in entries if e["ok"]]
+        if not entries:
+            continue
+        walls = [e["wall"] for e in ok]
+        summary[stage] = {
+            "runs": len(entries),
+            "ok": len(ok),
+            "wallTotal": round(sum(walls), 6),
+            "wallMedian": round(statistics.median(walls), 6) if walls else None,
+            "cpuTotal": round(sum(e["cpu"] for e in ok), 6),
+            "bytesTotal": sum(e["bytes"] or 0 for e in ok),
+        }
+    return summary
+
+def run(args) -> dict:
+    payloads = load_corpus(pathlib.Path(args.corpus), args.jobs.split(",") if args.jobs else None)
+    render = not args.skip_render and bool(shutil.which("manim")) and bool(shutil.which("ffmpeg"))
+    if not render and not args.skip_render:
+        print("manim/ffmpeg not on PATH: render and mux stages are skipped", file=sys.stderr)
+    workroot = pathlib.Path(tempfile.mkdtemp(prefix="bench-", dir=args.workdir))
+    jobs = []
+    try:
+        for payload in payloads:
+            print(f"[bench] {payload['job']} {payload['scene_name']}", file=sys.stderr)
+            stages = bench_job(payload, workroot, render, args.timeout)
+            jobs.append({"job": payload["job"], "scene": payload["scene_name"], "stages": stages})
+    finally:
+        if not args.keep:
+            shutil.rmtree(workroot, ignore_errors=True)
+    peak = _usage()
+    return {
+        "meta": {
+            "createdAt": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "manim": toolchain.toolchain()["tools"]["manim"]["version"] if render else None,
+            "quality": core.MANIM_QUALITY_FLAG,
+            "sectionWorkers": core.RENDER_SECTION_WORKERS,
+            "rendered": render,
+            "peakRssKb": peak[2],
+            "childPeakRssKb": peak[3],
+        },
+        "summary": summarize(jobs),
+        "jobs": jobs,
+    }
+
+def sanitize_micro(args) -> dict:
+    """Mean wall/CPU time per sanitize_and_fix_code call for every recorded scene file."""
+    payloads = load_corpus(pathlib.Path(args.corpus), args.jobs.split(",") if args.jobs else None)
+    jobs = []
+    for payload in payloads:
+        entry = {"ok": True, "peakRssKb": None, "childPeakRssKb": None, "bytes": None}
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            for _ in range(args.repeat):
+                out = sanitize.sanitize_and_fix_code(payload["code"])
+            entry["bytes"] = len(out.encode("utf-8"))
+        except ValueError as e:
+            entry.update(ok=False, error=str(e))
+        entry["wall"] = round((time.perf_counter() - wall) / args.repeat, 6)
+        entry["cpu"] = round((time.process_time() - cpu) / args.repeat, 6)
+        jobs.append({"job": payload["job"], "scene": payload["scene_name"], "stages": {"sanitize": entry}})
+    return {
+        "meta": {"createdAt": time.time(), "python": platform.python_version(), "platform": platform.platform(),
+                 "repeat": args.repeat},
+        "summary": summarize(jobs),
+        "jobs": jobs,
+    }
+
+def compare(old: dict, new: dict) -> dict:
+    """Per-stage change of median/total wall and CPU time between two runs (negative = faster)."""
+    def pct(a, b):
+        return round(100.0 * (b - a) / a, 1) if a else None
+    diff = {}
+    for stage in STAGES:
+        a, b = old["summary"].get(stage), new["summary"].get(stage)
+        if not a or not b:
+            continue
+        diff[stage] = {
+            "wallMedian": [a["wallMedian"], b["wallMedian"], pct(a["wallMedian"] or 0, b["wallMedian"] or 0)],
+            "wallTotal": [a["wallTotal"], b["wallTotal"], pct(a["wallTotal"], b["wallTotal"])],
+            "cpuTotal": [a["cpuTotal"], b["cpuTotal"], pct(a["cpuTotal"], b["cpuTotal"])],
+            "ok": [a["ok"], b["ok"]],
+        }
+    return diff
+
+def prompt_report(args) -> dict:
+    """Per prompt variant outcome, latency and token figures of the finished jobs in the job index."""
+    conn = index.connect_db(pathlib.Path(args.db))
+    rows = conn.execute(
+        "SELECT status, created_at, finished_at, render_attempts, prompt_variant, llm_calls FROM jobs"
+        " WHERE prompt_variant IS NOT NULL AND status != 'running' AND created_at >= ?",
+        (time.time() - args.days * 86400,)).fetchall()
+    conn.close()
+    groups = {}
+    for r in rows:
+        groups.setdefault(r["prompt_variant"], []).append(r)
+    median = lambda xs: round(statistics.median(xs), 3) if xs else None
+    variants = {}
+    for variant, jobs in sorted(groups.items()):
+        calls = [json.loads(j["llm_calls"] or "[]") for j in jobs]
+        generate = [c["seconds"] for cs in calls for c in cs if c["call"] == "generate" and c.get("seconds") is not None]
+        done = [j for j in jobs if j["status"] == "done"]
+        tokens = lambda key: round(sum(c.get(key, 0) for cs in calls for c in cs) / len(jobs), 1)
+        variants[variant] = {
+            "jobs": len(jobs),
+            "successRate": round(len(done) / len(jobs), 4),
+            "firstPassRate": round(sum(1 for j in done if j["render_attempts"] == 1) / len(jobs), 4),
+            "latencyMedian": median([j["finished_at"] - j["created_at"] for j in done if j["finished_at"]]),
+            "generateSecondsMedian": median(generate),
+            "promptTokensPerJob": tokens("promptTokens"),
+            "cachedTokensPerJob": tokens("cachedTokens"),
+            "completionTokensPerJob": tokens("completionTokens"),
+            "llmCallsPerJob": round(sum(len(cs) for cs in calls) / len(jobs), 2),
+        }
+    return {"meta": {"createdAt": time.time(), "db": str(args.db), "days": args.days}, "variants": variants}
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+def import_time(args) -> dict:
+    """Cold import time of app.main (median over --repeat fresh interpreters) and its slowest direct imports."""
+    root = pathlib.Path(__file__).resolve().parent.parent
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(root), os.environ.get("PYTHONPATH")])))
+    runs, modules = [], {}
+    for _ in range(args.repeat):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"],
+                              cwd=str(root), env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"import app.main failed:\n{proc.stderr[-2000:]}")
+        total = None
+        for line in proc.stderr.splitlines():
+            m = IMPORTTIME_RE.match(line)
+            if not m:
+                continue
+            cumulative, depth, name = int(m.group(2)) / 1e6, (len(m.group(3)) - 1) // 2, m.group(4)
+            if name == "app.main":
+                total = cumulative
+            elif depth == 1:  # imported directly by app.main (or by the app package)
+                modules.setdefault(name, []).append(cumulative)
+        runs.append(total)
+    median = statistics.median(runs)
+    slowest = sorted(((statistics.median(v), k) for k, v in modules.items()), reverse=True)[:args.top]
+    return {
+        "meta": {"createdAt": time.time(), "python": platform.python_version(), "platform": platform.platform(),
+                 "repeat": args.repeat, "maxSeconds": args.max_seconds},
+        "seconds": {"median": round(median, 4), "min": round(min(runs), 4), "max": round(max(runs), 4)},
+        "slowestImports": [{"module": k, "seconds": round(v, 4)} for v, k in slowest],
+        "ok": args.max_seconds is None or median <= args.max_seconds,
+    }
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_run = sub.add_parser("run", help="replay the corpus through the pipeline")
+    p_run.add_argument("--corpus", default=str(core.RENDERS_DIR))
+    p_run.add_argument("--jobs", help="comma-separated job ids to replay (default: all)")
+    p_run.add_argument("--skip-render", action="store_true", help="only sanitize/compile/tts")
+    p_run.add_argument("--timeout", type=float, default=480)
+    p_run.add_argument("--workdir", default=None, help="where scratch job dirs are created")
+    p_run.add_argument("--keep", action="store_true", help="keep the scratch job dirs")
+    p_run.add_argument("--out", default="-")
+    p_san = sub.add_parser("sanitize", help="micro-benchmark sanitize_and_fix_code over the recorded scenes")
+    p_san.add_argument("--corpus", default=str(core.RENDERS_DIR))
+    p_san.add_argument("--jobs", help="comma-separated job ids (default: all)")
+    p_san.add_argument("--repeat", type=int, default=200)
+    p_san.add_argument("--out", default="-")
+    p_pr = sub.add_parser("prompts", help="compare prompt variants on the jobs in the job index")
+    p_pr.add_argument("--db", default=str(index.JOBS_DB))
+    p_pr.add_argument("--days", type=float, default=30, help="only jobs created this many days back")
+    p_pr.add_argument("--out", default="-")
+    p_imp = sub.add_parser("imports", help="measure the cold import time of app.main")
+    p_imp.add_argument("--repeat", type=int, default=5)
+    p_imp.add_argument("--top", type=int, default=15, help="slowest direct imports to list")
+    p_imp.add_argument("--max-seconds", type=float, default=None, help="exit 1 when the median import is slower")
+    p_imp.add_argument("--out", default="-")
+    p_cmp = sub.add_parser("compare", help="compare two run reports")
+    p_cmp.add_argument("old")
+    p_cmp.add_argument("new")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "run":
+        report = run(args)
+    elif args.cmd == "sanitize":
+        report = sanitize_micro(args)
+    elif args.cmd == "prompts":
+        report = prompt_report(args)
+    elif args.cmd == "imports":
+        report = import_time(args)
+    else:
+        report = compare(json.loads(pathlib.Path(args.old).read_text()), json.loads(pathlib.Path(args.new).read_text()))
+    text = json.dumps(report, indent=2)
+    if getattr(args, "out", "-") == "-":
+        print(text)
+    else:
+        pathlib.Path(args.out).write_text(text, encoding="utf-8")
+    if args.cmd == "imports" and not report["ok"]:
+        print(f"[bench] import of app.main took {report['seconds']['median']}s (max {args.max_seconds}s)", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main_cli()
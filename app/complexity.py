@@ -0,0 +1,176 @@
+"""Complexity budget: clamps expensive literals of generated scenes to the quality tier."""
+import pathlib, ast, math
+from typing import List, Optional, Tuple
+
+from app.core import COMPLEXITY_DOWNSCALE, MANIM_QUALITY_FLAG, count, job_log, log
+from app.scheduler import SURFACE_DEFAULT_RESOLUTION, _call_name, _surface_resolution
+
+# ---------- Complexity budget ----------
+# Generated scenes choose surface resolutions, curve sampling, stream-line density and camera
+# rotation speed freely, and one oversized Surface can dominate a render. downscale_complexity()
+# runs after sanitize_and_fix_code() and clamps these literals to the budget of the current
+# quality tier. Only the argument text is rewritten (formatting and comments survive), and every
+# change comes back as a note for the job log.
+QUALITY_FPS = {"-ql": 15, "-qm": 30, "-qh": 60, "-qp": 60, "-qk": 60}
+COMPLEXITY_BUDGETS = {
+    "-ql": {"surface_cells": 32 * 32, "curve_samples": 200, "stream_lines": 120, "stream_anchors": 60},
+    "-qm": {"surface_cells": 48 * 48, "curve_samples": 400, "stream_lines": 200, "stream_anchors": 80},
+    "-qh": {"surface_cells": 64 * 64, "curve_samples": 800, "stream_lines": 300, "stream_anchors": 100},
+}
+MIN_SURFACE_AXIS = 8
+# Ambient camera rotation is capped per frame rather than per second: past ~2 degrees per frame the
+# motion strobes at low frame rates, so the cap rises with the tier's fps.
+AMBIENT_MAX_RADIANS_PER_FRAME = 0.035
+CURVE_RANGE_ARGS = {  # call name -> (range keyword, positional index of the range or None)
+    "ParametricFunction": ("t_range", 1),
+    "plot_parametric_curve": ("t_range", 1),
+    "FunctionGraph": ("x_range", None),
+    "plot": ("x_range", None),
+    "get_graph": ("x_range", None),
+}
+NUMERIC_NAMES = {"PI": math.pi, "TAU": math.tau, "DEGREES": math.tau / 360, "np.pi": math.pi, "math.pi": math.pi}
+
+def complexity_budget() -> dict:
+    return COMPLEXITY_BUDGETS.get(MANIM_QUALITY_FLAG, COMPLEXITY_BUDGETS["-qh"])
+
+def _number(node: ast.AST) -> Optional[float]:
+    """Value of a numeric literal expression (PI, TAU, DEGREES and + - * / allowed); None otherwise."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return float(node.value)
+    if isinstance(node, (ast.Name, ast.Attribute)):
+        return NUMERIC_NAMES.get(ast.unparse(node))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        v = _number(node.operand)
+        return None if v is None else (-v if isinstance(node.op, ast.USub) else v)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Sub, ast.Mult, ast.Div)):
+        a, b = _number(node.left), _number(node.right)
+        if a is None or b is None:
+            return None
+        if isinstance(node.op, ast.Div):
+            return a / b if b else None
+        return a + b if isinstance(node.op, ast.Add) else a - b if isinstance(node.op, ast.Sub) else a * b
+    return None
+
+def _fmt_number(x: float) -> str:
+    return str(int(x)) if float(x).is_integer() else f"{x:.4g}"
+
+def _keyword(call: ast.Call, name: str, position: Optional[int] = None) -> Optional[ast.AST]:
+    for kw in call.keywords:
+        if kw.arg == name:
+            return kw.value
+    if position is not None and len(call.args) > position and not any(isinstance(a, ast.Starred) for a in call.args):
+        return call.args[position]
+    return None
+
+def _range_triple(node: Optional[ast.AST]) -> Optional[Tuple[float, float, float]]:
+    if isinstance(node, (ast.List, ast.Tuple)) and len(node.elts) == 3:
+        vals = [_number(e) for e in node.elts]
+        if None not in vals and vals[2] > 0:
+            return vals[0], vals[1], vals[2]
+    return None
+
+def _downscale_call(call: ast.Call, budget: dict, fps: int, edits: list, notes: list, src: bytes, offsets: List[int]) -> None:
+    name = _call_name(call)
+    where = f"line {call.lineno}"
+    span = lambda n: (offsets[n.lineno - 1] + n.col_offset, offsets[n.end_lineno - 1] + n.end_col_offset)
+
+    if name in SURFACE_DEFAULT_RESOLUTION:
+        res = _surface_resolution(call)
+        if res is None or res[0] * res[1] <= budget["surface_cells"]:
+            return
+        f = math.sqrt(budget["surface_cells"] / (res[0] * res[1]))
+        new = (max(MIN_SURFACE_AXIS, int(res[0] * f)), max(MIN_SURFACE_AXIS, int(res[1] * f)))
+        value = _keyword(call, "resolution")
+        if value is None:
+            # Default resolution over budget: pass an explicit one before the closing parenthesis
+            end = span(call)[1] - 1
+            head = src[:end].rstrip()
+            sep = "" if head.endswith(b"(") else " " if head.endswith(b",") else ", "
+            edits.append((end, end, f"{sep}resolution=({new[0]}, {new[1]})"))
+        elif isinstance(value, ast.Constant):
+            new = (max(MIN_SURFACE_AXIS, int(math.sqrt(budget["surface_cells"]))),) * 2
+            edits.append((*span(value), str(new[0])))
+        else:
+            edits.append((*span(value), f"({new[0]}, {new[1]})"))
+        notes.append(f"{name} at {where}: resolution {res[0]}x{res[1]} -> {new[0]}x{new[1]}")
+
+    elif name in CURVE_RANGE_ARGS:
+        key, pos = CURVE_RANGE_ARGS[name]
+        value = _keyword(call, key, pos)
+        rng = _range_triple(value)
+        if rng is None:
+            return
+        lo, hi, step = rng
+        samples = abs(hi - lo) / step
+        if samples <= budget["curve_samples"]:
+            return
+        new_step = float(_fmt_number(abs(hi - lo) / budget["curve_samples"]))
+        edits.append((*span(value.elts[2]), _fmt_number(new_step)))
+        notes.append(f"{name} at {where}: {key} step {_fmt_number(step)} -> {_fmt_number(new_step)} "
+                     f"({int(samples)} -> {int(abs(hi - lo) / new_step)} samples)")
+
+    elif name == "StreamLines":
+        xr, yr = _range_triple(_keyword(call, "x_range")), _range_triple(_keyword(call, "y_range"))
+        repeats = _number(_keyword(call, "n_repeats") or ast.Constant(1)) or 1
+        if xr is not None and yr is not None:
+            lines = (abs(xr[1] - xr[0]) / xr[2]) * (abs(yr[1] - yr[0]) / yr[2]) * repeats
+            if lines > budget["stream_lines"]:
+                f = math.sqrt(lines / budget["stream_lines"])
+                for key, rng in (("x_range", xr), ("y_range", yr)):
+                    edits.append((*span(_keyword(call, key).elts[2]), _fmt_number(float(_fmt_number(rng[2] * f)))))
+                notes.append(f"StreamLines at {where}: x/y_range step x{f:.2f} ({int(lines)} -> ~{budget['stream_lines']} lines)")
+        anchors = _keyword(call, "max_anchors_per_line")
+        n = _number(anchors) if anchors is not None else None
+        if n is not None and n > budget["stream_anchors"]:
+            edits.append((*span(anchors), str(budget["stream_anchors"])))
+            notes.append(f"StreamLines at {where}: max_anchors_per_line {int(n)} -> {budget['stream_anchors']}")
+
+    elif name == "begin_ambient_camera_rotation":
+        value = _keyword(call, "rate", 0)
+        rate = _number(value) if value is not None else None
+        cap = AMBIENT_MAX_RADIANS_PER_FRAME * fps
+        if rate is None or abs(rate) <= cap:
+            return
+        new_rate = math.copysign(cap, rate)
+        edits.append((*span(value), _fmt_number(round(new_rate, 3))))
+        notes.append(f"ambient camera rotation at {where}: rate {_fmt_number(rate)} -> {_fmt_number(round(new_rate, 3))} rad/s "
+                     f"(max {AMBIENT_MAX_RADIANS_PER_FRAME} rad/frame at {fps} fps)")
+
+def downscale_complexity(code: str) -> Tuple[str, List[str]]:
+    """Clamp over-budget surface/curve/stream-line/camera-rotation literals. Returns (code, notes)."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return code, []
+    budget, fps = complexity_budget(), QUALITY_FPS.get(MANIM_QUALITY_FLAG, 60)
+    # ast offsets are UTF-8 byte columns, so edits are made on the encoded source
+    src = code.encode("utf-8")
+    offsets = [0]
+    for line in src.splitlines(keepends=True):
+        offsets.append(offsets[-1] + len(line))
+    edits, notes = [], []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            _downscale_call(node, budget, fps, edits, notes, src, offsets)
+    if not edits:
+        return code, []
+    for start, end, text in sorted(edits, reverse=True):
+        src = src[:start] + text.encode("utf-8") + src[end:]
+    new_code = src.decode("utf-8")
+    try:
+        compile(new_code, "<downscaled>", "exec")
+    except SyntaxError as e:
+        log.warning("Complexity downscale produced invalid code (%s); keeping the original", e)
+        return code, []
+    return new_code, notes
+
+def apply_complexity_budget(workdir: pathlib.Path, code: str) -> str:
+    """downscale_complexity() with every change written to the job log."""
+    if not COMPLEXITY_DOWNSCALE:
+        return code
+    code, notes = downscale_complexity(code)
+    for note in notes:
+        job_log(workdir, f"complexity budget ({MANIM_QUALITY_FLAG}): {note}")
+    if notes:
+        count("complexity_downscales")
+    return code
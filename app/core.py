@@ -0,0 +1,127 @@
+"""Configuration, logging, metrics and the in-process job registry shared by every module."""
+import os, pathlib, logging, threading, time
+from typing import Optional
+
+# ---------- LOGGING ----------
+logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+log = logging.getLogger("app")
+
+# ---------- CONFIG ----------
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-5")  # default model for JSON output
+BASE_DIR = pathlib.Path(__file__).parent
+RENDERS_DIR = pathlib.Path(os.getenv("RENDERS_DIR", str(BASE_DIR / "renders")))  # job dirs; may be a separate volume
+RENDERS_DIR.mkdir(parents=True, exist_ok=True)
+
+# The OpenAI client and the page templates are built on first use: importing openai and jinja2 is
+# a large share of this module's import time, which autoscaled instances pay on every cold start.
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """The shared OpenAI client (uses OPENAI_API_KEY from env)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+                _client = OpenAI()
+    return _client
+
+# Voice TTS model and voice name for narration (you can adjust via env vars)
+OPENAI_VOICE_MODEL = os.getenv("OPENAI_VOICE_MODEL", "tts-1")
+OPENAI_VOICE = os.getenv("OPENAI_VOICE", "alloy")
+
+# Manim render settings. RENDER_SECTION_WORKERS > 1 opts into section-parallel rendering
+# (one manim process per next_section() block, concatenated afterwards).
+MANIM_QUALITY_FLAG = os.getenv("MANIM_QUALITY_FLAG", "-ql")
+RENDER_SECTION_WORKERS = int(os.getenv("RENDER_SECTION_WORKERS", "0") or 0)
+# Finished silent renders are reused for identical code (see render cache); 0 disables the cache
+RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+# At most RENDER_CONCURRENCY manim processes run at once (default: one per CPU); a section-parallel
+# render counts once per section it runs at the same time. Waiting renders start
+# shortest-predicted-first; every second spent waiting takes RENDER_AGING_RATE seconds off a render's
+# predicted cost, so long renders are not starved.
+RENDER_CONCURRENCY = int(os.getenv("RENDER_CONCURRENCY", "0") or 0) or (os.cpu_count() or 2)
+RENDER_AGING_RATE = float(os.getenv("RENDER_AGING_RATE", "0.5"))
+# Render/repair loop: at most RENDER_MAX_ATTEMPTS renders per job within RENDER_BUDGET_SECONDS of wall clock
+RENDER_MAX_ATTEMPTS = int(os.getenv("RENDER_MAX_ATTEMPTS", "3"))
+RENDER_BUDGET_SECONDS = float(os.getenv("RENDER_BUDGET_SECONDS", "1500"))
+# Ask for SPECULATIVE_CANDIDATES payloads per job and render the first one whose dry run passes (1 disables);
+# the extra candidates may cost at most SPECULATIVE_MAX_EXTRA_TOKENS completion tokens per job
+SPECULATIVE_CANDIDATES = int(os.getenv("SPECULATIVE_CANDIDATES", "1"))
+SPECULATIVE_MAX_EXTRA_TOKENS = int(os.getenv("SPECULATIVE_MAX_EXTRA_TOKENS", "12000"))
+SPECULATIVE_DRY_RUN_TIMEOUT = float(os.getenv("SPECULATIVE_DRY_RUN_TIMEOUT", "120"))
+# System prompt: "full", "compact", or "split" (a random variant per job, for comparing them)
+PROMPT_VARIANT = os.getenv("PROMPT_VARIANT", "full")
+# Repairs: "patch" asks for line edits to a window of the failing code (falls back to "full": a whole new payload)
+REPAIR_MODE = os.getenv("REPAIR_MODE", "patch")
+# Local fixers tried per job before LLM repairs (they do not count toward RENDER_MAX_ATTEMPTS); 0 disables them
+LOCAL_FIX_MAX = int(os.getenv("LOCAL_FIX_MAX", "4"))
+# Stream the generate call and start captions/narration as soon as subtitle_cues is complete
+GENERATE_STREAMING = os.getenv("GENERATE_STREAMING", "1") == "1"
+# Per-render caps (0 disables one). RENDER_CGROUP_PARENT: a delegated cgroup v2 dir to create
+# per-render cgroups in; without it memory and CPU seconds are enforced with rlimits on Linux.
+RENDER_MEMORY_MAX_MB = int(os.getenv("RENDER_MEMORY_MAX_MB", "4096"))
+RENDER_CPU_QUOTA = float(os.getenv("RENDER_CPU_QUOTA", "0"))  # cores (cgroup cpu.max)
+RENDER_CPU_SECONDS = float(os.getenv("RENDER_CPU_SECONDS", "0"))  # total CPU time (RLIMIT_CPU)
+RENDER_PIDS_MAX = int(os.getenv("RENDER_PIDS_MAX", "256"))  # cgroup pids.max
+RENDER_CGROUP_PARENT = os.getenv("RENDER_CGROUP_PARENT", "")
+RENDER_ADDRESS_SPACE_FACTOR = float(os.getenv("RENDER_ADDRESS_SPACE_FACTOR", "2"))
+# Kill renders that show no progress for this long (0 disables); longer before the first frame
+RENDER_STALL_SECONDS = float(os.getenv("RENDER_STALL_SECONDS", "90"))
+RENDER_STALL_STARTUP_SECONDS = float(os.getenv("RENDER_STALL_STARTUP_SECONDS", "180"))
+# Toolchain probe (manim/ffmpeg/ffprobe/latex paths and versions): at startup, then every this many seconds (0: once)
+TOOLCHAIN_PROBE_INTERVAL = float(os.getenv("TOOLCHAIN_PROBE_INTERVAL", "300"))
+TOOLCHAIN_PROBE_TIMEOUT = float(os.getenv("TOOLCHAIN_PROBE_TIMEOUT", "30"))  # per version command
+# Clamp surface resolutions, curve sampling, stream-line density and camera rotation to a per-quality budget
+COMPLEXITY_DOWNSCALE = os.getenv("COMPLEXITY_DOWNSCALE", "1") == "1"
+
+# Retention of app/renders job dirs (0 disables a limit). The GC runs every RENDERS_GC_INTERVAL
+# seconds in the background; RENDERS_GC_DRY_RUN=1 only logs what it would delete.
+RENDERS_GC_INTERVAL = float(os.getenv("RENDERS_GC_INTERVAL", "3600"))
+RENDERS_GC_DRY_RUN = os.getenv("RENDERS_GC_DRY_RUN", "0") == "1"
+RENDERS_MAX_AGE_DAYS = float(os.getenv("RENDERS_MAX_AGE_DAYS", "0"))
+RENDERS_MAX_BYTES = int(os.getenv("RENDERS_MAX_BYTES", "0"))
+RENDERS_KEEP_LAST = int(os.getenv("RENDERS_KEEP_LAST", "20"))
+RENDERS_FAILED_TTL_HOURS = float(os.getenv("RENDERS_FAILED_TTL_HOURS", "24"))
+RENDERS_GC_GRACE_SECONDS = float(os.getenv("RENDERS_GC_GRACE_SECONDS", "3600"))  # recently touched dirs count as in-flight
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# ---------- Metrics ----------
+# Process-wide event counters (cache hits, fallbacks, ...), served as JSON by GET /metrics.
+METRICS = {}
+METRICS_LOCK = threading.Lock()
+
+def count(name: str, n: int = 1) -> None:
+    with METRICS_LOCK:
+        METRICS[name] = METRICS.get(name, 0) + n
+
+# ---------- Jobs ----------
+# In-process registry of jobs started by this server: job_id -> {"status", "result", ...}.
+# status is "running", "done" or "error"; result is the final /generate JSON body.
+JOBS = {}
+JOBS_LOCK = threading.Lock()
+
+def set_job(job_id: str, **fields) -> None:
+    with JOBS_LOCK:
+        JOBS.setdefault(job_id, {"jobId": job_id}).update(fields)
+
+def get_job(job_id: str) -> Optional[dict]:
+    with JOBS_LOCK:
+        job = JOBS.get(job_id)
+        return dict(job) if job is not None else None
+
+def job_log(workdir: pathlib.Path, message: str) -> None:
+    """Append a timestamped line to the job's job.log (and the server log)."""
+    log.info("[%s] %s", workdir.name, message)
+    try:
+        with open(workdir / "job.log", "a", encoding="utf-8") as f:
+            f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {message}\n")
+    except OSError as e:
+        log.warning("job.log write failed for %s: %s", workdir.name, e)
+
+# ---------- Files ----------
+def write_atomic(path: pathlib.Path, data: str) -> None:
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(data, encoding="utf-8")
+    os.replace(tmp, path)
@@ -0,0 +1,201 @@
+"""
+Local stand-in for the OpenAI endpoints the app uses, for load tests without API credits.
+
+    python -m app.fake_openai --port 8001 --chat-latency 2 --speech-latency 0.3 --chat-error-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=fake uvicorn app.main:app
+
+POST /v1/chat/completions returns a canned ManimPayload in JSON mode (rotating through the
+recorded jobs in app/renders, or the payloads in --payloads) and a canned critique otherwise;
+with n > 1 it returns n choices. With stream=true the answer is sent as server-sent events: the
+latency is spread over the deltas, and the usage arrives in a last chunk.
+POST /v1/audio/speech returns a silent mp3 whose length follows the input text.
+Latency is drawn uniformly from latency +/- jitter; errors are returned as OpenAI-style 500s or
+429s at the configured rate (the OpenAI client retries those twice by default).
+"""
+import os, json, time, random, asyncio, argparse, itertools, pathlib, threading
+from typing import List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+# ---------- CONFIG ----------
+FAKE_CHAT_LATENCY = float(os.getenv("FAKE_CHAT_LATENCY", "1.0"))
+FAKE_SPEECH_LATENCY = float(os.getenv("FAKE_SPEECH_LATENCY", "0.2"))
+FAKE_LATENCY_JITTER = float(os.getenv("FAKE_LATENCY_JITTER", "0.25"))  # fraction of the latency
+FAKE_CHAT_ERROR_RATE = float(os.getenv("FAKE_CHAT_ERROR_RATE", "0"))
+FAKE_SPEECH_ERROR_RATE = float(os.getenv("FAKE_SPEECH_ERROR_RATE", "0"))
+FAKE_RATE_LIMIT_SHARE = float(os.getenv("FAKE_RATE_LIMIT_SHARE", "0.5"))  # share of errors that are 429s
+FAKE_PAYLOADS = os.getenv("FAKE_PAYLOADS", "")  # JSON file: list of ManimPayload dicts
+FAKE_SEED = os.getenv("FAKE_SEED")
+FAKE_STREAM_CHUNK = int(os.getenv("FAKE_STREAM_CHUNK", "40"))  # characters per streamed delta
+
+CRITIQUE_TEXT = "The scene is compatible with Manim Community Edition. No changes are needed."
+
+BUILTIN_PAYLOAD = {
+    "file_name": "circle_area.py",
+    "scene_name": "CircleArea",
+    "subtitle_cues": [
+        {"start": 0.0, "end": 3.0, "text": "A circle of radius r."},
+        {"start": 3.0, "end": 6.0, "text": "Its area is pi r squared."},
+    ],
+    "code": (
+        "from manim import *\n\n"
+        "class CircleArea(Scene):\n"
+        "    def construct(self):\n"
+        "        c = Circle(radius=2)\n"
+        "        self.play(Create(c), run_time=3)\n"
+        "        self.play(c.animate.set_fill(BLUE, opacity=0.5), run_time=3)\n"
+    ),
+}
+
+app = FastAPI(title="fake-openai")
+_rng = random.Random(int(FAKE_SEED) if FAKE_SEED else None)
+_stats = {"chat": 0, "speech": 0, "errors": 0}
+_stats_lock = threading.Lock()
+
+# ---------- Payloads ----------
+def load_payloads(path: str = "") -> List[dict]:
+    """Canned ManimPayloads: --payloads file, else the recorded jobs in app/renders, else a builtin scene."""
+    if path:
+        data = json.loads(pathlib.Path(path).read_text(encoding="utf-8"))
+        return data if isinstance(data, list) else [data]
+    payloads = []
+    try:
+        from app.bench import load_corpus  # reads scene + captions of every recorded job
+        from app.core import RENDERS_DIR
+        for p in load_corpus(RENDERS_DIR):
+            try:
+                compile(p["code"], p["file_name"], "exec")
+            except SyntaxError:
+                continue  # a broken recording would turn every load-test job into a repair job
+            payloads.append({
+                "file_name": p["file_name"],
+                "scene_name": p["scene_name"],
+                "subtitle_cues": [c.model_dump() for c in p["cues"]],
+                "code": p["code"],
+            })
+    except Exception:
+        payloads = []
+    return payloads or [BUILTIN_PAYLOAD]
+
+_payloads = itertools.cycle(load_payloads(FAKE_PAYLOADS))
+_payloads_lock = threading.Lock()
+
+def next_payload() -> dict:
+    with _payloads_lock:
+        return next(_payloads)
+
+# ---------- Audio ----------
+# One MPEG-1 Layer III frame, 128 kbit/s, 44.1 kHz, mono, no CRC: 1152 samples in 417 bytes.
+# All-zero side info and main data decode as silence, so no encoder is needed.
+MP3_FRAME = bytes([0xFF, 0xFB, 0x90, 0xC0]) + bytes(413)
+MP3_FRAME_SECONDS = 1152 / 44100
+
+def silent_mp3(seconds: float) -> bytes:
+    return MP3_FRAME * max(1, int(seconds / MP3_FRAME_SECONDS))
+
+# ---------- Behaviour ----------
+async def _delay(latency: float):
+    if latency > 0:
+        await asyncio.sleep(max(0.0, latency * (1 + _rng.uniform(-FAKE_LATENCY_JITTER, FAKE_LATENCY_JITTER))))
+
+def _maybe_error(rate: float) -> Optional[JSONResponse]:
+    if rate <= 0 or _rng.random() >= rate:
+        return None
+    with _stats_lock:
+        _stats["errors"] += 1
+    if _rng.random() < FAKE_RATE_LIMIT_SHARE:
+        return JSONResponse({"error": {"message": "Rate limit reached (fake)", "type": "requests", "code": "rate_limit_exceeded"}},
+                            status_code=429, headers={"retry-after": "1"})
+    return JSONResponse({"error": {"message": "The server had an error (fake)", "type": "server_error", "code": None}},
+                        status_code=500)
+
+def _count(kind: str):
+    with _stats_lock:
+        _stats[kind] += 1
+
+# ---------- Endpoints ----------
+async def _stream_chunks(body: dict, content: str, usage: dict):
+    """Chat completion chunks for content, FAKE_STREAM_CHUNK characters at a time."""
+    base = {"id": f"chatcmpl-fake{_rng.getrandbits(32):08x}", "object": "chat.completion.chunk",
+            "created": int(time.time()), "model": body.get("model", "fake")}
+    pieces = [content[i:i + FAKE_STREAM_CHUNK] for i in range(0, len(content), FAKE_STREAM_CHUNK)] or [""]
+    for i, piece in enumerate(pieces):
+        delta = {"role": "assistant", "content": piece} if i == 0 else {"content": piece}
+        yield f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]})}\n\n"
+        await _delay(FAKE_CHAT_LATENCY / len(pieces))
+    yield f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n"
+    if (body.get("stream_options") or {}).get("include_usage"):
+        yield f"data: {json.dumps({**base, 'choices': [], 'usage': usage})}\n\n"
+    yield "data: [DONE]\n\n"
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    _count("chat")
+    await _delay(FAKE_CHAT_LATENCY * (0.1 if body.get("stream") else 1))  # streamed: time to first token
+    err = _maybe_error(FAKE_CHAT_ERROR_RATE)
+    if err is not None:
+        return err
+    json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+    contents = [json.dumps(next_payload()) if json_mode else CRITIQUE_TEXT for _ in range(max(1, int(body.get("n") or 1)))]
+    prompt_chars = sum(len(str(m.get("content", ""))) for m in body.get("messages", []))
+    usage = {"prompt_tokens": prompt_chars // 4, "completion_tokens": sum(len(c) for c in contents) // 4}
+    usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+    if body.get("stream"):
+        return StreamingResponse(_stream_chunks(body, contents[0], usage), media_type="text/event-stream")
+    return {
+        "id": f"chatcmpl-fake{_rng.getrandbits(32):08x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{"index": i, "message": {"role": "assistant", "content": c}, "finish_reason": "stop"}
+                    for i, c in enumerate(contents)],
+        "usage": usage,
+    }
+
+@app.post("/v1/audio/speech")
+async def audio_speech(request: Request):
+    body = await request.json()
+    _count("speech")
+    await _delay(FAKE_SPEECH_LATENCY)
+    err = _maybe_error(FAKE_SPEECH_ERROR_RATE)
+    if err is not None:
+        return err
+    # Roughly 15 characters per second of speech
+    return Response(silent_mp3(max(0.5, len(body.get("input", "")) / 15)), media_type="audio/mpeg")
+
+@app.get("/stats")
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+def main_cli(argv=None):
+    global FAKE_CHAT_LATENCY, FAKE_SPEECH_LATENCY, FAKE_LATENCY_JITTER, FAKE_CHAT_ERROR_RATE
+    global FAKE_SPEECH_ERROR_RATE, FAKE_RATE_LIMIT_SHARE, _payloads
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--chat-latency", type=float, default=FAKE_CHAT_LATENCY)
+    parser.add_argument("--speech-latency", type=float, default=FAKE_SPEECH_LATENCY)
+    parser.add_argument("--jitter", type=float, default=FAKE_LATENCY_JITTER)
+    parser.add_argument("--chat-error-rate", type=float, default=FAKE_CHAT_ERROR_RATE)
+    parser.add_argument("--speech-error-rate", type=float, default=FAKE_SPEECH_ERROR_RATE)
+    parser.add_argument("--rate-limit-share", type=float, default=FAKE_RATE_LIMIT_SHARE)
+    parser.add_argument("--payloads", default=FAKE_PAYLOADS)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    FAKE_CHAT_LATENCY, FAKE_SPEECH_LATENCY, FAKE_LATENCY_JITTER = args.chat_latency, args.speech_latency, args.jitter
+    FAKE_CHAT_ERROR_RATE, FAKE_SPEECH_ERROR_RATE = args.chat_error_rate, args.speech_error_rate
+    FAKE_RATE_LIMIT_SHARE = args.rate_limit_share
+    if args.payloads:
+        _payloads = itertools.cycle(load_payloads(args.payloads))
+    if args.seed is not None:
+        _rng.seed(args.seed)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main_cli()
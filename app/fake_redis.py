@@ -0,0 +1,374 @@
+"""
+Local stand-in for the Redis command subset app/jobqueue.py uses, for tests without a Redis server.
+
+    python -m app.fake_redis --port 6379
+    JOB_QUEUE=1 QUEUE_URL=redis://127.0.0.1:6379/0 uvicorn app.main:app
+
+Speaks RESP2 over TCP, so the real redis client talks to it unchanged. Supported: PING, ECHO,
+SELECT, CLIENT, FLUSHALL/FLUSHDB, DEL, EXISTS, EXPIRE, TTL, the hash commands HSET, HGET,
+HMGET, HGETALL, HINCRBY and HDEL, the sorted-set commands ZADD, ZREM, ZCARD, ZRANGE,
+ZRANGEBYSCORE (with LIMIT), ZREMRANGEBYSCORE, ZRANK and ZSCORE, the list commands RPUSH, LPOP
+(with a count), LLEN and LRANGE, and optimistic transactions with WATCH, UNWATCH, MULTI, EXEC
+and DISCARD. One lock serializes commands, like Redis's single thread. Keys live in memory and
+are expired lazily; there is a single database, whatever SELECT asks for.
+"""
+import argparse, socketserver, threading, time
+from typing import List, Optional
+
+# ---------- Keyspace ----------
+class Error(Exception):
+    """Sent to the client as a -ERR reply."""
+
+class Simple(str):
+    """Sent as a +simple string instead of a bulk string."""
+
+OK = Simple("OK")
+QUEUED = Simple("QUEUED")
+
+def _score(arg: str, bound: bool = False):
+    """A score; as a range bound, (score for exclusive. Returns (value, exclusive)."""
+    exclusive = bound and arg.startswith("(")
+    text = arg[1:] if exclusive else arg
+    try:
+        value = {"-inf": float("-inf"), "+inf": float("inf"), "inf": float("inf")}.get(text.lower())
+        value = float(text) if value is None else value
+    except ValueError:
+        raise Error("min or max is not a float" if bound else "value is not a valid float")
+    return value, exclusive
+
+def _in_range(score: float, lo, hi) -> bool:
+    (lo_v, lo_x), (hi_v, hi_x) = lo, hi
+    return (score > lo_v if lo_x else score >= lo_v) and (score < hi_v if hi_x else score <= hi_v)
+
+def _fmt(score: float) -> str:
+    return str(int(score)) if score.is_integer() else repr(score)
+
+class FakeRedis:
+    """The keyspace: key -> (type, value), with lazy expiry and a version per key for WATCH."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.data = {}
+        self.expires = {}  # key -> time.monotonic() deadline
+        self.versions = {}
+
+    def touch(self, key: str):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def version(self, key: str) -> int:
+        self.get(key, None)  # an expiry counts as a change
+        return self.versions.get(key, 0)
+
+    def get(self, key: str, kind: Optional[str], create: bool = False):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.delete(key)
+        entry = self.data.get(key)
+        if entry is None:
+            if not create:
+                return None
+            entry = self.data[key] = (kind, [] if kind == "list" else {})
+        if kind is not None and entry[0] != kind:
+            raise Error("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return entry[1]
+
+    def delete(self, key: str) -> bool:
+        self.expires.pop(key, None)
+        if self.data.pop(key, None) is None:
+            return False
+        self.touch(key)
+        return True
+
+    def written(self, key: str):
+        """After a write: bump the version, and drop a container the write left empty."""
+        self.touch(key)
+        entry = self.data.get(key)
+        if entry is not None and not entry[1]:
+            self.data.pop(key)
+            self.expires.pop(key, None)
+
+    # --- commands; each takes the arguments after the command name ---
+    def cmd_ping(self, *args):
+        return args[0] if args else Simple("PONG")
+
+    def cmd_echo(self, msg):
+        return msg
+
+    def cmd_select(self, db):
+        return OK
+
+    def cmd_client(self, *args):
+        return OK
+
+    def cmd_flushall(self, *args):
+        for key in list(self.data):
+            self.delete(key)
+        return OK
+
+    cmd_flushdb = cmd_flushall
+
+    def cmd_del(self, *keys):
+        return sum(self.get(k, None) is not None and self.delete(k) for k in keys)
+
+    def cmd_exists(self, *keys):
+        return sum(self.get(k, None) is not None for k in keys)
+
+    def cmd_expire(self, key, seconds):
+        if self.get(key, None) is None:
+            return 0
+        self.expires[key] = time.monotonic() + int(seconds)
+        self.touch(key)
+        return 1
+
+    def cmd_ttl(self, key):
+        if self.get(key, None) is None:
+            return -2
+        deadline = self.expires.get(key)
+        return -1 if deadline is None else max(0, round(deadline - time.monotonic()))
+
+    def cmd_hset(self, key, *pairs):
+        if not pairs or len(pairs) % 2:
+            raise Error("wrong number of arguments for 'hset' command")
+        h = self.get(key, "hash", create=True)
+        added = 0
+        for field, value in zip(pairs[::2], pairs[1::2]):
+            added += field not in h
+            h[field] = value
+        self.written(key)
+        return added
+
+    def cmd_hget(self, key, field):
+        return (self.get(key, "hash") or {}).get(field)
+
+    def cmd_hmget(self, key, *fields):
+        h = self.get(key, "hash") or {}
+        return [h.get(f) for f in fields]
+
+    def cmd_hgetall(self, key):
+        return [x for kv in (self.get(key, "hash") or {}).items() for x in kv]
+
+    def cmd_hincrby(self, key, field, amount):
+        h = self.get(key, "hash", create=True)
+        try:
+            value = int(h.get(field, "0")) + int(amount)
+        except ValueError:
+            raise Error("hash value is not an integer")
+        h[field] = str(value)
+        self.written(key)
+        return value
+
+    def cmd_hdel(self, key, *fields):
+        h = self.get(key, "hash") or {}
+        removed = sum(h.pop(f, None) is not None for f in fields)
+        if removed:
+            self.written(key)
+        return removed
+
+    def cmd_zadd(self, key, *pairs):
+        if not pairs or len(pairs) % 2:
+            raise Error("syntax error")
+        scores = [_score(s)[0] for s in pairs[::2]]
+        z = self.get(key, "zset", create=True)
+        added = 0
+        for score, member in zip(scores, pairs[1::2]):
+            added += member not in z
+            z[member] = score
+        self.written(key)
+        return added
+
+    def cmd_zrem(self, key, *members):
+        z = self.get(key, "zset") or {}
+        removed = sum(z.pop(m, None) is not None for m in members)
+        if removed:
+            self.written(key)
+        return removed
+
+    def cmd_zcard(self, key):
+        return len(self.get(key, "zset") or {})
+
+    def _sorted(self, key) -> List[tuple]:
+        return sorted(((s, m) for m, s in (self.get(key, "zset") or {}).items()))
+
+    def _reply(self, items: List[tuple], withscores: bool) -> list:
+        return [x for s, m in items for x in ((m, _fmt(s)) if withscores else (m,))]
+
+    def cmd_zrange(self, key, start, stop, *opts):
+        items = self._sorted(key)
+        start, stop, n = int(start), int(stop), len(items)
+        start, stop = start + n if start < 0 else start, stop + n if stop < 0 else stop
+        return self._reply(items[max(0, start):stop + 1], "WITHSCORES" in (o.upper() for o in opts))
+
+    def cmd_zrangebyscore(self, key, lo, hi, *opts):
+        lo, hi = _score(lo, bound=True), _score(hi, bound=True)
+        items = [(s, m) for s, m in self._sorted(key) if _in_range(s, lo, hi)]
+        upper = [o.upper() for o in opts]
+        if "LIMIT" in upper:
+            i = upper.index("LIMIT")
+            offset, limit = int(opts[i + 1]), int(opts[i + 2])
+            items = items[offset:] if limit < 0 else items[offset:offset + limit]
+        return self._reply(items, "WITHSCORES" in upper)
+
+    def cmd_zremrangebyscore(self, key, lo, hi):
+        lo, hi = _score(lo, bound=True), _score(hi, bound=True)
+        z = self.get(key, "zset") or {}
+        gone = [m for m, s in z.items() if _in_range(s, lo, hi)]
+        for m in gone:
+            del z[m]
+        if gone:
+            self.written(key)
+        return len(gone)
+
+    def cmd_zrank(self, key, member):
+        members = [m for _, m in self._sorted(key)]
+        return members.index(member) if member in members else None
+
+    def cmd_zscore(self, key, member):
+        score = (self.get(key, "zset") or {}).get(member)
+        return None if score is None else _fmt(score)
+
+    def cmd_rpush(self, key, *values):
+        lst = self.get(key, "list", create=True)
+        lst.extend(values)
+        self.written(key)
+        return len(lst)
+
+    def cmd_lpop(self, key, count=None):
+        lst = self.get(key, "list")
+        if not lst:
+            return None
+        n = 1 if count is None else int(count)
+        popped, lst[:n] = lst[:n], []
+        self.written(key)
+        return popped[0] if count is None else popped
+
+    def cmd_llen(self, key):
+        return len(self.get(key, "list") or [])
+
+    def cmd_lrange(self, key, start, stop):
+        lst = self.get(key, "list") or []
+        start, stop, n = int(start), int(stop), len(lst)
+        start, stop = start + n if start < 0 else start, stop + n if stop < 0 else stop
+        return lst[max(0, start):stop + 1]
+
+    def call(self, args: List[str]):
+        fn = getattr(self, f"cmd_{args[0].lower()}", None)
+        if fn is None:
+            raise Error(f"unknown command '{args[0]}'")
+        try:
+            return fn(*args[1:])
+        except TypeError:
+            raise Error(f"wrong number of arguments for '{args[0].lower()}' command")
+
+# ---------- Protocol ----------
+def _encode(value) -> bytes:
+    if isinstance(value, Error):
+        return f"-ERR {value}\r\n".encode() if not str(value).startswith("WRONGTYPE") else f"-{value}\r\n".encode()
+    if isinstance(value, Simple):
+        return f"+{value}\r\n".encode()
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int):
+        return f":{value}\r\n".encode()
+    if isinstance(value, list):
+        return f"*{len(value)}\r\n".encode() + b"".join(_encode(v) for v in value)
+    data = str(value).encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+class _Handler(socketserver.StreamRequestHandler):
+    """One client connection: its WATCHed key versions and its MULTI queue."""
+
+    def read_command(self) -> Optional[List[str]]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):  # inline command (e.g. typed into telnet)
+            return line.decode("utf-8").split()
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2].decode("utf-8"))
+        return args
+
+    def handle(self):
+        store: FakeRedis = self.server.store
+        watched, queued = {}, None
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            if not args:
+                continue
+            name = args[0].upper()
+            with store.lock:
+                if name == "MULTI":
+                    reply = Error("MULTI calls can not be nested") if queued is not None else OK
+                    queued = [] if queued is None else queued
+                elif name == "EXEC":
+                    if queued is None:
+                        reply = Error("EXEC without MULTI")
+                    elif any(store.version(k) != v for k, v in watched.items()):
+                        reply = _NULL_ARRAY
+                    else:
+                        reply = []
+                        for cmd in queued:
+                            try:
+                                reply.append(store.call(cmd))
+                            except Error as e:
+                                reply.append(e)
+                    watched, queued = {}, None
+                elif name == "DISCARD":
+                    reply = Error("DISCARD without MULTI") if queued is None else OK
+                    watched, queued = {}, None
+                elif name == "WATCH":
+                    if queued is not None:
+                        reply = Error("WATCH inside MULTI is not allowed")
+                    else:
+                        for k in args[1:]:
+                            watched.setdefault(k, store.version(k))
+                        reply = OK
+                elif name == "UNWATCH":
+                    watched = {}
+                    reply = OK
+                elif queued is not None:
+                    queued.append(args)
+                    reply = QUEUED
+                else:
+                    try:
+                        reply = store.call(args)
+                    except Error as e:
+                        reply = e
+            self.wfile.write(b"*-1\r\n" if reply is _NULL_ARRAY else _encode(reply))
+            self.wfile.flush()
+
+_NULL_ARRAY = object()  # EXEC aborted by a WATCHed key
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    """A fake Redis on (host, port); port 0 picks a free one (see server_address)."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=("127.0.0.1", 0)):
+        super().__init__(address, _Handler)
+        self.store = FakeRedis()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args(argv)
+    server = FakeRedisServer((args.host, args.port))
+    print(f"[fake-redis] listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,229 @@
+"""
+Local stand-in for the S3 API subset app/store.py's S3Store uses, for tests without a bucket.
+
+    python -m app.fake_s3 --port 9000 --dir /tmp/fake-s3
+    ARTIFACT_STORE=s3 S3_BUCKET=renders S3_ENDPOINT_URL=http://127.0.0.1:9000 \
+        AWS_ACCESS_KEY_ID=fake AWS_SECRET_ACCESS_KEY=fake uvicorn app.main:app
+
+Path-style requests only (/<bucket>/<key>). Supported: PutObject, the multipart upload calls
+(create, upload part, complete, abort), GetObject with a Range header, HeadObject,
+ListObjectsV2 (prefix and continuation token only), DeleteObject and DeleteObjects. Buckets spring into existence on first write. Signatures are not checked, so
+presigned URLs work as plain GETs. Bodies sent with aws-chunked encoding (recent botocore
+versions do this for checksums) are decoded. Objects are files under --dir.
+"""
+import os, re, json, time, uuid, hashlib, argparse, pathlib, threading
+from typing import Optional, Tuple
+from xml.sax.saxutils import escape, unescape
+
+from fastapi import FastAPI, Request
+from fastapi.responses import Response
+
+# ---------- CONFIG ----------
+FAKE_S3_DIR = pathlib.Path(os.getenv("FAKE_S3_DIR", "/tmp/fake-s3"))
+
+app = FastAPI(title="fake-s3")
+_uploads = {}  # upload id -> {part number: path}
+_uploads_lock = threading.Lock()
+
+# ---------- Storage ----------
+def _object_path(bucket: str, key: str) -> pathlib.Path:
+    path = (FAKE_S3_DIR / bucket / key).resolve()
+    if not path.is_relative_to(FAKE_S3_DIR.resolve()):
+        raise ValueError("key escapes the store")
+    return path
+
+def _meta_path(path: pathlib.Path) -> pathlib.Path:
+    return path.with_name(f".{path.name}.meta.json")
+
+def _write_object(path: pathlib.Path, data: bytes, content_type: str, cache_control: Optional[str], parts: int = 0) -> str:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    etag = hashlib.md5(data).hexdigest() + (f"-{parts}" if parts else "")  # S3 marks multipart ETags with the part count
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    _meta_path(path).write_text(json.dumps({"etag": etag, "contentType": content_type, "cacheControl": cache_control}))
+    return etag
+
+def _decode_aws_chunked(data: bytes) -> bytes:
+    """Payload of an aws-chunked body: <hex size>[;chunk-signature=...]\\r\\n<data>\\r\\n ... 0\\r\\n<trailers>."""
+    out, i = bytearray(), 0
+    while True:
+        j = data.index(b"\r\n", i)
+        size = int(data[i:j].split(b";")[0], 16)
+        i = j + 2
+        if size == 0:
+            return bytes(out)
+        out += data[i:i + size]
+        i += size + 2
+
+async def _body(request: Request) -> bytes:
+    data = await request.body()
+    if "aws-chunked" in request.headers.get("content-encoding", "") \
+            or request.headers.get("x-amz-content-sha256", "").startswith("STREAMING-"):
+        data = _decode_aws_chunked(data)
+    return data
+
+def _error(status: int, code: str, message: str) -> Response:
+    xml = f'<?xml version="1.0" encoding="UTF-8"?><Error><Code>{code}</Code><Message>{escape(message)}</Message></Error>'
+    return Response(xml, status_code=status, media_type="application/xml")
+
+def _xml(body: str) -> Response:
+    return Response(f'<?xml version="1.0" encoding="UTF-8"?>{body}', media_type="application/xml")
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """(first, last) byte of a single bytes= range, or None when it cannot be satisfied."""
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first == "":
+            n = int(last)
+            return (max(0, size - n), size - 1) if n > 0 and size else None
+        first_i = int(first)
+        last_i = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    return (first_i, last_i) if first_i <= last_i and first_i < size else None
+
+def _list_keys(bucket: str, prefix: str):
+    """Sorted (key, path) of a bucket's objects under prefix (meta and temp files are dotfiles)."""
+    root = FAKE_S3_DIR / bucket
+    if not root.is_dir():
+        return []
+    keys = ((p.relative_to(root).as_posix(), p) for p in root.rglob("*") if p.is_file() and not p.name.startswith("."))
+    return sorted((k, p) for k, p in keys if k.startswith(prefix))
+
+# ---------- Endpoints ----------
+@app.put("/{bucket}")
+async def create_bucket(bucket: str):
+    (FAKE_S3_DIR / bucket).mkdir(parents=True, exist_ok=True)
+    return Response(status_code=200)
+
+@app.get("/{bucket}")
+def list_objects(bucket: str, request: Request):
+    """ListObjectsV2: up to max-keys keys after the continuation token, in key order."""
+    prefix = request.query_params.get("prefix", "")
+    after = request.query_params.get("continuation-token") or request.query_params.get("start-after", "")
+    max_keys = int(request.query_params.get("max-keys", "1000"))
+    keys = [(k, p) for k, p in _list_keys(bucket, prefix) if k > after]
+    page, truncated = keys[:max_keys], len(keys) > max_keys
+    contents = "".join(
+        f"<Contents><Key>{escape(k)}</Key><Size>{p.stat().st_size}</Size><LastModified>"
+        f"{time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(p.stat().st_mtime))}</LastModified></Contents>"
+        for k, p in page)
+    token = f"<NextContinuationToken>{escape(page[-1][0])}</NextContinuationToken>" if truncated else ""
+    return _xml(f"<ListBucketResult><Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix>"
+                f"<KeyCount>{len(page)}</KeyCount><MaxKeys>{max_keys}</MaxKeys>"
+                f"<IsTruncated>{'true' if truncated else 'false'}</IsTruncated>{contents}{token}</ListBucketResult>")
+
+@app.post("/{bucket}")
+async def delete_objects(bucket: str, request: Request):
+    """DeleteObjects (?delete): every listed key is removed; missing keys count as deleted, like S3."""
+    if "delete" not in request.query_params:
+        return _error(400, "InvalidRequest", "Only DeleteObjects is supported here.")
+    body = (await _body(request)).decode()
+    keys = [unescape(k, {"&quot;": '"', "&apos;": "'"}) for k in re.findall(r"<Key>(.*?)</Key>", body, re.S)]
+    for key in keys:
+        path = _object_path(bucket, key)
+        path.unlink(missing_ok=True)
+        _meta_path(path).unlink(missing_ok=True)
+    quiet = re.search(r"<Quiet>\s*true\s*</Quiet>", body, re.I) is not None
+    deleted = "" if quiet else "".join(f"<Deleted><Key>{escape(k)}</Key></Deleted>" for k in keys)
+    return _xml(f"<DeleteResult>{deleted}</DeleteResult>")
+
+@app.put("/{bucket}/{key:path}")
+async def put_object(bucket: str, key: str, request: Request):
+    data = await _body(request)
+    upload_id, part = request.query_params.get("uploadId"), request.query_params.get("partNumber")
+    if upload_id and part:
+        with _uploads_lock:
+            parts = _uploads.get(upload_id)
+        if parts is None:
+            return _error(404, "NoSuchUpload", "The specified upload does not exist.")
+        part_path = FAKE_S3_DIR / ".uploads" / upload_id / f"{int(part):05d}"
+        part_path.parent.mkdir(parents=True, exist_ok=True)
+        part_path.write_bytes(data)
+        with _uploads_lock:
+            parts[int(part)] = part_path
+        return Response(status_code=200, headers={"ETag": f'"{hashlib.md5(data).hexdigest()}"'})
+    etag = _write_object(_object_path(bucket, key), data, request.headers.get("content-type", "application/octet-stream"),
+                         request.headers.get("cache-control"))
+    return Response(status_code=200, headers={"ETag": f'"{etag}"'})
+
+@app.post("/{bucket}/{key:path}")
+async def multipart(bucket: str, key: str, request: Request):
+    if "uploads" in request.query_params:
+        upload_id = uuid.uuid4().hex
+        with _uploads_lock:
+            _uploads[upload_id] = {"contentType": request.headers.get("content-type", "application/octet-stream"),
+                                   "cacheControl": request.headers.get("cache-control")}
+        return _xml(f"<InitiateMultipartUploadResult><Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key>"
+                    f"<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>")
+    upload_id = request.query_params.get("uploadId")
+    with _uploads_lock:
+        parts = _uploads.pop(upload_id, None)
+    if parts is None:
+        return _error(404, "NoSuchUpload", "The specified upload does not exist.")
+    meta = {k: parts.pop(k) for k in ("contentType", "cacheControl")}
+    data = b"".join(parts[n].read_bytes() for n in sorted(parts))
+    etag = _write_object(_object_path(bucket, key), data, meta["contentType"], meta["cacheControl"], len(parts))
+    for p in parts.values():
+        p.unlink(missing_ok=True)
+    return _xml(f"<CompleteMultipartUploadResult><Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key>"
+                f'<ETag>"{etag}"</ETag></CompleteMultipartUploadResult>')
+
+@app.api_route("/{bucket}/{key:path}", methods=["GET", "HEAD"])
+def get_object(bucket: str, key: str, request: Request):
+    path = _object_path(bucket, key)
+    if not path.is_file():
+        return _error(404, "NoSuchKey", "The specified key does not exist.")
+    meta = json.loads(_meta_path(path).read_text()) if _meta_path(path).is_file() else {}
+    size = path.stat().st_size
+    headers = {"ETag": f'"{meta.get("etag", "")}"', "Accept-Ranges": "bytes"}
+    if meta.get("cacheControl"):
+        headers["Cache-Control"] = meta["cacheControl"]
+    first, last, status = 0, size - 1, 200
+    if request.headers.get("range"):
+        rng = _parse_range(request.headers["range"], size)
+        if rng is None:
+            return _error(416, "InvalidRange", "The requested range is not satisfiable")
+        (first, last), status = rng, 206
+        headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+    headers["Content-Length"] = str(max(0, last - first + 1))
+    media_type = meta.get("contentType", "application/octet-stream")
+    if request.method == "HEAD":
+        return Response(status_code=status, headers=headers, media_type=media_type)
+    with open(path, "rb") as f:
+        f.seek(first)
+        data = f.read(max(0, last - first + 1))
+    return Response(data, status_code=status, headers=headers, media_type=media_type)
+
+@app.delete("/{bucket}/{key:path}")
+def delete_object(bucket: str, key: str, request: Request):
+    upload_id = request.query_params.get("uploadId")
+    if upload_id:
+        with _uploads_lock:
+            _uploads.pop(upload_id, None)
+        return Response(status_code=204)
+    path = _object_path(bucket, key)
+    path.unlink(missing_ok=True)
+    _meta_path(path).unlink(missing_ok=True)
+    return Response(status_code=204)
+
+def main_cli(argv=None):
+    global FAKE_S3_DIR
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--dir", default=str(FAKE_S3_DIR))
+    args = parser.parse_args(argv)
+
+    FAKE_S3_DIR = pathlib.Path(args.dir)
+    FAKE_S3_DIR.mkdir(parents=True, exist_ok=True)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main_cli()
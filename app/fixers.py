@@ -0,0 +1,323 @@
+"""Local fixers: mechanical rewrites of code whose render failed, tried before an LLM repair."""
+import textwrap, pathlib, ast, re
+from typing import List, Optional, Tuple
+
+from app.core import log
+from app.sanitize import STRING_LITERAL, STRING_TOKEN
+from app.scheduler import _call_name
+from app.complexity import _fmt_number, _keyword, _number
+
+# ---------- Local fixers ----------
+# Many render failures are mechanical and recur across jobs: strings broken over two lines,
+# literal "\n" escapes, CE-renamed keywords and names, run_time=0, self.camera.frame in a
+# ThreeDScene, plain-string colors, 2D points. classify_traceback() maps the output of a failed
+# attempt to one of these classes (or "latex" / "unrecognized"), and LOCAL_FIXERS rewrites the
+# code that ran in milliseconds; render_with_repairs() tries that before spending an LLM call.
+# Fixers look at the lines the traceback points at where they can, return None when they find
+# nothing to change, and never run twice for the same class and line in one job. Per class,
+# local_fix_<class>_applied / _resolved / _missed counters show how often they help.
+TRACEBACK_CLASSES = [  # first match wins
+    ("unterminated_string", re.compile(r"SyntaxError: (?:unterminated (?:triple-quoted )?string literal|EOL while scanning string literal)")),
+    ("literal_newline", re.compile(r"SyntaxError: unexpected character after line continuation character")),
+    ("unexpected_indent", re.compile(r"IndentationError: unexpected indent")),
+    ("unexpected_kwarg", re.compile(r"TypeError: .*got an unexpected keyword argument '(?P<name>\w+)'")),
+    ("zero_run_time", re.compile(r"has a (?:total )?(?:run_time|duration) of -?0(?:\.0+)? <= 0")),
+    ("camera_frame", re.compile(r"AttributeError: '\w*Camera' object has no attribute 'frame'")),
+    ("string_color", re.compile(r"AttributeError: 'str' object has no attribute '(?:interpolate|_internal_space|to_rgb|to_rgba|to_hex)'")),
+    ("point_2d", re.compile(r"operands could not be broadcast together with shapes \(\d+,\s*3\)\s*\(2,\)")),
+    ("renamed_name", re.compile(r"NameError: name '(?P<name>ShowCreation|TextMobject|TexMobject)' is not defined")),
+    ("latex", re.compile(r"latex error|LaTeX compilation error", re.I)),
+]
+RANGE_KEYWORDS = {"u": "u_range", "v": "v_range", "t": "t_range", "x": "x_range", "y": "y_range"}
+RENAMED_NAMES = {"ShowCreation": "Create", "TextMobject": "Tex", "TexMobject": "MathTex"}
+POINT_CALLS = {"shift", "move_to", "Dot", "Line", "Arrow", "DashedLine", "DoubleArrow"}
+POINT_KEYWORDS = {"point", "start", "end"}
+MIN_RUN_TIME = 0.2
+
+def _error_snippet(output: str) -> str:
+    tb_index = output.rfind("Traceback")
+    if tb_index != -1:
+        return output[tb_index:]
+    return output[-2000:]
+
+def error_lines(output: str, file_name: str) -> List[int]:
+    """Line numbers in file_name that a traceback (plain or rich-formatted) points at, innermost last."""
+    name = re.escape(pathlib.Path(file_name).name)
+    pattern = re.compile(rf'{name}", line (\d+)|{name}:(\d+)')
+    return [int(a or b) for a, b in pattern.findall(output)]
+
+def classify_traceback(output: str, file_name: str) -> Tuple[str, dict]:
+    """(failure class, details: the traceback's innermost line in file_name, matched names) of a failed attempt."""
+    text = _error_snippet(output)
+    lines = error_lines(text, file_name)
+    info = {"line": lines[-1] if lines else None}
+    for name, pattern in TRACEBACK_CLASSES:
+        m = pattern.search(text)
+        if m:
+            info.update(m.groupdict())
+            return name, info
+    return "unrecognized", info
+
+class _Source:
+    """Byte-offset edits on code located through its ast (ast columns are UTF-8 byte offsets)."""
+
+    def __init__(self, code: str):
+        self.src = code.encode("utf-8")
+        self.offsets = [0]
+        for line in self.src.splitlines(keepends=True):
+            self.offsets.append(self.offsets[-1] + len(line))
+        self.edits = []
+
+    def start(self, node) -> int:
+        return self.offsets[node.lineno - 1] + node.col_offset
+
+    def end(self, node) -> int:
+        return self.offsets[node.end_lineno - 1] + node.end_col_offset
+
+    def text(self, node) -> str:
+        return self.src[self.start(node):self.end(node)].decode("utf-8")
+
+    def replace(self, start: int, end: int, text: str):
+        self.edits.append((start, end, text))
+
+    def result(self) -> Optional[str]:
+        if not self.edits:
+            return None
+        src = self.src
+        for start, end, text in sorted(set(self.edits), reverse=True):
+            src = src[:start] + text.encode("utf-8") + src[end:]
+        return src.decode("utf-8")
+
+def _on_line(node, line: Optional[int]) -> bool:
+    return line is None or node.lineno <= line <= node.end_lineno
+
+def _calls(tree, line: Optional[int] = None):
+    return [n for n in ast.walk(tree) if isinstance(n, ast.Call) and _on_line(n, line)]
+
+def _drop_keyword(source: _Source, call: ast.Call, kw: ast.keyword):
+    items = sorted(call.args + call.keywords, key=source.start)
+    i = items.index(kw)
+    if i > 0:
+        source.replace(source.end(items[i - 1]), source.end(kw), "")
+    elif len(items) > 1:
+        source.replace(source.start(kw), source.start(items[1]), "")
+    else:
+        source.replace(source.start(kw), source.end(kw), "")
+
+STRING_LITERAL_RE = re.compile(STRING_LITERAL)
+
+def _compiles(code: str) -> bool:
+    try:
+        compile(code, "<fix>", "exec")
+    except (SyntaxError, ValueError):
+        return False
+    return True
+
+def _unterminated_quote(line: str) -> Optional[int]:
+    """Offset of the quote that opens the unterminated string literal of a line (per the 035 lexer), or None."""
+    i = 0
+    while True:
+        quotes = [q for q in (line.find('"', i), line.find("'", i)) if q != -1]
+        if not quotes:
+            return None
+        q = min(quotes)
+        if "#" in line[i:q]:
+            return None
+        m = STRING_LITERAL_RE.match(line, q)
+        if m is None:
+            return q
+        i = m.end()
+
+def fix_unterminated_string(code: str, info: dict) -> Optional[str]:
+    """
+    A string literal broken over lines: join the line with the next ones, keeping the break as a
+    \\n escape (nothing in raw strings, where it would be a LaTeX command), until the code compiles.
+    """
+    line = info.get("line")
+    lines = code.split("\n")
+    if not line or line > len(lines):
+        return None
+    q = _unterminated_quote(lines[line - 1])
+    if q is None:
+        return None
+    raw = "r" in re.search(r"[rRbBuUfF]{0,2}$", lines[line - 1][:q]).group().lower()
+    sep = "" if raw else "\\n"
+    for k in range(1, 5):
+        if line - 1 + k >= len(lines):
+            break
+        joined = sep.join([lines[line - 1]] + [l.strip() for l in lines[line:line + k]])
+        candidate = "\n".join(lines[:line - 1] + [joined] + lines[line + k:])
+        if _compiles(candidate):
+            return candidate
+    return None
+
+def fix_literal_newline(code: str, info: dict) -> Optional[str]:
+    """Code that arrived with literal \\n escapes instead of line breaks; escapes inside string literals stay."""
+    line = info.get("line")
+    lines = code.split("\n")
+    if not line or line > len(lines) or "\\n" not in lines[line - 1]:
+        return None
+    text, out, pos = lines[line - 1], [], 0
+    for m in re.finditer(STRING_TOKEN, text):
+        out += [text[pos:m.start()].replace("\\n", "\n"), m.group()]
+        pos = m.end()
+    out.append(text[pos:].replace("\\n", "\n"))
+    lines[line - 1] = "".join(out)
+    candidate = "\n".join(lines)
+    return candidate if _compiles(candidate) else None
+
+def fix_unexpected_indent(code: str, info: dict) -> Optional[str]:
+    dedented = textwrap.dedent(code)
+    if dedented != code:
+        return dedented
+    line = info.get("line")
+    lines = code.split("\n")
+    if not line or line > len(lines):
+        return None
+    prev = next((l for l in reversed(lines[:line - 1]) if l.strip()), "")
+    if prev.rstrip().endswith(":"):
+        return None
+    indent = prev[:len(prev) - len(prev.lstrip())]
+    lines[line - 1] = indent + lines[line - 1].lstrip()
+    return "\n".join(lines)
+
+def fix_unexpected_kwarg(code: str, info: dict) -> Optional[str]:
+    """Map old-style <a>_min/<a>_max keywords onto <a>_range; drop other unknown keywords at the failing call."""
+    name, line = info.get("name"), info.get("line")
+    if not name:
+        return None
+    tree = ast.parse(code)
+    source = _Source(code)
+    axis = name[:-4] if name.endswith(("_min", "_max")) else None
+    for call in _calls(tree, None if axis in RANGE_KEYWORDS else line):
+        kws = {kw.arg: kw for kw in call.keywords}
+        if name not in kws:
+            continue
+        if axis in RANGE_KEYWORDS:
+            lo, hi, rng = kws.get(f"{axis}_min"), kws.get(f"{axis}_max"), RANGE_KEYWORDS[axis]
+            if lo is not None and hi is not None and rng not in kws:
+                first, second = sorted((lo, hi), key=source.start)
+                source.replace(source.start(first), source.end(first),
+                               f"{rng}=[{source.text(lo.value)}, {source.text(hi.value)}]")
+                _drop_keyword(source, call, second)
+                continue
+        _drop_keyword(source, call, kws[name])
+    return source.result()
+
+def fix_zero_run_time(code: str, info: dict) -> Optional[str]:
+    tree = ast.parse(code)
+    source = _Source(code)
+    for call in _calls(tree):
+        value = _keyword(call, "run_time", 0 if _call_name(call) == "wait" else None)
+        if value is None:
+            value = _keyword(call, "duration")
+        v = _number(value) if value is not None else None
+        if v is not None and v < MIN_RUN_TIME:
+            source.replace(source.start(value), source.end(value), _fmt_number(MIN_RUN_TIME))
+    return source.result()
+
+def fix_camera_frame(code: str, info: dict) -> Optional[str]:
+    """ThreeDScene has no camera.frame: drop the statements that use it, keeping the timing of self.play calls."""
+    tree = ast.parse(code)
+    aliases = {t.id for n in ast.walk(tree) if isinstance(n, ast.Assign) and ast.unparse(n.value) == "self.camera.frame"
+               for t in n.targets if isinstance(t, ast.Name)}
+    uses_frame = lambda node: "self.camera.frame" in ast.unparse(node) or any(
+        isinstance(n, ast.Name) and n.id in aliases for n in ast.walk(node))
+    source = _Source(code)
+    for node in ast.walk(tree):
+        for stmt in getattr(node, "body", []) if isinstance(getattr(node, "body", None), list) else []:
+            if not isinstance(stmt, (ast.Expr, ast.Assign, ast.AugAssign)) or not uses_frame(stmt):
+                continue
+            call = stmt.value if isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Call) else None
+            if call is not None and _call_name(call) == "play":
+                kept = [a for a in call.args if not uses_frame(a)]
+                if kept:
+                    call.args = kept
+                    call.keywords = [kw for kw in call.keywords if not uses_frame(kw.value)]
+                    new = ast.unparse(call)
+                else:
+                    run_time = _keyword(call, "run_time")
+                    new = f"self.wait({ast.unparse(run_time) if run_time is not None and not uses_frame(run_time) else 1})"
+            else:
+                new = "pass"
+            source.replace(source.start(stmt), source.end(stmt), new)
+    return source.result()
+
+def _color_constant(node) -> bool:
+    return isinstance(node, ast.Name) or isinstance(node, ast.Constant) and isinstance(node.value, str)
+
+def fix_string_color(code: str, info: dict) -> Optional[str]:
+    """
+    Plain-string colors given to the interpolate_color() function on the failing line: wrap them
+    in ManimColor(), replacing the sanitizer's Color() wrapper (a no-op where manim has no Color).
+    Methods of the same name (Mobject.interpolate_color) interpolate mobjects and are left alone.
+    """
+    tree = ast.parse(code)
+    source = _Source(code)
+    for call in _calls(tree, info.get("line")):
+        if not (isinstance(call.func, ast.Name) and call.func.id == "interpolate_color"):
+            continue
+        for arg in call.args[:2]:
+            if (isinstance(arg, ast.Call) and isinstance(arg.func, ast.Name) and arg.func.id == "Color"
+                    and len(arg.args) == 1 and not arg.keywords and _color_constant(arg.args[0])):
+                source.replace(source.start(arg), source.end(arg), f"ManimColor({source.text(arg.args[0])})")
+            elif _color_constant(arg):
+                source.replace(source.start(arg), source.end(arg), f"ManimColor({source.text(arg)})")
+    return source.result()
+
+def _point_2d(node) -> Optional[ast.AST]:
+    """The 2-element list/tuple of a 2D point literal ([x, y], (x, y), np.array([x, y])), else None."""
+    if isinstance(node, ast.Call) and _call_name(node) in ("array", "np.array") and node.args:
+        node = node.args[0]
+    if isinstance(node, (ast.List, ast.Tuple)) and len(node.elts) == 2 and not any(
+            isinstance(e, (ast.List, ast.Tuple, ast.Starred)) for e in node.elts):
+        return node
+    return None
+
+def fix_point_2d(code: str, info: dict) -> Optional[str]:
+    tree = ast.parse(code)
+    source = _Source(code)
+    for call in _calls(tree, info.get("line")):
+        if _call_name(call) not in POINT_CALLS:
+            continue
+        for arg in call.args + [kw.value for kw in call.keywords if kw.arg in POINT_KEYWORDS]:
+            point = _point_2d(arg)
+            if point is not None:
+                last = point.elts[-1]
+                source.replace(source.end(last), source.end(last), ", 0")
+    return source.result()
+
+def fix_renamed_name(code: str, info: dict) -> Optional[str]:
+    old = info.get("name")
+    if old not in RENAMED_NAMES:
+        return None
+    tree = ast.parse(code)
+    source = _Source(code)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id == old and isinstance(node.ctx, ast.Load):
+            source.replace(source.start(node), source.end(node), RENAMED_NAMES[old])
+    return source.result()
+
+LOCAL_FIXERS = {
+    "unterminated_string": fix_unterminated_string,
+    "literal_newline": fix_literal_newline,
+    "unexpected_indent": fix_unexpected_indent,
+    "unexpected_kwarg": fix_unexpected_kwarg,
+    "zero_run_time": fix_zero_run_time,
+    "camera_frame": fix_camera_frame,
+    "string_color": fix_string_color,
+    "point_2d": fix_point_2d,
+    "renamed_name": fix_renamed_name,
+}
+
+def local_fix(code: str, tb_class: str, info: dict) -> Optional[str]:
+    """The code rewritten by the fixer of tb_class, or None (no fixer, nothing to change, or the fixer failed)."""
+    fixer = LOCAL_FIXERS.get(tb_class)
+    if fixer is None or not code:
+        return None
+    try:
+        fixed = fixer(code, info)
+    except (SyntaxError, ValueError) as e:
+        log.info("Local fixer %s could not run: %s", tb_class, e)
+        return None
+    return fixed if fixed and fixed != code else None
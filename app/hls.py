@@ -0,0 +1,180 @@
+"""HLS streaming of a render while it runs."""
+import os, pathlib, shutil, threading, math
+from typing import List, Optional
+
+from app.core import log, set_job
+from app.schemas import SubtitleCue
+from app.media import build_narration_segments, probe_duration
+from app.process import run_logged
+
+# ---------- HLS streaming ----------
+# Optional streaming mode: every finished manim partial movie is transmuxed (video stream copy)
+# into one fMP4 HLS segment and appended to a live EVENT playlist, so playback can start while
+# the scene is still rendering. The playlist gets #EXT-X-ENDLIST (VOD) once the render completes.
+# Given a store, segments and playlist updates are also put() there, so a queue worker on another
+# host can stream through the API process.
+HLS_PLAYLIST = "stream.m3u8"
+HLS_DIR = "hls"
+HLS_TARGET_DURATION = int(os.getenv("HLS_TARGET_DURATION", "10"))
+HLS_POLL_SECONDS = 0.5
+
+class NarrationPreview(threading.Thread):
+    """
+    Synthesizes the cue narration in the background so stream segments can carry audio.
+    With export=False it only fills tts_cache (narration prefetch while the code is generated).
+    """
+
+    def __init__(self, subtitle_cues: List["SubtitleCue"], workdir: pathlib.Path, tts_cache: dict, export: bool = True):
+        super().__init__(daemon=True)
+        self.subtitle_cues = list(subtitle_cues)
+        self.workdir = workdir
+        self.tts_cache = tts_cache
+        self.export = export
+        self.path: Optional[pathlib.Path] = None
+
+    def run(self):
+        try:
+            audio_segments, _ = build_narration_segments(self.subtitle_cues, self.workdir, self.tts_cache)
+            if not audio_segments or not self.export:
+                return
+            audio = audio_segments[0]
+            for seg in audio_segments[1:]:
+                audio += seg
+            path = self.workdir / "narration_preview.mp3"
+            tmp = path.with_suffix(".tmp.mp3")
+            audio.export(str(tmp), format="mp3")
+            os.replace(tmp, path)
+            self.path = path
+        except Exception as e:
+            log.warning("Narration preview failed; streaming without narration: %s", e)
+
+class HLSStreamer:
+    """Publishes finished partial movies of a running render as a growing HLS playlist."""
+
+    def __init__(self, job_id: str, workdir: pathlib.Path, narration: Optional[NarrationPreview] = None, store=None):
+        self.job_id = job_id
+        self.workdir = workdir
+        self.narration = narration
+        self.store = store
+        self.attempt = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def watch(self, roots: List[pathlib.Path]):
+        """Start streaming a new render whose partial movies appear under roots, in order."""
+        self.close(complete=False)
+        self.attempt += 1
+        self.roots = roots
+        self.segments = []  # (duration, init file, segment file)
+        self.published = {}  # root index -> number of partials published
+        self.timeline = 0.0
+        self.failed = False
+        # Segments of each attempt get their own directory so a segment URL never changes content
+        self.hls_subdir = f"{HLS_DIR}/a{self.attempt}"
+        self.hls_dir = self.workdir / self.hls_subdir
+        shutil.rmtree(self.hls_dir, ignore_errors=True)
+        self.hls_dir.mkdir(parents=True, exist_ok=True)
+        (self.workdir / HLS_PLAYLIST).unlink(missing_ok=True)
+        for root in roots:
+            # Partials left over from a failed attempt must not be mistaken for new ones
+            shutil.rmtree(root, ignore_errors=True)
+        set_job(self.job_id, streamAttempt=self.attempt, streamReady=False)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def close(self, complete: bool):
+        """Stop watching; on a complete render publish the remaining partials and end the playlist."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if complete and not self.failed:
+            self._scan(final=True)
+            self._write_playlist(ended=True)
+
+    def _run(self):
+        while not self._stop.wait(HLS_POLL_SECONDS):
+            self._scan(final=False)
+
+    def _partials(self, root: pathlib.Path) -> List[pathlib.Path]:
+        return sorted(root.glob("*/partial_movie_files/*/*.mp4"))
+
+    def _scan(self, final: bool):
+        if self.failed:
+            return
+        for i, root in enumerate(self.roots):
+            partials = self._partials(root)
+            root_done = final or any(root.glob("*/out.mp4"))
+            ready = partials if root_done else partials[:-1]  # the newest partial may still be written
+            for part in ready[self.published.get(i, 0):]:
+                if not self._publish(part):
+                    self.failed = True
+                    return
+                self.published[i] = self.published.get(i, 0) + 1
+            if not root_done:
+                break  # keep segments in scene order
+
+    def _publish(self, part: pathlib.Path) -> bool:
+        duration = probe_duration(part)
+        if not duration:
+            return True  # empty partial (e.g. zero-length wait); nothing to play
+        n = len(self.segments)
+        init_name, seg_name = f"init_{n:05d}.mp4", f"seg_{n:05d}.m4s"
+        narration = self.narration.path if self.narration is not None else None
+        if narration is not None and narration.exists():
+            audio_in = ["-ss", f"{self.timeline:.3f}", "-i", str(narration)]
+        else:
+            audio_in = ["-f", "lavfi", "-i", "anullsrc=r=44100:cl=stereo"]
+        cmd = [
+            "ffmpeg", "-y", "-i", str(part.resolve()), *audio_in,
+            "-map", "0:v:0", "-map", "1:a:0", "-c:v", "copy", "-c:a", "aac", "-af", "apad",
+            "-t", f"{duration:.3f}",
+            "-f", "hls", "-hls_time", "100000", "-hls_playlist_type", "vod",
+            "-hls_segment_type", "fmp4", "-hls_fmp4_init_filename", init_name,
+            "-hls_segment_filename", seg_name, f"part_{n:05d}.m3u8",
+        ]
+        try:
+            run_logged(cmd, self.hls_dir, timeout=120)
+        except Exception as e:
+            log.warning("HLS segmenting of %s failed; stream stops here: %s", part, e)
+            return False
+        for name in (init_name, seg_name):
+            self._put(f"{self.hls_subdir}/{name}", self.hls_dir / name, immutable=True)
+        self.segments.append((duration, init_name, seg_name))
+        self.timeline += duration
+        self._write_playlist(ended=False)
+        if n == 0:
+            set_job(self.job_id, streamReady=True)
+        return True
+
+    def _write_playlist(self, ended: bool):
+        target = max([HLS_TARGET_DURATION] + [math.ceil(d) for d, _, _ in self.segments])
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:7",
+            f"#EXT-X-TARGETDURATION:{target}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+            f"#EXT-X-PLAYLIST-TYPE:{'VOD' if ended else 'EVENT'}",
+            "#EXT-X-INDEPENDENT-SEGMENTS",
+        ]
+        for n, (duration, init_name, seg_name) in enumerate(self.segments):
+            if n > 0:
+                lines.append("#EXT-X-DISCONTINUITY")
+            lines += [f'#EXT-X-MAP:URI="{self.hls_subdir}/{init_name}"', f"#EXTINF:{duration:.3f},", f"{self.hls_subdir}/{seg_name}"]
+        if ended:
+            lines.append("#EXT-X-ENDLIST")
+        path = self.workdir / HLS_PLAYLIST
+        tmp = path.with_suffix(".m3u8.tmp")
+        tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        os.replace(tmp, path)
+        self._put(HLS_PLAYLIST, path)
+
+    def _put(self, name: str, path: pathlib.Path, immutable: bool = False):
+        if self.store is None:
+            return
+        try:
+            self.store.put(self.job_id, name, path, immutable=immutable)
+        except Exception as e:
+            log.warning("Stream upload of %s failed; other hosts will not see it: %s", name, e)
@@ -0,0 +1,309 @@
+"""SQLite job index, its JSONL journal export and history pagination helpers."""
+import os, json, pathlib, threading, time, hashlib, queue, sqlite3, base64
+from typing import Callable, Optional, Tuple
+
+from app.core import BASE_DIR, RENDERS_DIR, log
+from app.artifacts import JOB_ID_RE
+
+# ---------- Job index (SQLite) ----------
+# Every job's prompt, stage timings, token usage, outcome and artifacts go to an indexed SQLite
+# store (WAL mode). Writes are queued to a single writer thread so the request path never waits
+# on the database. Finished jobs are also appended to the journal table, which export_journal()
+# copies to an append-only, size-rotated JSONL file.
+JOBS_DB = pathlib.Path(os.getenv("JOBS_DB", str(BASE_DIR / "jobs.sqlite3")))
+JOURNAL_PATH = pathlib.Path(os.getenv("JOURNAL_PATH", str(BASE_DIR / "journal" / "requests.jsonl")))
+JOURNAL_MAX_BYTES = int(os.getenv("JOURNAL_MAX_BYTES", str(10 * 1024 * 1024)))
+JOURNAL_BACKUPS = int(os.getenv("JOURNAL_BACKUPS", "5"))
+JOURNAL_EXPORT_INTERVAL = float(os.getenv("JOURNAL_EXPORT_INTERVAL", "300"))
+
+JOB_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    finished_at REAL,
+    prompt TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error_class TEXT,
+    error TEXT,
+    timings TEXT,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    artifacts TEXT,
+    video_seconds REAL,
+    thumbnail TEXT,
+    renders TEXT,
+    llm_calls TEXT,
+    prompt_variant TEXT,
+    render_attempts INTEGER,
+    purged_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created_at DESC, job_id DESC);
+CREATE INDEX IF NOT EXISTS jobs_prompt_hash ON jobs (prompt_hash);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at DESC, job_id DESC);
+CREATE TABLE IF NOT EXISTS journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+# Columns added after the first schema; ALTERed into existing databases
+JOB_INDEX_COLUMNS = {"video_seconds": "REAL", "thumbnail": "TEXT", "renders": "TEXT", "llm_calls": "TEXT",
+                     "prompt_variant": "TEXT", "render_attempts": "INTEGER", "purged_at": "REAL"}
+
+def migrate_job_index(conn: sqlite3.Connection):
+    conn.executescript(JOB_INDEX_SCHEMA)
+    have = {r["name"] for r in conn.execute("PRAGMA table_info(jobs)")}
+    for name, decl in JOB_INDEX_COLUMNS.items():
+        if name not in have:
+            conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {decl}")
+    conn.commit()
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join((prompt or "").lower().split())
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(normalize_prompt(prompt).encode("utf-8")).hexdigest()
+
+class JobRecord:
+    """Per-job facts collected along the pipeline: stage timings, token usage, outcome."""
+
+    def __init__(self, job_id: str, prompt: str):
+        self.job_id = job_id
+        self.prompt = prompt
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.status = "running"
+        self.error_class: Optional[str] = None
+        self.error: Optional[str] = None
+        self.timings = {}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.artifacts = {}
+        self.video_seconds: Optional[float] = None
+        self.thumbnail: Optional[str] = None
+        self.renders = []  # one {features, predicted, seconds, ok} per manim render
+        self.llm_calls = []  # one {call, seconds, promptTokens, cachedTokens, completionTokens} per LLM call
+        self.prompt_variant: Optional[str] = None
+        self.render_attempts: Optional[int] = None
+        self.current_stage: Optional[str] = None
+        self._stage_started = time.perf_counter()
+
+    def begin(self, stage: str):
+        """Close the running stage (accumulating its wall time) and start the next one."""
+        now = time.perf_counter()
+        if self.current_stage is not None:
+            self.timings[self.current_stage] = self.timings.get(self.current_stage, 0.0) + now - self._stage_started
+        self.current_stage = stage
+        self._stage_started = now
+
+    def add_usage(self, response, call: str = "llm", seconds: Optional[float] = None):
+        """Add an LLM response's token usage to the totals and log it as one of llm_calls."""
+        usage = getattr(response, "usage", None)
+        entry = {"call": call, "seconds": round(seconds, 3) if seconds is not None else None}
+        if usage is not None:
+            details = getattr(usage, "prompt_tokens_details", None)
+            entry.update(promptTokens=getattr(usage, "prompt_tokens", 0) or 0,
+                         cachedTokens=getattr(details, "cached_tokens", 0) or 0 if details is not None else 0,
+                         completionTokens=getattr(usage, "completion_tokens", 0) or 0)
+            self.prompt_tokens += entry["promptTokens"]
+            self.completion_tokens += entry["completionTokens"]
+        self.llm_calls.append(entry)
+
+    def finish(self, status: str, error_class: Optional[str] = None, error: Optional[str] = None):
+        stage = self.current_stage
+        self.begin(stage or "done")
+        self.current_stage = stage
+        self.status = status
+        self.error_class = error_class
+        self.error = error
+        self.finished_at = time.time()
+
+    def row(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "prompt": self.prompt,
+            "prompt_hash": prompt_hash(self.prompt),
+            "status": self.status,
+            "error_class": self.error_class,
+            "error": self.error,
+            "timings": json.dumps({k: round(v, 3) for k, v in self.timings.items()}),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "artifacts": json.dumps(self.artifacts),
+            "video_seconds": self.video_seconds,
+            "thumbnail": self.thumbnail,
+            "renders": json.dumps(self.renders),
+            "llm_calls": json.dumps(self.llm_calls),
+            "prompt_variant": self.prompt_variant,
+            "render_attempts": self.render_attempts,
+        }
+
+def connect_db(path: pathlib.Path) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+class JobIndex:
+    """
+    SQLite job index with a single background writer thread. A worker process on another host
+    sets forward (jobqueue.forward_index_write) to hand its writes to the API process instead.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.forward: Optional[Callable[[str, tuple], None]] = None
+        self._queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._writer, daemon=True, name="job-index-writer")
+                self._thread.start()
+
+    def _writer(self):
+        conn = connect_db(self.path)
+        migrate_job_index(conn)
+        self._ready.set()
+        while True:
+            sql_batch = [self._queue.get()]
+            while not self._queue.empty() and len(sql_batch) < 100:
+                sql_batch.append(self._queue.get_nowait())
+            try:
+                with conn:
+                    for sql, params in sql_batch:
+                        conn.execute(sql, params)
+            except sqlite3.Error as e:
+                log.error("Job index write failed: %s", e)
+
+    def submit(self, sql: str, params=()):
+        if self.forward is not None:
+            self.forward(sql, params)
+            return
+        self._ensure_writer()
+        self._queue.put((sql, params))
+
+    def submit_start(self, rec: JobRecord):
+        row = rec.row()
+        cols = ", ".join(row)
+        self.submit(f"INSERT OR REPLACE INTO jobs ({cols}) VALUES ({', '.join('?' for _ in row)})", tuple(row.values()))
+
+    def submit_finish(self, rec: JobRecord):
+        self.submit_start(rec)
+        self.submit("INSERT INTO journal (job_id, record) VALUES (?, ?)", (rec.job_id, json.dumps(rec.row())))
+
+    def connect(self) -> sqlite3.Connection:
+        """A reader connection (WAL lets readers run alongside the writer)."""
+        self._ensure_writer()
+        self._ready.wait(10)
+        return connect_db(self.path)
+
+JOB_INDEX = JobIndex(JOBS_DB)
+
+def _rotate_journal(path: pathlib.Path):
+    for i in range(JOURNAL_BACKUPS - 1, 0, -1):
+        src = path.with_name(f"{path.name}.{i}")
+        if src.exists():
+            os.replace(src, path.with_name(f"{path.name}.{i + 1}"))
+    if JOURNAL_BACKUPS > 0:
+        os.replace(path, path.with_name(f"{path.name}.1"))
+    else:
+        path.unlink()
+
+def export_journal(path: pathlib.Path = JOURNAL_PATH) -> int:
+    """Append journal rows not exported yet to the JSONL file, rotating it by size. Returns rows written."""
+    conn = JOB_INDEX.connect()
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'journal_exported_seq'").fetchone()
+        last = int(row["value"]) if row else 0
+        rows = conn.execute("SELECT seq, record FROM journal WHERE seq > ? ORDER BY seq", (last,)).fetchall()
+        if not rows:
+            return 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        for r in rows:
+            line = r["record"] + "\n"
+            if path.exists() and path.stat().st_size + len(line) > JOURNAL_MAX_BYTES:
+                _rotate_journal(path)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line)
+            last = r["seq"]
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('journal_exported_seq', ?)", (str(last),))
+        return len(rows)
+    finally:
+        conn.close()
+
+def _journal_loop():
+    while True:
+        time.sleep(JOURNAL_EXPORT_INTERVAL)
+        try:
+            export_journal()
+        except Exception as e:
+            log.error("Journal export failed: %s", e)
+
+def start_journal_exporter():
+    if JOURNAL_EXPORT_INTERVAL > 0:
+        threading.Thread(target=_journal_loop, daemon=True, name="journal-export").start()
+
+# ---------- History ----------
+# Newest-first listing of past jobs straight from the job index, with keyset pagination on
+# (created_at, job_id): the cursor is the last row's key, so every page is an index range scan
+# no matter how deep into the history it is. Jobs whose dir the GC deleted (purged_at set) are
+# left out: their artifacts are gone.
+JOBS_PAGE_MAX = 100
+
+def _encode_cursor(created_at: float, job_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{created_at!r}|{job_id}".encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> Optional[Tuple[float, str]]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, job_id = raw.split("|", 1)
+        return float(created_at), job_id
+    except Exception:
+        return None
+
+def _history_item(row: sqlite3.Row) -> dict:
+    job_id = row["job_id"]
+    done = row["status"] == "done"
+    return {
+        "jobId": job_id,
+        "prompt": row["prompt"],
+        "status": row["status"],
+        "createdAt": row["created_at"],
+        "duration": row["video_seconds"],
+        "videoUrl": f"/renders/{job_id}/out.mp4" if done else None,
+        "subsUrl": f"/renders/{job_id}/captions.vtt" if done else None,
+        "thumbnailUrl": f"/renders/{job_id}/{row['thumbnail']}" if done and row["thumbnail"] else None,
+    }
+
+def backfill_job_index():
+    """Index job dirs that predate the job index (once); their prompt is unknown, so the scene file names it."""
+    conn = JOB_INDEX.connect()
+    try:
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'backfilled'").fetchone():
+            return
+        known = {r["job_id"] for r in conn.execute("SELECT job_id FROM jobs")}
+        rows = []
+        for workdir in RENDERS_DIR.iterdir():
+            if not workdir.is_dir() or not JOB_ID_RE.match(workdir.name) or workdir.name in known:
+                continue
+            code_files = sorted(workdir.glob("*.py"))
+            done = (workdir / "out.mp4").is_file()
+            rows.append((workdir.name, workdir.stat().st_mtime, code_files[0].stem.replace("_", " ") if code_files else "",
+                         "done" if done else "error", "legacy"))
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO jobs (job_id, created_at, prompt, status, prompt_hash) VALUES (?, ?, ?, ?, ?)", rows)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('backfilled', '1')")
+        log.info("Backfilled %d legacy jobs into the job index", len(rows))
+    finally:
+        conn.close()
@@ -0,0 +1,407 @@
+"""Job queue: /generate enqueues, render workers claim jobs under renewable leases."""
+import os, asyncio, json, uuid, threading, time, socket
+from typing import List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+
+from app.core import RENDERS_DIR, count, get_job, job_log, log, set_job
+from app.index import JOB_INDEX
+from app.toolchain import toolchain
+from app.hls import HLS_PLAYLIST
+from app.artifacts import published_result
+from app.store import STORE
+from app.pipeline import CHECKPOINT, run_job
+
+# ---------- Job queue ----------
+# With JOB_QUEUE=1, /generate does not run jobs in the process that received the request. It
+# adds them to a queue in Redis (QUEUE_URL; app/fake_redis.py stands in for tests, and the redis
+# package is required), and render workers claim them: QUEUE_WORKERS slots in the API process
+# (0 for an API-only process) and any number of `python -m app.worker` processes, on this host
+# or others. A claim is a lease of QUEUE_LEASE_SECONDS that the worker's heartbeat renews. If a
+# worker dies or hangs, its lease runs out and the job is handed out again, up to
+# QUEUE_MAX_DELIVERIES times, so delivery is at least once. Claims, renewals and completions are
+# WATCH/MULTI transactions on the job's hash, so two workers never both hold a lease. Redeliveries
+# are safe: a published job (its manifest in STORE) is not run again, and a job with a
+# payload.json checkpoint in STORE resumes at the render instead of calling the LLM again. The
+# heartbeat also copies each running job's status into the queue, so /jobs/{id} works in the API
+# process for jobs that a worker process runs. RENDERS_DIR is each host's scratch space: workers
+# on other hosts need ARTIFACT_STORE=s3, through which they read checkpoints and publish
+# artifacts and live stream segments, and they forward their job index writes to the API
+# process through the queue (QueueWorker forward_index).
+#
+# Keys, under QUEUE_PREFIX:
+#   queued            sorted set of waiting job ids, by enqueue time
+#   leased            sorted set of leased job ids, by lease expiry
+#   job:<id>          hash: prompt, stream, state, enqueued_at, deliveries, worker_id,
+#                     lease_expires, job (status snapshot), http_status, finished_at
+#   workers           sorted set of worker ids, by last heartbeat
+#   worker:<id>       hash: host, pid, slots, started_at, heartbeat_at, running, toolchain
+#   index             list of job index writes forwarded by worker processes
+JOB_QUEUE = os.getenv("JOB_QUEUE", "0") == "1"
+QUEUE_URL = os.getenv("QUEUE_URL", "redis://127.0.0.1:6379/0")
+QUEUE_PREFIX = os.getenv("QUEUE_PREFIX", "jobqueue:")
+QUEUE_WORKERS = int(os.getenv("QUEUE_WORKERS", "1"))
+QUEUE_LEASE_SECONDS = float(os.getenv("QUEUE_LEASE_SECONDS", "60"))
+QUEUE_HEARTBEAT_SECONDS = float(os.getenv("QUEUE_HEARTBEAT_SECONDS", "5"))
+QUEUE_MAX_DELIVERIES = int(os.getenv("QUEUE_MAX_DELIVERIES", "3"))
+QUEUE_POLL_SECONDS = float(os.getenv("QUEUE_POLL_SECONDS", "1"))
+QUEUE_WAIT_SECONDS = float(os.getenv("QUEUE_WAIT_SECONDS", "1800"))  # a non-streaming /generate waits this long
+QUEUE_RESULT_SECONDS = int(os.getenv("QUEUE_RESULT_SECONDS", str(7 * 24 * 3600)))  # finished jobs stay this long
+QUEUE_INDEX_BATCH = 100
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def queue_client():
+    """The Redis client of QUEUE_URL (thread-safe, pooled), created on first use."""
+    with _clients_lock:
+        client = _clients.get(QUEUE_URL)
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("JOB_QUEUE=1 needs redis (pip install redis)")
+            # RESP2: spoken by every Redis version and by app/fake_redis.py
+            client = _clients[QUEUE_URL] = redis.Redis.from_url(QUEUE_URL, decode_responses=True, protocol=2,
+                                                                 health_check_interval=30)
+    return client
+
+def queue_key(*parts: str) -> str:
+    return QUEUE_PREFIX + ":".join(parts)
+
+def _row(job_id: str, fields: dict) -> dict:
+    """A job hash with its numeric fields parsed."""
+    row = {"state": None, "worker_id": None, "job": None, **fields, "job_id": job_id}
+    for name, kind in (("stream", int), ("deliveries", int), ("enqueued_at", float), ("lease_expires", float),
+                       ("http_status", int), ("finished_at", float)):
+        row[name] = kind(row[name]) if row.get(name) else None
+    row["deliveries"] = row["deliveries"] or 0
+    return row
+
+def renders_here() -> bool:
+    """Whether this process renders: always without the queue, with it only when it runs worker slots."""
+    return not JOB_QUEUE or QUEUE_WORKERS > 0
+
+def enqueue_job(job_id: str, prompt: str, stream: bool) -> None:
+    now = time.time()
+    job = {"jobId": job_id, "status": "running", **({"streamUrl": f"/renders/{job_id}/{HLS_PLAYLIST}"} if stream else {})}
+    with queue_client().pipeline() as pipe:
+        pipe.hset(queue_key("job", job_id), mapping={"prompt": prompt, "stream": int(stream), "state": "queued",
+                                                     "enqueued_at": now, "deliveries": 0, "job": json.dumps(job)})
+        pipe.zadd(queue_key("queued"), {job_id: now})
+        pipe.execute()
+    count("queue_enqueued")
+
+def claim_job(worker_id: str) -> Optional[dict]:
+    """
+    Lease a job to worker_id: one whose lease ran out, else the oldest queued one. Jobs whose
+    lease ran out QUEUE_MAX_DELIVERIES times are failed instead of being handed out again.
+    The returned row's deliveries counts the deliveries before this one.
+    """
+    from redis.exceptions import WatchError
+    with queue_client().pipeline() as pipe:
+        while True:
+            now = time.time()
+            try:
+                pipe.watch(queue_key("queued"), queue_key("leased"))
+                expired = pipe.zrangebyscore(queue_key("leased"), "-inf", f"({now}", start=0, num=1)
+                job_id = expired[0] if expired else next(iter(pipe.zrange(queue_key("queued"), 0, 0)), None)
+                if job_id is None:
+                    return None
+                key = queue_key("job", job_id)
+                pipe.watch(key)
+                row = _row(job_id, pipe.hgetall(key))
+                pipe.multi()
+                if row["state"] is None:  # its hash expired or was removed: drop the dangling entry
+                    pipe.zrem(queue_key("queued"), job_id)
+                    pipe.zrem(queue_key("leased"), job_id)
+                    pipe.execute()
+                    continue
+                if expired and row["deliveries"] >= QUEUE_MAX_DELIVERIES:
+                    body = {"error": f"The job lost its render worker {QUEUE_MAX_DELIVERIES} times", "stage": "queue"}
+                    pipe.zrem(queue_key("leased"), job_id)
+                    pipe.hset(key, mapping={"state": "failed", "http_status": 500, "finished_at": now, "lease_expires": "",
+                                            "job": json.dumps({"jobId": job_id, "status": "error", "result": body})})
+                    pipe.expire(key, QUEUE_RESULT_SECONDS)
+                    pipe.execute()
+                    _job_lost(job_id, row["worker_id"], now)
+                    continue
+                pipe.zrem(queue_key("queued"), job_id)
+                pipe.zadd(queue_key("leased"), {job_id: now + QUEUE_LEASE_SECONDS})
+                pipe.hset(key, mapping={"state": "leased", "worker_id": worker_id, "lease_expires": now + QUEUE_LEASE_SECONDS,
+                                        "deliveries": row["deliveries"] + 1})
+                pipe.execute()
+                return row
+            except WatchError:
+                count("queue_claim_conflicts")  # another worker claimed or renewed first; look again
+
+def _job_lost(job_id: str, worker_id: Optional[str], now: float):
+    JOB_INDEX.submit("UPDATE jobs SET status = 'error', error_class = 'worker_lost', error = ?, finished_at = ?"
+                     " WHERE job_id = ? AND status = 'running'",
+                     (f"The job lost its render worker {QUEUE_MAX_DELIVERIES} times", now, job_id))
+    count("queue_lost")
+    log.error("Job %s failed: its lease expired %d times (last worker %s)", job_id, QUEUE_MAX_DELIVERIES, worker_id)
+
+def run_queued_job(row: dict):
+    """Run a claimed job. A job that an earlier delivery already published is not run again."""
+    job_id = row["job_id"]
+    workdir = RENDERS_DIR / job_id
+    if STORE.manifest(job_id) is not None:
+        job_log(workdir, "redelivered after it was published; not run again")
+        result = published_result(workdir)
+        set_job(job_id, status="done", result=result)
+        JOB_INDEX.submit("UPDATE jobs SET status = 'done', finished_at = COALESCE(finished_at, ?) WHERE job_id = ? AND status = 'running'",
+                         (time.time(), job_id))
+        return result
+    if row["deliveries"] > 0:
+        job_log(workdir, f"delivery {row['deliveries'] + 1} (the previous worker's lease expired)")
+        STORE.fetch(job_id, CHECKPOINT, workdir / CHECKPOINT)  # the previous worker may be on another host
+    return run_job(row["prompt"], job_id, bool(row["stream"]), created_at=row["enqueued_at"])
+
+def queue_outcome(job_id: str) -> Optional[dict]:
+    """The state, job snapshot and HTTP status of job_id in the queue."""
+    state, job, http_status = queue_client().hmget(queue_key("job", job_id), "state", "job", "http_status")
+    if state is None:
+        return None
+    return {"state": state, "job": job, "http_status": int(http_status) if http_status else None}
+
+async def wait_for_queued_job(job_id: str):
+    """Wait until a worker has finished job_id. Its /generate body, or a JSONResponse on failure or timeout."""
+    deadline = time.monotonic() + QUEUE_WAIT_SECONDS
+    while True:
+        row = await run_in_threadpool(queue_outcome, job_id)
+        if row is not None and row["state"] in ("done", "failed"):
+            result = json.loads(row["job"] or "{}").get("result") or {}
+            return result if row["state"] == "done" else JSONResponse(result, status_code=row["http_status"] or 500)
+        if time.monotonic() > deadline:
+            return JSONResponse({"error": "Timed out waiting for a render worker", "stage": "queue",
+                                 "statusUrl": f"/jobs/{job_id}"}, status_code=504)
+        await asyncio.sleep(QUEUE_POLL_SECONDS)
+
+def queued_job(job_id: str) -> Optional[dict]:
+    """The /jobs/{id} view of a queued job: its last status snapshot plus its place in the queue."""
+    r = queue_client()
+    fields = r.hgetall(queue_key("job", job_id))
+    if not fields:
+        return None
+    row = _row(job_id, fields)
+    info = {"state": row["state"], "deliveries": row["deliveries"], "worker": row["worker_id"]}
+    if row["state"] == "queued":
+        with r.pipeline(transaction=False) as pipe:
+            pipe.zrank(queue_key("queued"), job_id)
+            pipe.zcard(queue_key("queued"))
+            rank, waiting = pipe.execute()
+        info["position"] = (rank or 0) + 1
+        info["waiting"] = waiting
+    job = json.loads(row["job"] or "{}")
+    job["jobQueue"] = info
+    return job
+
+def find_job(job_id: str) -> Optional[dict]:
+    """A job this process runs or ran (JOBS), else, with the queue on, the queue's view of it."""
+    job = get_job(job_id)
+    if job is None and JOB_QUEUE:
+        job = queued_job(job_id)
+    return job
+
+def live_workers() -> List[dict]:
+    """Workers whose heartbeat is recent enough that they count as alive."""
+    r = queue_client()
+    ids = r.zrangebyscore(queue_key("workers"), time.time() - 3 * QUEUE_HEARTBEAT_SECONDS, "+inf")
+    with r.pipeline(transaction=False) as pipe:
+        for worker_id in ids:
+            pipe.hgetall(queue_key("worker", worker_id))
+        rows = pipe.execute()
+    return [{"worker_id": worker_id, "host": w["host"], "pid": int(w["pid"]), "slots": int(w["slots"]),
+             "started_at": float(w["started_at"]), "heartbeat_at": float(w["heartbeat_at"]),
+             "running": json.loads(w.get("running") or "[]"), "toolchain": json.loads(w.get("toolchain") or "{}")}
+            for worker_id, w in sorted(zip(ids, rows)) if w]
+
+def queue_depth() -> dict:
+    """Queued and leased job counts."""
+    with queue_client().pipeline(transaction=False) as pipe:
+        pipe.zcard(queue_key("queued"))
+        pipe.zcard(queue_key("leased"))
+        queued, leased = pipe.execute()
+    return {"queued": queued, "leased": leased}
+
+def forward_index_write(sql: str, params=()):
+    """Send a job index write to the API process, whose drain_index_writes() applies it."""
+    from redis.exceptions import RedisError
+    try:
+        queue_client().rpush(queue_key("index"), json.dumps([sql, list(params)], default=str))
+    except RedisError as e:
+        log.error("Job index write lost: the queue is unreachable (%s)", e)
+
+def drain_index_writes() -> int:
+    """Apply index writes forwarded by worker processes to this process's job index. Returns writes applied."""
+    items = queue_client().lpop(queue_key("index"), QUEUE_INDEX_BATCH) or []
+    for item in items:
+        sql, params = json.loads(item)
+        JOB_INDEX.submit(sql, tuple(params))
+    return len(items)
+
+def _index_drain_loop():
+    from redis.exceptions import RedisError
+    while True:
+        try:
+            if drain_index_writes() < QUEUE_INDEX_BATCH:
+                time.sleep(QUEUE_POLL_SECONDS)
+        except RedisError as e:
+            log.error("Job index drain failed: %s", e)
+            time.sleep(QUEUE_POLL_SECONDS)
+
+class QueueWorker:
+    """
+    `slots` threads that claim queued jobs and run them, plus a heartbeat that renews their leases,
+    copies their status into the queue and keeps this worker registered. With forward_index the
+    job index writes of this process go to the API process instead of the local JOBS_DB.
+    """
+
+    def __init__(self, slots: int, forward_index: bool = False):
+        self.slots = max(1, slots)
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:4]}"
+        self.started_at = time.time()
+        self.forward_index = forward_index
+        self._running = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> bool:
+        """Register and start claiming. False (nothing started) when this host cannot render."""
+        missing = toolchain()["missing"]
+        if missing or not os.getenv("OPENAI_API_KEY"):
+            log.error("Queue worker not started: %s", ", ".join(f"{t} not found on PATH" for t in missing) or "OPENAI_API_KEY is not set")
+            return False
+        if self.forward_index:
+            JOB_INDEX.forward = forward_index_write
+        self.heartbeat()
+        for i in range(self.slots):
+            self._threads.append(threading.Thread(target=self._loop, daemon=True, name=f"queue-worker-{i}"))
+        self._threads.append(threading.Thread(target=self._heartbeat_loop, daemon=True, name="queue-heartbeat"))
+        for t in self._threads:
+            t.start()
+        log.info("Queue worker %s started with %d slot(s)", self.worker_id, self.slots)
+        return True
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop claiming, wait for the running jobs, deregister."""
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+        with queue_client().pipeline() as pipe:
+            pipe.zrem(queue_key("workers"), self.worker_id)
+            pipe.delete(queue_key("worker", self.worker_id))
+            pipe.execute()
+        log.info("Queue worker %s stopped", self.worker_id)
+
+    def heartbeat(self) -> None:
+        """Renew the leases of the running jobs (and copy their status), then refresh the registration."""
+        from redis.exceptions import WatchError
+        now = time.time()
+        with self._lock:
+            running = sorted(self._running)
+        probe = toolchain(wait=False)
+        r = queue_client()
+        for job_id in running:
+            key = queue_key("job", job_id)
+            with r.pipeline() as pipe:
+                try:
+                    pipe.watch(key)
+                    if pipe.hmget(key, "worker_id", "state") != [self.worker_id, "leased"]:
+                        log.warning("Job %s: lease lost to another worker; this delivery is a duplicate", job_id)
+                        continue
+                    pipe.multi()
+                    pipe.zadd(queue_key("leased"), {job_id: now + QUEUE_LEASE_SECONDS})
+                    pipe.hset(key, mapping={"lease_expires": now + QUEUE_LEASE_SECONDS,
+                                            "job": json.dumps(get_job(job_id) or {}, default=str)})
+                    pipe.execute()
+                except WatchError:
+                    log.warning("Job %s: lease changed during renewal; this delivery may be a duplicate", job_id)
+        with r.pipeline() as pipe:
+            pipe.hset(queue_key("worker", self.worker_id), mapping={
+                "host": socket.gethostname(), "pid": os.getpid(), "slots": self.slots, "started_at": self.started_at,
+                "heartbeat_at": now, "running": json.dumps(running),
+                "toolchain": json.dumps({k: v["version"] for k, v in probe.get("tools", {}).items()})})
+            pipe.expire(queue_key("worker", self.worker_id), int(3 * QUEUE_HEARTBEAT_SECONDS) + 1)
+            pipe.zadd(queue_key("workers"), {self.worker_id: now})
+            pipe.zremrangebyscore(queue_key("workers"), "-inf", f"({now - 3 * QUEUE_HEARTBEAT_SECONDS}")
+            pipe.execute()
+
+    def _heartbeat_loop(self):
+        from redis.exceptions import RedisError
+        while not self._stop.wait(QUEUE_HEARTBEAT_SECONDS):
+            try:
+                self.heartbeat()
+            except RedisError as e:
+                log.error("Queue heartbeat failed: %s", e)
+
+    def _loop(self):
+        from redis.exceptions import RedisError
+        while not self._stop.is_set():
+            try:
+                row = claim_job(self.worker_id)
+            except RedisError as e:
+                log.error("Queue claim failed: %s", e)
+                row = None
+            if row is None:
+                self._stop.wait(QUEUE_POLL_SECONDS)
+                continue
+            self._run(row)
+
+    def _run(self, row: dict):
+        job_id = row["job_id"]
+        count("queue_claimed")
+        if row["deliveries"] > 0:
+            count("queue_redelivered")
+            log.warning("Job %s redelivered to %s (delivery %d)", job_id, self.worker_id, row["deliveries"] + 1)
+        log.info("Job %s claimed by %s after %.1fs in the queue", job_id, self.worker_id, time.time() - row["enqueued_at"])
+        set_job(job_id, **json.loads(row["job"] or "{}"))
+        with self._lock:
+            self._running.add(job_id)
+        try:
+            result = run_queued_job(row)
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+        job = get_job(job_id) or {"jobId": job_id}
+        status = result.status_code if isinstance(result, JSONResponse) else 200
+        self.complete(job_id, job, status)
+        count("queue_completed")
+
+    def complete(self, job_id: str, job: dict, http_status: int) -> bool:
+        """Record a finished job, unless its lease has moved to another worker. Whether it was recorded."""
+        from redis.exceptions import RedisError, WatchError
+        key = queue_key("job", job_id)
+        try:
+            with queue_client().pipeline() as pipe:
+                pipe.watch(key)
+                if pipe.hget(key, "worker_id") != self.worker_id:
+                    log.warning("Job %s finished on %s after its lease moved to another worker", job_id, self.worker_id)
+                    return False
+                pipe.multi()
+                pipe.zrem(queue_key("leased"), job_id)
+                pipe.hset(key, mapping={"state": "done" if job.get("status") == "done" else "failed",
+                                        "job": json.dumps(job, default=str), "http_status": http_status,
+                                        "finished_at": time.time(), "lease_expires": ""})
+                pipe.expire(key, QUEUE_RESULT_SECONDS)
+                pipe.execute()
+                return True
+        except WatchError:
+            log.warning("Job %s finished on %s while its lease moved to another worker", job_id, self.worker_id)
+        except RedisError as e:
+            log.error("Job %s: queue completion failed (%s); the job will be redelivered", job_id, e)
+        return False
+
+QUEUE_WORKER: Optional[QueueWorker] = None
+
+def start_queue_worker():
+    global QUEUE_WORKER
+    if not JOB_QUEUE:
+        return
+    threading.Thread(target=_index_drain_loop, daemon=True, name="queue-index-drain").start()
+    if QUEUE_WORKERS > 0:
+        QUEUE_WORKER = QueueWorker(QUEUE_WORKERS)
+        threading.Thread(target=QUEUE_WORKER.start, daemon=True, name="queue-worker-start").start()
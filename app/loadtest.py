@@ -0,0 +1,125 @@
+"""
+Load generator for POST /generate: finds how much concurrency one box sustains.
+
+Start the app against the local OpenAI stand-in (see app/fake_openai.py), then:
+
+    python -m app.loadtest --url http://127.0.0.1:8000 --concurrency 1,2,4,8 --requests 16 --out load.json
+
+For every concurrency level it keeps that many /generate requests in flight until --requests have
+completed, and reports throughput, p50/p95/p99 latency and failures grouped by pipeline stage
+(the "stage" field of the error body; "http" for transport errors and timeouts).
+With --stream the jobs are submitted in streaming mode and /jobs/{id} is polled until they finish.
+"""
+import sys, json, time, asyncio, argparse, collections
+from typing import List, Optional
+
+import httpx
+
+PROMPTS = [
+    "The area of a circle from rearranged sectors",
+    "Why the sum of the first n odd numbers is n squared",
+    "The Pythagorean theorem by rearranging four triangles",
+    "Zeno's paradox of Achilles and the tortoise",
+]
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    s = sorted(values)
+    k = (len(s) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(s) - 1)
+    return round(s[lo] + (s[hi] - s[lo]) * (k - lo), 3)
+
+async def _wait_for_job(http: httpx.AsyncClient, status_url: str, poll: float) -> dict:
+    while True:
+        await asyncio.sleep(poll)
+        r = await http.get(status_url)
+        job = r.json()
+        if job.get("status") != "running":
+            return job
+
+async def one_request(http: httpx.AsyncClient, prompt: str, stream: bool, poll: float) -> dict:
+    """Returns {ok, latency, stage, status} for one /generate call."""
+    start = time.perf_counter()
+    try:
+        r = await http.post("/generate", data={"prompt": prompt, "stream": "true" if stream else "false"})
+        try:
+            body = r.json()
+        except ValueError:
+            body = {"error": r.text[:200]}
+        status = r.status_code
+        if stream and status == 200 and "statusUrl" in body:
+            job = await _wait_for_job(http, body["statusUrl"], poll)
+            body = job.get("result") or {}
+            status = 200 if job.get("status") == "done" else 500
+    except httpx.HTTPError as e:
+        return {"ok": False, "latency": time.perf_counter() - start, "stage": "http", "status": None,
+                "error": f"{type(e).__name__}: {e}"[:200]}
+    latency = time.perf_counter() - start
+    if status == 200 and "error" not in body:
+        return {"ok": True, "latency": latency, "stage": None, "status": status}
+    return {"ok": False, "latency": latency, "stage": body.get("stage") or "unknown", "status": status,
+            "error": str(body.get("error"))[:200]}
+
+async def run_level(url: str, concurrency: int, total: int, stream: bool, timeout: float, poll: float) -> dict:
+    results = []
+    counter = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency * 2, max_keepalive_connections=concurrency * 2)
+
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as http:
+        async def worker():
+            for i in counter:
+                results.append(await one_request(http, PROMPTS[i % len(PROMPTS)], stream, poll))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    ok = [r["latency"] for r in results if r["ok"]]
+    all_lat = [r["latency"] for r in results]
+    failures = collections.Counter(r["stage"] for r in results if not r["ok"])
+    errors = collections.Counter(f'{r["stage"]}: {r.get("error")}' for r in results if not r["ok"])
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "ok": len(ok),
+        "elapsed": round(elapsed, 3),
+        "throughput": round(len(ok) / elapsed, 4) if elapsed else None,  # successful jobs per second
+        "latency": {"p50": percentile(all_lat, 50), "p95": percentile(all_lat, 95), "p99": percentile(all_lat, 99),
+                    "okP50": percentile(ok, 50), "okP95": percentile(ok, 95), "okP99": percentile(ok, 99)},
+        "failuresByStage": dict(failures),
+        "topErrors": dict(errors.most_common(5)),
+    }
+
+async def run(args) -> dict:
+    levels = []
+    for c in [int(x) for x in args.concurrency.split(",") if x.strip()]:
+        level = await run_level(args.url, c, max(args.requests, c), args.stream, args.timeout, args.poll)
+        print(f"[load] c={c} ok={level['ok']}/{level['requests']} thr={level['throughput']}/s "
+              f"p50={level['latency']['p50']}s p95={level['latency']['p95']}s p99={level['latency']['p99']}s "
+              f"fail={level['failuresByStage']}", file=sys.stderr)
+        levels.append(level)
+    return {"url": args.url, "stream": args.stream, "createdAt": time.time(), "levels": levels}
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="comma-separated levels, run in order")
+    parser.add_argument("--requests", type=int, default=16, help="completed requests per level")
+    parser.add_argument("--stream", action="store_true", help="submit in streaming mode and poll /jobs/{id}")
+    parser.add_argument("--timeout", type=float, default=900, help="per-request timeout (seconds)")
+    parser.add_argument("--poll", type=float, default=1.0)
+    parser.add_argument("--out", default="-")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.out == "-":
+        print(text)
+    else:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,119 @@
+"""Captions, narration (TTS) and the final audio/video mux."""
+import subprocess, pathlib
+from typing import List, Optional
+
+from app.core import OPENAI_VOICE, OPENAI_VOICE_MODEL, get_client, log, write_atomic
+from app.schemas import SubtitleCue
+from app.process import run_logged
+
+# ---------- Captions & narration ----------
+def to_vtt_time(t: float) -> str:
+    t = float(t)
+    ms = int((t - int(t)) * 1000)
+    s = int(t) % 60
+    m = (int(t) // 60) % 60
+    h = int(t) // 3600
+    return f"{h:02d}:{m:02d}:{s:02d}.{ms:03d}"
+
+def write_vtt(workdir: pathlib.Path, subtitle_cues: List["SubtitleCue"]) -> None:
+    vtt_lines = ["WEBVTT", ""]
+    for i, cue in enumerate(subtitle_cues, start=1):
+        start = max(0.0, float(cue.start))
+        end = max(start + 0.01, float(cue.end))
+        text = (cue.text or "").replace("\n", " ")
+        vtt_lines += [f"{i}", f"{to_vtt_time(start)} --> {to_vtt_time(end)}", text, ""]
+    write_atomic(workdir / "captions.vtt", "\n".join(vtt_lines))
+
+def probe_duration(path: pathlib.Path) -> Optional[float]:
+    """Video stream duration in seconds via ffprobe, or None if it cannot be read."""
+    try:
+        probe = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=duration", "-of", "csv=p=0", str(path)],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+        )
+        duration_str = (probe.stdout or "").strip()
+        return float(duration_str) if duration_str else None
+    except Exception as e:
+        log.warning("Failed to probe duration of %s: %s", path, e)
+        return None
+
+def build_narration_segments(subtitle_cues: List["SubtitleCue"], workdir: pathlib.Path, tts_cache: Optional[dict] = None,
+                             tts_client=None):
+    """
+    TTS every cue and lay the clips out on the cue timeline (silence in the gaps).
+    tts_cache maps cue text -> chunk file so text already spoken for this job is not re-synthesized.
+    Returns (audio segments, end time of the last cue); raises on TTS failure.
+    """
+    from pydub import AudioSegment
+    tts_client = tts_client or get_client()
+    tts_cache = {} if tts_cache is None else tts_cache
+    audio_segments = []
+    prev_end = 0.0
+    # Iterate through subtitle cues and generate each segment
+    for idx, cue in enumerate(subtitle_cues):
+        text = (cue.text or "").strip()
+        start_time = float(cue.start)
+        end_time = float(cue.end)
+        # Add silence for any gap between previous end and this cue's start
+        if start_time > prev_end:
+            gap_ms = int((start_time - prev_end) * 1000)
+            if gap_ms > 0:
+                audio_segments.append(AudioSegment.silent(duration=gap_ms))
+        chunk_path = tts_cache.get(text)
+        if chunk_path is None:
+            # Generate speech for this subtitle text
+            log.info("TTS for subtitle %d: \"%s\"", idx+1, text)
+            response = tts_client.audio.speech.create(
+                model=OPENAI_VOICE_MODEL,
+                voice=OPENAI_VOICE,
+                input=text,
+                response_format="mp3"
+            )
+            # Save audio chunk to file and load with pydub
+            chunk_path = workdir / f"speech_chunk_{len(tts_cache)+1}.mp3"
+            response.stream_to_file(str(chunk_path))
+            tts_cache[text] = chunk_path
+        segment_audio = AudioSegment.from_file(str(chunk_path), format="mp3")
+        audio_segments.append(segment_audio)
+        prev_end = end_time
+    return audio_segments, prev_end
+
+def mix_narration(audio_segments: list, prev_end: float, video_path: pathlib.Path, audio_path: pathlib.Path) -> float:
+    """Join the cue clips into one track padded to the video length and export it as mp3. Returns seconds."""
+    from pydub import AudioSegment
+    audio_segments = list(audio_segments)
+    # If video is longer than last subtitle, add trailing silence
+    video_duration = prev_end
+    vid_len = probe_duration(video_path)
+    if vid_len is not None:
+        video_duration = max(video_duration, vid_len)
+    if video_duration > prev_end:
+        gap_ms = int((video_duration - prev_end) * 1000)
+        if gap_ms > 0:
+            audio_segments.append(AudioSegment.silent(duration=gap_ms))
+            log.info("Added %.2f seconds of trailing silence to match video length", gap_ms/1000.0)
+
+    # Combine all audio segments into one track
+    if audio_segments:
+        full_audio = audio_segments[0]
+        for seg in audio_segments[1:]:
+            full_audio += seg
+    else:
+        full_audio = AudioSegment.silent(duration=int(video_duration * 1000))
+    full_audio.export(str(audio_path), format="mp3")
+    log.info("Narration audio saved to %s (%.2f seconds)", audio_path, len(full_audio) / 1000.0)
+    return len(full_audio) / 1000.0
+
+def mux_narration(video_path: pathlib.Path, audio_path: pathlib.Path, merged_path: pathlib.Path) -> str:
+    """Mux the narration with the video (video stream copied). Raises CalledProcessError on failure."""
+    ffmpeg_cmd = [
+        "ffmpeg", "-y",
+        "-i", str(video_path),
+        "-i", str(audio_path),
+        "-c:v", "copy",
+        "-c:a", "aac",
+        "-map", "0:v:0",
+        "-map", "1:a:0",
+        str(merged_path)
+    ]
+    return run_logged(ffmpeg_cmd, merged_path.parent, merged_path.parent / "render.log")
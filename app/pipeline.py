@@ -0,0 +1,289 @@
+"""The job pipeline: generate, critique, render with repairs, narrate, mux, publish."""
+import json, subprocess, pathlib, traceback, time
+from typing import List, Optional
+
+from fastapi.responses import JSONResponse
+
+from pydantic import ValidationError
+
+from app.core import (
+    GENERATE_STREAMING, OPENAI_MODEL, OPENAI_VOICE, OPENAI_VOICE_MODEL, RENDERS_DIR, job_log, log, set_job,
+    write_atomic,
+)
+from app.schemas import ManimPayload, SubtitleCue
+from app.media import build_narration_segments, mix_narration, mux_narration, write_vtt
+from app.index import JOB_INDEX, JobRecord
+from app.hls import HLSStreamer, NarrationPreview
+from app.artifacts import PUBLISHED_ARTIFACTS, finalize_job, published_result
+from app.store import STORE
+from app.prompts import CRITIQUE_REQUEST, REGENERATE_REQUEST, chat_completion, choose_prompt_variant, generate_messages
+from app.repair import render_with_repairs
+from app.stream import normalize_cues, stream_generate
+from app.speculate import note_generate_usage, race_candidates, speculative_candidates
+
+# ---------- Job pipeline ----------
+CHECKPOINT = "payload.json"  # the payload to render, written once generation is done
+
+def load_checkpoint(workdir: pathlib.Path) -> Optional[ManimPayload]:
+    try:
+        return ManimPayload.model_validate_json((workdir / CHECKPOINT).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+def run_job(prompt: str, job_id: str, stream: bool = False, created_at: Optional[float] = None):
+    """Run the whole pipeline for one job and record its outcome in JOBS and the job index."""
+    set_job(job_id, status="running")
+    rec = JobRecord(job_id, prompt)
+    if created_at is not None:  # queued job: the time it waited for a worker counts as its "queue" stage
+        rec.timings["queue"] = max(0.0, rec.created_at - created_at)
+        rec.created_at = created_at
+    JOB_INDEX.submit_start(rec)
+    try:
+        result = run_generate_job(prompt, job_id, stream=stream, rec=rec)
+    except Exception as e:
+        tb = traceback.format_exc()
+        log.error("Job %s crashed: %s\n%s", job_id, repr(e), tb)
+        result = JSONResponse({"error": f"Unhandled server error: {type(e).__name__}", "traceback": tb[:8000]}, status_code=500)
+    if isinstance(result, JSONResponse):
+        body = json.loads(result.body)
+        body.setdefault("stage", rec.current_stage)
+        result = JSONResponse(body, status_code=result.status_code)
+        set_job(job_id, status="error", result=body)
+        rec.finish("error", error_class=body.get("errorClass") or rec.current_stage, error=body.get("error"))
+    else:
+        set_job(job_id, status="done", result=result)
+        rec.finish("done")
+    JOB_INDEX.submit_finish(rec)
+    return result
+
+def parse_generated_payload(raw_text: str):
+    """ManimPayload from one generate answer (cue timings normalized), or the JSONResponse describing why not."""
+    try:
+        data = json.loads(raw_text)
+    except Exception as e:
+        log.error("Failed to parse JSON: %s", e)
+        return JSONResponse({"error": f"Failed to parse JSON: {e}", "raw": raw_text[:4000]}, status_code=500)
+
+    data["subtitle_cues"] = normalize_cues(data.get("subtitle_cues", []) or [])
+
+    # Now validate against the strict schema
+    try:
+        manim_payload = ManimPayload.model_validate(data)
+    except ValidationError as ve:
+        log.error("LLM JSON validation failed after normalization: %s", ve)
+        return JSONResponse({
+            "error": "LLM JSON validation failed after normalization",
+            "details": ve.errors(),
+            "raw": json.dumps(data)[:4000]
+        }, status_code=500)
+    # Unescape newline characters from JSON if present
+    manim_payload.code = manim_payload.code.replace("\\n", "\n")
+    return manim_payload
+
+def generate_payload(job_id: str, workdir: pathlib.Path, conversation: List[dict], rec: "JobRecord", on_cues):
+    """
+    Generate (k speculative candidates, or one streamed answer), critique and regenerate. Returns
+    the payload to render, or a JSONResponse, and the conversation ending with that payload's answer.
+    """
+    # --- OpenAI: Chat Completions with JSON MODE (stable) ---
+    rec.begin("generate")
+    k = speculative_candidates()
+    log.info("Calling OpenAI model=%s (%d candidate%s, %s prompt)", OPENAI_MODEL, k, "s" if k > 1 else "", rec.prompt_variant)
+    try:
+        if k == 1 and GENERATE_STREAMING:
+            started = time.perf_counter()
+            answer, chat = stream_generate(conversation, job_id, workdir, on_cues=on_cues)
+            rec.add_usage(chat, "generate", time.perf_counter() - started)
+            answers = [answer]
+        else:
+            chat = chat_completion(rec, "generate", conversation, response_format={"type": "json_object"},
+                                   **({"n": k} if k > 1 else {}))
+            answers = [choice.message.content or "" for choice in chat.choices]
+    except Exception as e:
+        tb = traceback.format_exc()
+        log.error("OpenAI request failed: %s\n%s", repr(e), tb)
+        return JSONResponse({"error": f"OpenAI request failed: {repr(e)}", "traceback": tb[:8000]}, status_code=500), conversation
+
+    note_generate_usage(chat, len(answers))
+    answers = [a.strip() for a in answers]
+    parsed = []
+    for raw_text in answers:
+        log.info("LLM returned %d chars of JSON", len(raw_text))
+        parsed.append(parse_generated_payload(raw_text))
+    candidates = [i for i, p in enumerate(parsed) if isinstance(p, ManimPayload)]
+    if not candidates:
+        return parsed[0], conversation
+    chosen = candidates[0]
+    winner = None
+    if len(candidates) > 1:
+        rec.begin("speculate")
+        winner = race_candidates(job_id, workdir, [parsed[i] for i in candidates])
+        if winner is not None:
+            chosen = candidates[winner]
+            log.info("Candidate %d of %d passed its dry run", winner, len(candidates))
+    manim_payload = parsed[chosen]
+    conversation.append({"role": "assistant", "content": answers[chosen]})
+
+    file_name = (manim_payload.file_name or "explainer.py").strip()
+    scene_name = manim_payload.scene_name.strip()
+    code_str = manim_payload.code
+    subtitle_cues = manim_payload.subtitle_cues
+
+    # --- Critique and regenerate loop ---
+    critique_text = ""
+    if winner is not None:
+        log.info("Skipping critique: the candidate already passed a dry run")
+    else:
+        rec.begin("critique")
+        log.info("Critiquing generated code with OpenAI")
+        critique_request = {"role": "user", "content": CRITIQUE_REQUEST}
+        try:
+            critique_chat = chat_completion(rec, "critique", conversation + [critique_request])
+        except Exception as e:
+            tb = traceback.format_exc()
+            log.error("OpenAI critique request failed: %s\n%s", repr(e), tb)
+            # If critique fails, skip regeneration
+        else:
+            critique_text = (critique_chat.choices[0].message.content or "").strip()
+            log.info("Critique text: %s", critique_text[:200].replace("\n", " "))
+
+    if critique_text:
+        regen_messages = conversation + [critique_request, {"role": "assistant", "content": critique_text},
+                                         {"role": "user", "content": REGENERATE_REQUEST}]
+        try:
+            regen_chat = chat_completion(rec, "regenerate", regen_messages, response_format={"type": "json_object"})
+        except Exception as e:
+            tb = traceback.format_exc()
+            log.error("OpenAI regeneration request failed: %s\n%s", repr(e), tb)
+        else:
+            new_raw = (regen_chat.choices[0].message.content or "").strip()
+            log.info("LLM improved JSON %d chars", len(new_raw))
+            if new_raw:
+                try:
+                    new_data = json.loads(new_raw)
+                except Exception as e_json:
+                    log.error("Failed to parse improved JSON: %s", e_json)
+                else:
+                    try:
+                        new_payload = ManimPayload.model_validate(new_data)
+                    except ValidationError as ve:
+                        log.error("Improved JSON validation failed: %s", ve)
+                    else:
+                        file_name = (new_payload.file_name or file_name).strip()
+                        scene_name = new_payload.scene_name.strip()
+                        code_str = new_payload.code
+                        subtitle_cues = new_payload.subtitle_cues
+                        code_str = code_str.replace("\\n", "\n")
+                        conversation = regen_messages + [{"role": "assistant", "content": new_raw}]
+    return ManimPayload(file_name=file_name, scene_name=scene_name, code=code_str, subtitle_cues=subtitle_cues), conversation
+
+def run_generate_job(prompt: str, job_id: str, stream: bool = False, rec: Optional["JobRecord"] = None):
+    """
+    The generate pipeline: LLM payload -> critique -> sanitize -> render -> narration -> mux.
+    Returns the /generate JSON body on success, or a JSONResponse describing the failure.
+    Stage timings and token usage are collected on rec.
+    """
+    rec = rec if rec is not None else JobRecord(job_id, prompt)
+    workdir = RENDERS_DIR / job_id
+    workdir.mkdir(parents=True, exist_ok=True)
+    log.info("Job %s workdir: %s", job_id, workdir)
+
+    tts_cache = {}  # cue text -> speech chunk, shared by the stream narration preview and the final mix
+    previews: List[NarrationPreview] = []  # background TTS threads; joined before tts_cache is used again
+
+    def new_streamer(cues: List[SubtitleCue]) -> Optional[HLSStreamer]:
+        if not stream:
+            return None
+        for p in previews:
+            p.join()
+        preview = NarrationPreview(cues, workdir, tts_cache)
+        preview.start()
+        previews.append(preview)
+        return HLSStreamer(job_id, workdir, preview, store=STORE)
+
+    variant = choose_prompt_variant()
+    rec.prompt_variant = variant
+    conversation = generate_messages(prompt, variant)
+
+    def cues_ready(raw_cues: list):
+        """Captions and narration prefetch for the cues of a still-streaming answer."""
+        try:
+            cues = [SubtitleCue.model_validate(c) for c in normalize_cues([dict(c) for c in raw_cues if isinstance(c, dict)])]
+        except (ValidationError, TypeError, ValueError) as e:
+            log.warning("Streamed subtitle_cues unusable; waiting for the full answer: %s", e)
+            return
+        write_vtt(workdir, cues)
+        prefetch = NarrationPreview(cues, workdir, tts_cache, export=False)
+        prefetch.start()
+        previews.append(prefetch)
+
+    payload = load_checkpoint(workdir)
+    if payload is not None:
+        job_log(workdir, f"resuming at the render from {CHECKPOINT} (job redelivered)")
+        conversation.append({"role": "assistant", "content": payload.model_dump_json()})
+    else:
+        payload, conversation = generate_payload(job_id, workdir, conversation, rec, cues_ready)
+        if isinstance(payload, JSONResponse):
+            return payload
+        write_atomic(workdir / CHECKPOINT, payload.model_dump_json())
+        STORE.put(job_id, CHECKPOINT, workdir / CHECKPOINT)  # a redelivery on another host resumes from it
+
+    # --- Validate -> render -> (classify -> repair -> validate -> render)* ---
+    result = render_with_repairs(job_id, workdir, conversation, payload, rec, new_streamer)
+    if isinstance(result, JSONResponse):
+        return result
+    file_name, scene_name, subtitle_cues = result.file_name, result.scene_name, result.subtitle_cues
+    py_path = workdir / file_name
+    mp4_path = workdir / "silent.mp4"  # manim output without narration; out.mp4 only appears at finalize
+
+    # If we reach here, the silent video should be at silent.mp4
+    # --- Automatic Speech Generation and Audio Muxing ---
+    rec.begin("tts")
+    log.info("Generating narration audio via OpenAI TTS (model=%s, voice=%s)", OPENAI_VOICE_MODEL, OPENAI_VOICE)
+    try:
+        from pydub import AudioSegment
+    except ImportError:
+        log.error("pydub is not installed. Please install pydub for audio generation.")
+        return JSONResponse({"error": "Audio generation failed", "details": "pydub not installed"}, status_code=500)
+
+    for p in previews:
+        p.join()
+    try:
+        audio_segments, prev_end = build_narration_segments(subtitle_cues, workdir, tts_cache)
+    except Exception as e:
+        log.error("OpenAI TTS generation failed: %s", e)
+        return JSONResponse({"error": "OpenAI TTS generation failed", "details": str(e)}, status_code=500)
+
+    audio_path = workdir / "narration.mp3"
+    mix_narration(audio_segments, prev_end, mp4_path, audio_path)
+
+    # Use ffmpeg to mux the narration audio with the video (copy video stream)
+    merged_path = workdir / "merged.mp4"
+    rec.begin("mux")
+    log.info("Muxing audio and video with ffmpeg")
+    try:
+        ffmpeg_output = mux_narration(mp4_path, audio_path, merged_path)
+        log.info("FFmpeg output: %s", ffmpeg_output[-200:] if ffmpeg_output else "(none)")
+    except subprocess.CalledProcessError as e:
+        ff_out = e.stdout or ""
+        log.error("FFmpeg mux failed:\n%s", ff_out)
+        return JSONResponse({"error": "Audio-video muxing failed", "details": ff_out[-8000:]}, status_code=500)
+    except Exception as e:
+        log.error("FFmpeg execution error: %s", e)
+        return JSONResponse({"error": "Audio-video muxing exception", "details": str(e)}, status_code=500)
+
+    rec.begin("finalize")
+    manifest = finalize_job(workdir, merged_path)
+    rec.begin("upload")
+    try:
+        manifest = STORE.publish(workdir, manifest)
+    except Exception as e:
+        log.error("Artifact upload failed for %s: %s\n%s", job_id, e, traceback.format_exc())
+        return JSONResponse({"error": "Artifact upload failed", "details": str(e)}, status_code=500)
+    rec.video_seconds = manifest.get("duration")
+    rec.thumbnail = "thumb.jpg" if "thumb.jpg" in manifest["artifacts"] else None
+    rec.artifacts = {"code": str(py_path.name), "log": "render.log",
+                     **({"jobLog": "job.log"} if (workdir / "job.log").is_file() else {}), **{name: name for name in PUBLISHED_ARTIFACTS if name in manifest["artifacts"]}}
+
+    # Return URLs for video with audio and subtitles
+    return published_result(workdir)
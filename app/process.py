@@ -0,0 +1,379 @@
+"""Supervised child processes: bounded output capture, resource limits and stall detection."""
+import os, subprocess, uuid, pathlib, threading, time, codecs, collections, re
+from typing import List, Optional, Tuple
+
+try:
+    import resource, signal  # POSIX only; renders run without rlimits elsewhere
+except ImportError:
+    resource = signal = None
+
+from app.core import (
+    RENDER_ADDRESS_SPACE_FACTOR, RENDER_CGROUP_PARENT, RENDER_CPU_QUOTA, RENDER_CPU_SECONDS, RENDER_MEMORY_MAX_MB,
+    RENDER_PIDS_MAX, RENDER_STALL_SECONDS, RENDER_STALL_STARTUP_SECONDS, log,
+)
+
+# ---------- Process supervision ----------
+# Child processes (manim, ffmpeg) run under supervise(): their combined output is decoded as it
+# arrives, handed to progress listeners and written line by line to the job's log file, and only a
+# bounded tail stays in memory for error reports, so memory per job is constant however long a
+# render runs. Progress-bar redraws (\r) collapse to their final state, and known noise (MiKTeX's
+# repeated "security risk" and update-check warnings) is counted instead of logged.
+PROCESS_TAIL_LINES = int(os.getenv("PROCESS_TAIL_LINES", "400"))
+PROCESS_MAX_LINE = 2000  # characters kept per line
+SUPERVISE_POLL_SECONDS = 1.0
+PROCESS_NOISE_RE = re.compile(r"security risk|have not checked for (?:MiKTeX )?updates|Major issue: So far")
+
+class OutputSink:
+    """Line-oriented sink for one process's output: an appended log file, listeners and a bounded tail."""
+
+    def __init__(self, log_path: Optional[pathlib.Path] = None, listeners=(), header: Optional[str] = None):
+        self.tail = collections.deque(maxlen=PROCESS_TAIL_LINES)
+        self.listeners = list(listeners)
+        self.noise = 0
+        self._carry = ""
+        self._file = None
+        if log_path is not None:
+            log_path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(log_path, "a", encoding="utf-8", buffering=1)  # line-buffered: the log grows as it runs
+            if header:
+                self._file.write(header + "\n")
+
+    def feed(self, text: str) -> None:
+        for listener in self.listeners:
+            listener(text)
+        lines = (self._carry + text).split("\n")
+        self._carry = lines.pop()
+        if len(self._carry) > 4 * PROCESS_MAX_LINE:  # a progress bar redrawn without newlines
+            self._carry = self._carry.rsplit("\r", 1)[-1][-PROCESS_MAX_LINE:]
+        for line in lines:
+            self._line(line)
+
+    def _line(self, line: str) -> None:
+        line = line.rstrip("\r").rsplit("\r", 1)[-1][:PROCESS_MAX_LINE]  # what a terminal shows after redraws
+        if PROCESS_NOISE_RE.search(line):
+            self.noise += 1
+            return
+        self.tail.append(line)
+        if self._file is not None:
+            self._file.write(line + "\n")
+
+    def close(self) -> None:
+        if self._carry:
+            self._line(self._carry)
+            self._carry = ""
+        if self._file is not None:
+            if self.noise:
+                self._file.write(f"[{self.noise} noise lines filtered]\n")
+            self._file.close()
+            self._file = None
+
+    def text(self) -> str:
+        return "".join(line + "\n" for line in self.tail)
+
+def append_log(path: pathlib.Path, text: str) -> None:
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(text)
+
+def read_log_tail(path: pathlib.Path, limit: int = 4000) -> str:
+    """Last `limit` bytes of a log file (without reading all of it)."""
+    try:
+        with open(path, "rb") as f:
+            f.seek(max(0, f.seek(0, os.SEEK_END) - limit))
+            return f.read().decode("utf-8", errors="ignore")
+    except OSError:
+        return ""
+
+def _pump_output(stream, sink: OutputSink) -> None:
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for chunk in iter(lambda: stream.read1(65536), b""):
+        sink.feed(decoder.decode(chunk))
+
+def kill_process_tree(proc: subprocess.Popen) -> None:
+    """Kill a supervised process and the rest of its session (it runs with start_new_session)."""
+    if hasattr(os, "killpg"):
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except OSError:
+            pass
+    proc.kill()
+
+def supervise(cmd: List[str], cwd: pathlib.Path, timeout: Optional[float], sink: OutputSink,
+              on_start=None, check=None, kill=kill_process_tree) -> Tuple[int, Optional[str]]:
+    """
+    Run cmd with its combined output streamed into sink. Returns (exit code, abort reason): check()
+    is polled every SUPERVISE_POLL_SECONDS and a non-None reason kills the process tree.
+    Raises subprocess.TimeoutExpired (output: the tail) once timeout seconds have passed.
+    """
+    proc = subprocess.Popen(cmd, cwd=str(cwd), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True)
+    reason, timed_out = None, False
+    try:
+        reader = threading.Thread(target=_pump_output, args=(proc.stdout, sink), daemon=True, name="proc-output")
+        reader.start()
+        if on_start is not None:
+            on_start(proc.pid)
+        deadline = time.monotonic() + timeout if timeout else None
+        while True:
+            try:
+                proc.wait(timeout=SUPERVISE_POLL_SECONDS)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            reason = check() if check is not None else None
+            timed_out = reason is None and deadline is not None and time.monotonic() >= deadline
+            if reason is not None or timed_out:
+                kill(proc)
+                proc.wait()
+                break
+        reader.join(10)
+        if reader.is_alive():  # a leftover child still holds the pipe open
+            kill(proc)
+            reader.join()
+        proc.stdout.close()
+    finally:
+        if proc.returncode is None:
+            kill(proc)
+            proc.wait()
+        sink.close()
+    if timed_out:
+        raise subprocess.TimeoutExpired(cmd, timeout, output=sink.text())
+    return proc.returncode, reason
+
+def run_logged(cmd: List[str], cwd: pathlib.Path, log_path: Optional[pathlib.Path] = None,
+               timeout: Optional[float] = None) -> str:
+    """supervise() for a short tool run (ffmpeg): returns the output tail, raises CalledProcessError like check=True."""
+    sink = OutputSink(log_path, header=f"[{pathlib.Path(cmd[0]).name}] {' '.join(cmd)}" if log_path else None)
+    returncode, _ = supervise(cmd, cwd, timeout, sink)
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, output=sink.text())
+    return sink.text()
+
+# ---------- Render resource limits ----------
+# Every manim process tree runs under its own caps so one runaway scene cannot starve the host.
+# With RENDER_CGROUP_PARENT set to a delegated cgroup v2 directory (memory, cpu and pids
+# controllers available), each render gets a leaf cgroup there with memory.max, cpu.max and
+# pids.max; leftovers are killed through cgroup.kill. Without it, Linux rlimits are applied to the
+# manim process and inherited by its latex/ffmpeg children: address space (RENDER_MEMORY_MAX_MB x
+# RENDER_ADDRESS_SPACE_FACTOR, since numpy/cairo map far more than they touch) and CPU seconds.
+# A breach raises RenderResourceExceeded, a CalledProcessError, so the repair loop sees it.
+class RenderResourceExceeded(subprocess.CalledProcessError):
+    """A render killed (or starved) by its resource caps: resource is "memory", "cpu" or "pids"."""
+
+    def __init__(self, resource: str, detail: str, returncode: int, cmd, output: str):
+        super().__init__(returncode, cmd, output=output)
+        self.resource = resource
+        self.detail = detail
+
+    def __str__(self):
+        return f"Render exceeded its {self.resource} limit: {self.detail}"
+
+def _read_counters(path: pathlib.Path) -> dict:
+    """A cgroup "key value" file (memory.events, pids.events) as a dict; empty if unreadable."""
+    try:
+        return {k: int(v) for k, v in (line.split() for line in path.read_text().splitlines() if line.strip())}
+    except (OSError, ValueError):
+        return {}
+
+def _limit_descriptions() -> dict:
+    return {
+        "memory": f"{RENDER_MEMORY_MAX_MB} MB",
+        "cpu": f"{RENDER_CPU_SECONDS:g} CPU seconds" if RENDER_CPU_SECONDS > 0 else f"{RENDER_CPU_QUOTA:g} cores",
+        "pids": f"{RENDER_PIDS_MAX} processes",
+    }
+
+class RenderLimits:
+    """Resource caps for one manim process tree: a leaf cgroup when configured, rlimits otherwise."""
+
+    def __init__(self, name: str):
+        self.cgroup: Optional[pathlib.Path] = None
+        if RENDER_CGROUP_PARENT:
+            self.cgroup = self._make_cgroup(pathlib.Path(RENDER_CGROUP_PARENT) / f"render-{name}-{uuid.uuid4().hex[:8]}")
+
+    @staticmethod
+    def _make_cgroup(path: pathlib.Path) -> Optional[pathlib.Path]:
+        try:
+            (path.parent / "cgroup.subtree_control").write_text("+memory +cpu +pids")
+        except OSError:
+            pass  # already enabled, or left to whoever delegated the parent
+        try:
+            path.mkdir()
+        except OSError as e:
+            log.warning("Render cgroup %s not created (%s); using rlimits", path, e)
+            return None
+        settings = {"memory.swap.max": "0", "pids.max": str(RENDER_PIDS_MAX) if RENDER_PIDS_MAX > 0 else "max"}
+        if RENDER_MEMORY_MAX_MB > 0:
+            settings["memory.max"] = str(RENDER_MEMORY_MAX_MB * 1024 * 1024)
+        if RENDER_CPU_QUOTA > 0:
+            settings["cpu.max"] = f"{int(RENDER_CPU_QUOTA * 100000)} 100000"
+        for name, value in settings.items():
+            try:
+                (path / name).write_text(value)
+            except OSError as e:
+                log.warning("Render cgroup %s: cannot set %s=%s (%s)", path.name, name, value, e)
+        return path
+
+    def attach(self, pid: int) -> None:
+        """Put a just-started manim process under the caps (its children inherit them)."""
+        if self.cgroup is not None:
+            try:
+                (self.cgroup / "cgroup.procs").write_text(str(pid))
+            except OSError as e:
+                log.warning("Cannot move pid %d into %s (%s); using rlimits", pid, self.cgroup, e)
+                self.release()
+        if resource is None or not hasattr(resource, "prlimit"):
+            return  # Windows / non-Linux: only the timeout applies
+        try:
+            if self.cgroup is None and RENDER_MEMORY_MAX_MB > 0:
+                limit = int(RENDER_MEMORY_MAX_MB * RENDER_ADDRESS_SPACE_FACTOR * 1024 * 1024)
+                resource.prlimit(pid, resource.RLIMIT_AS, (limit, limit))
+            if RENDER_CPU_SECONDS > 0:
+                soft = int(RENDER_CPU_SECONDS)
+                resource.prlimit(pid, resource.RLIMIT_CPU, (soft, soft + 5))  # SIGXCPU, then SIGKILL
+        except (OSError, ValueError) as e:
+            log.warning("rlimits for pid %d not applied: %s", pid, e)
+
+    def breach(self, returncode: int, output: str) -> Optional[str]:
+        """Which cap killed the render, if any."""
+        if self.cgroup is not None:
+            if _read_counters(self.cgroup / "memory.events").get("oom_kill", 0) > 0:
+                return "memory"
+            if _read_counters(self.cgroup / "pids.events").get("max", 0) > 0:
+                return "pids"
+        if RENDER_CPU_SECONDS > 0 and signal is not None and returncode == -signal.SIGXCPU:
+            return "cpu"
+        tail = (output or "")[-4000:]
+        if "MemoryError" in tail or "std::bad_alloc" in tail or "Cannot allocate memory" in tail:
+            return "memory"
+        if "Resource temporarily unavailable" in tail and "fork" in tail:
+            return "pids"
+        return None
+
+    def kill(self, proc: subprocess.Popen) -> None:
+        """Kill the whole process tree of a render that is still running (manim, latex, ffmpeg)."""
+        if self.cgroup is not None:
+            try:
+                (self.cgroup / "cgroup.kill").write_text("1")
+            except OSError:
+                pass
+        kill_process_tree(proc)
+
+    def release(self) -> None:
+        """Kill whatever is left in the leaf cgroup and remove it."""
+        if self.cgroup is not None:
+            try:
+                (self.cgroup / "cgroup.kill").write_text("1")
+            except OSError:
+                pass
+            for _ in range(20):
+                try:
+                    self.cgroup.rmdir()
+                    break
+                except OSError:
+                    time.sleep(0.05)
+            else:
+                log.warning("Render cgroup %s not removed", self.cgroup)
+            self.cgroup = None
+
+# ---------- Render stall detection ----------
+# A scene stuck in an updater loop would otherwise hold its slot until the hard timeout. While
+# manim runs, its output is parsed for progress (animation index and frame counter of the
+# progress bar, partial movie / Tex / file-ready messages) and its session's processes are sampled
+# from /proc: a new process (latex, dvisvgm, ffmpeg) also counts as progress. A render without
+# progress for RENDER_STALL_SECONDS (RENDER_STALL_STARTUP_SECONDS before its first frame, which
+# covers imports and Tex compilation) is killed and raised as RenderStalled.
+MANIM_PROGRESS_RE = re.compile(r"Animation (\d+)\b[^|\r\n]*\|[^|\r\n]*\|\s*(\d+)/(\d+)")
+MANIM_PHASE_RE = re.compile(r"Partial movie file written|Writing .* to |Combining to Movie file|File ready at|Rendered \w+")
+
+class RenderStalled(subprocess.CalledProcessError):
+    """A render killed for making no progress; detail says where it stopped and whether it was busy."""
+
+    def __init__(self, detail: str, returncode: int, cmd, output: str):
+        super().__init__(returncode, cmd, output=output)
+        self.detail = detail
+
+    def __str__(self):
+        return f"Render stalled: {self.detail}"
+
+def _session_cpu(session: int) -> Tuple[Optional[float], set]:
+    """(CPU seconds used, live pids) of the processes in a session; (None, set()) without /proc."""
+    if not os.path.isdir("/proc"):
+        return None, set()
+    tick = os.sysconf("SC_CLK_TCK")
+    total, pids = 0.0, set()
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry.name}/stat", "rb") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        fields = stat[stat.rfind(b")") + 2:].split()  # state ppid pgrp session ... utime stime cutime cstime
+        if len(fields) < 15 or int(fields[3]) != session:
+            continue
+        pids.add(int(entry.name))
+        total += sum(int(x) for x in fields[11:15]) / tick
+    return total, pids
+
+class StallWatch:
+    """Progress tracker for one manim run: a listener on its output, polled by supervise()."""
+
+    def __init__(self):
+        self.pid: Optional[int] = None
+        self.animation: Optional[int] = None
+        self.frame: Optional[Tuple[int, int]] = None
+        self.last_progress = time.monotonic()
+        self.cpu_mark: Tuple[float, Optional[float]] = (self.last_progress, None)
+        self.seen_pids = set()
+        self._carry = ""
+        self._lock = threading.Lock()
+
+    def attach(self, pid: int) -> None:
+        with self._lock:
+            self.pid = pid
+            self.seen_pids = {pid}
+            self.last_progress = time.monotonic()
+
+    def feed(self, text: str) -> None:
+        parts = (self._carry + text).replace("\r", "\n").split("\n")
+        self._carry = parts.pop()[-500:]
+        progressed = False
+        for line in parts + [self._carry]:  # the carry is the progress bar being redrawn
+            m = MANIM_PROGRESS_RE.search(line)
+            if m:
+                key = (int(m.group(1)), (int(m.group(2)), int(m.group(3))))
+                if key != (self.animation, self.frame):
+                    self.animation, self.frame = key
+                    progressed = True
+            elif MANIM_PHASE_RE.search(line):
+                progressed = True
+        if progressed:
+            with self._lock:
+                self.last_progress = time.monotonic()
+
+    def check(self) -> Optional[str]:
+        """A description of the stall once the render has made no progress for its window; None otherwise."""
+        if self.pid is None:
+            return None
+        cpu, pids = _session_cpu(self.pid)
+        now = time.monotonic()
+        with self._lock:
+            if pids - self.seen_pids:
+                self.seen_pids |= pids
+                self.last_progress = now
+            if self.cpu_mark[0] < self.last_progress or self.cpu_mark[1] is None:
+                self.cpu_mark = (now, cpu)  # CPU baseline restarts with every progress
+            idle = now - self.last_progress
+        window = RENDER_STALL_SECONDS if self.frame is not None else RENDER_STALL_STARTUP_SECONDS
+        if window <= 0 or idle < window:
+            return None
+        where = (f"animation {self.animation}, frame {self.frame[0]}/{self.frame[1]}" if self.frame is not None
+                 else "before the first animation")
+        detail = f"no progress for {idle:.0f}s ({where})"
+        if cpu is not None and self.cpu_mark[1] is not None and now > self.cpu_mark[0]:
+            usage = (cpu - self.cpu_mark[1]) / (now - self.cpu_mark[0])
+            state = "busy: likely an infinite loop or a runaway computation" if usage > 0.5 else "idle: blocked waiting"
+            detail += f", {usage:.0%} CPU ({state})"
+        return detail
+
+class RenderCancelled(subprocess.CalledProcessError):
+    """A manim run killed because its result is no longer needed."""
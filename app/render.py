@@ -0,0 +1,464 @@
+"""Rendering: the render cache, supervised manim runs and section-parallel rendering."""
+import os, json, textwrap, subprocess, uuid, pathlib, ast, shutil, threading, time, hashlib
+from typing import List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core import (
+    MANIM_QUALITY_FLAG, RENDERS_DIR, RENDER_CACHE_MAX_BYTES, RENDER_SECTION_WORKERS, count, log, write_atomic,
+)
+from app.schemas import SubtitleCue
+from app.media import probe_duration
+from app.process import (
+    OutputSink, RenderCancelled, RenderLimits, RenderResourceExceeded, RenderStalled, StallWatch,
+    _limit_descriptions, append_log, run_logged, supervise,
+)
+from app.scheduler import (
+    RENDER_COST_MODEL, RENDER_SCHEDULER, UPDATER_CALLS, _call_name, _call_seconds, _is_self_call, render_features,
+)
+from app.index import JobRecord
+from app.toolchain import toolchain
+from app.hls import HLSStreamer
+
+# ---------- Render cache ----------
+# The same sanitized code renders to the same silent video, and it does get rendered again: on
+# retries, repeated prompts and critiques that return the code unchanged. Finished renders are
+# kept under _render_cache/<key[:2]>/<key>.mp4 (+ .json with the duration), keyed by a hash of
+# (code, scene name, manim version, quality flag); render_scene() consults it before launching
+# manim, and concurrent renders of one key wait for the first instead of rendering twice. The manim
+# version is the toolchain probe's; while it is unknown renders bypass the cache.
+RENDER_CACHE_DIR = RENDERS_DIR / "_render_cache"
+RENDER_CACHE_VERSION = "1"  # bump when render output changes for the same code
+RENDER_CACHE_LOCK = threading.Lock()
+RENDER_CACHE_INFLIGHT = {}  # key -> Event set when its render finishes
+def render_cache_key(code: str, scene_name: str) -> Optional[str]:
+    """The cache key of a render, or None when the toolchain probe has no manim version."""
+    version = toolchain().get("tools", {}).get("manim", {}).get("version")
+    if not version:
+        return None
+    h = hashlib.sha256()
+    for part in (RENDER_CACHE_VERSION, version, MANIM_QUALITY_FLAG, scene_name, code):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def _link_or_copy(src: pathlib.Path, dst: pathlib.Path) -> None:
+    """Hard-link src to dst (atomically replacing dst); copies where links are unsupported."""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f".{dst.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copy2(src, tmp)
+    os.replace(tmp, dst)
+
+def render_cache_get(key: str) -> Optional[Tuple[pathlib.Path, Optional[float]]]:
+    """(cached mp4, duration) for key, or None. A hit refreshes the entry's LRU time."""
+    mp4 = RENDER_CACHE_DIR / key[:2] / f"{key}.mp4"
+    try:
+        meta = json.loads(mp4.with_suffix(".json").read_text(encoding="utf-8"))
+        os.utime(mp4)
+    except (OSError, ValueError):
+        return None
+    return mp4, meta.get("duration")
+
+def render_cache_put(key: str, mp4: pathlib.Path) -> None:
+    entry = RENDER_CACHE_DIR / key[:2] / f"{key}.mp4"
+    try:
+        _link_or_copy(mp4, entry)
+        write_atomic(entry.with_suffix(".json"), json.dumps({"duration": probe_duration(entry), "createdAt": time.time()}))
+    except OSError as e:
+        log.warning("Render cache store of %s skipped: %s", key[:12], e)
+        return
+    evict_render_cache()
+
+def render_cache_usage() -> Tuple[int, int]:
+    """(entries, bytes) currently in the render cache."""
+    sizes = [p.stat().st_size for p in RENDER_CACHE_DIR.glob("*/*.mp4")] if RENDER_CACHE_DIR.is_dir() else []
+    return len(sizes), sum(sizes)
+
+def evict_render_cache() -> int:
+    """Drop least recently used entries until the cache fits RENDER_CACHE_MAX_BYTES. Returns bytes freed."""
+    entries = []
+    for mp4 in RENDER_CACHE_DIR.glob("*/*.mp4"):
+        try:
+            st = mp4.stat()
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, mp4))
+    total = sum(size for _, size, _ in entries)
+    freed = 0
+    for _, size, mp4 in sorted(entries):
+        if total - freed <= RENDER_CACHE_MAX_BYTES:
+            break
+        mp4.with_suffix(".json").unlink(missing_ok=True)
+        mp4.unlink(missing_ok=True)
+        freed += size
+        count("render_cache_evictions")
+    return freed
+
+def _use_cached_render(workdir: pathlib.Path, module: str, scene_name: str, cached: pathlib.Path,
+                       streamer: Optional["HLSStreamer"]) -> pathlib.Path:
+    """Link a cached render into workdir as manim would have written it; a streamer gets it as one segment."""
+    root = workdir / "videos" / module
+    if streamer is not None:
+        streamer.watch([root])
+    out = root / "cached" / "out.mp4"
+    try:
+        if streamer is not None:
+            _link_or_copy(cached, root / "cached" / "partial_movie_files" / scene_name / "00000.mp4")
+        _link_or_copy(cached, out)
+    finally:
+        if streamer is not None:
+            streamer.close(complete=out.exists())
+    return out
+
+# ---------- Rendering ----------
+def manim_cmd(file_name: str, scene_name: str, media_dir: str = ".", dry_run: bool = False) -> List[str]:
+    return [
+        "manim",
+        MANIM_QUALITY_FLAG,
+        "--disable_caching",
+        *(["--dry_run"] if dry_run else []),
+        "--media_dir", media_dir,
+        "--output_file", "out",
+        str(pathlib.Path(file_name).name),
+        scene_name,
+    ]
+
+def run_manim(workdir: pathlib.Path, file_name: str, scene_name: str, timeout: float, media_dir: str = ".",
+              log_path: Optional[pathlib.Path] = None, dry_run: bool = False,
+              cancel: Optional[threading.Event] = None) -> str:
+    """
+    Run manim for one scene file inside workdir. Its output is appended to log_path (default
+    workdir/render.log) as it streams; the return value is the output tail.
+    Raises subprocess.CalledProcessError / subprocess.TimeoutExpired like subprocess.run(check=True);
+    RenderResourceExceeded when the render hit one of its resource caps, RenderStalled when it
+    stopped making progress, RenderCancelled when cancel was set while it ran.
+    """
+    cmd = manim_cmd(file_name, scene_name, media_dir, dry_run)
+    log.info("Running Manim: %s", " ".join(cmd))
+    log_path = log_path or workdir / "render.log"
+    limits = RenderLimits(workdir.name)
+    watch = StallWatch()
+    sink = OutputSink(log_path, listeners=[watch.feed], header=f"[manim {time.strftime('%H:%M:%S')}] {' '.join(cmd)}")
+
+    def started(pid: int):
+        limits.attach(pid)
+        watch.attach(pid)
+
+    def check() -> Optional[str]:
+        if cancel is not None and cancel.is_set():
+            return "cancelled"
+        return watch.check()
+
+    try:
+        returncode, stalled = supervise(cmd, workdir, timeout, sink, on_start=started, check=check, kill=limits.kill)
+        breach = limits.breach(returncode, sink.text()) if returncode != 0 and stalled is None else None
+    finally:
+        limits.release()
+    out = sink.text()
+    if stalled == "cancelled":
+        raise RenderCancelled(returncode, cmd, out)
+    if stalled is not None:
+        count("render_stalls")
+        log.error("Manim stalled in %s: %s", workdir.name, stalled)
+        note = f"[stalled] render killed: {stalled}\n"
+        append_log(log_path, note)
+        raise RenderStalled(stalled, returncode, cmd, out + note)
+    if breach is not None:
+        detail = _limit_descriptions()[breach]
+        count("render_resource_exceeded")
+        log.error("Manim exceeded its %s limit (%s) in %s", breach, detail, workdir.name)
+        note = f"[resource exceeded] render killed at its {breach} limit ({detail})\n"
+        append_log(log_path, note)
+        raise RenderResourceExceeded(breach, detail, returncode, cmd, out + note)
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, output=out)
+    return out
+
+def find_rendered_mp4(media_root: pathlib.Path, module_name: str) -> Optional[pathlib.Path]:
+    candidates = list((media_root / "media" / "videos" / module_name).rglob("out.mp4"))
+    if not candidates:
+        candidates = list((media_root / "videos" / module_name).rglob("out.mp4"))
+    if not candidates:
+        candidates = list(media_root.rglob("out.mp4"))
+    if not candidates:
+        return None
+    return max(candidates, key=lambda p: p.stat().st_mtime)
+
+def render_scene(workdir: pathlib.Path, file_name: str, scene_name: str, timeout: float,
+                 cues: Optional[List["SubtitleCue"]] = None,
+                 streamer: Optional["HLSStreamer"] = None,
+                 rec: Optional["JobRecord"] = None) -> Tuple[str, Optional[pathlib.Path]]:
+    """
+    Render scene_name from workdir/file_name. Returns (manim output, rendered mp4 or None).
+    Uses section-parallel rendering when RENDER_SECTION_WORKERS > 1 and the scene can be split;
+    any problem there falls back to one sequential manim run.
+    With a streamer, finished partial movies are published as HLS segments while manim runs.
+    Identical code is rendered once: later calls are served from the render cache.
+    Renders wait for RENDER_SCHEDULER slots, one per manim process they run at once; each render
+    is logged on rec for the cost model.
+    """
+    module = pathlib.Path(file_name).stem
+    code = (workdir / file_name).read_text(encoding="utf-8")
+    key = render_cache_key(code, scene_name) if RENDER_CACHE_MAX_BYTES > 0 else None
+    if key is None:
+        return _render_scene_scheduled(workdir, file_name, scene_name, timeout, cues, streamer, code, rec)
+    with RENDER_CACHE_LOCK:
+        leader = RENDER_CACHE_INFLIGHT.get(key)
+        if leader is None:
+            RENDER_CACHE_INFLIGHT[key] = done = threading.Event()
+    if leader is not None:
+        log.info("Render of identical code already running; waiting for it (key %s)", key[:12])
+        leader.wait(timeout)
+    try:
+        hit = render_cache_get(key)
+        if hit is not None:
+            count("render_cache_hits")
+            log.info("Render cache hit %s (%.1fs video)", key[:12], hit[1] or 0.0)
+            note = f"[render cache] reused render {key}\n"
+            append_log(workdir / "render.log", note)
+            return note, _use_cached_render(workdir, module, scene_name, hit[0], streamer)
+        count("render_cache_misses")
+        out, mp4 = _render_scene_scheduled(workdir, file_name, scene_name, timeout, cues, streamer, code, rec)
+        if mp4 is not None:
+            render_cache_put(key, mp4)
+        return out, mp4
+    finally:
+        if leader is None:
+            with RENDER_CACHE_LOCK:
+                RENDER_CACHE_INFLIGHT.pop(key, None)
+            done.set()
+
+def _render_scene_scheduled(workdir: pathlib.Path, file_name: str, scene_name: str, timeout: float,
+                            cues: Optional[List["SubtitleCue"]], streamer: Optional["HLSStreamer"],
+                            code: str, rec: Optional["JobRecord"]) -> Tuple[str, Optional[pathlib.Path]]:
+    features = render_features(code, scene_name)
+    predicted = RENDER_COST_MODEL.predict(features)
+    n_sections = 0
+    if RENDER_SECTION_WORKERS > 1:
+        try:
+            n_sections = prepare_sections(workdir, file_name, scene_name, cues or [])
+        except Exception as e:
+            log.warning("Section split failed, rendering sequentially: %s", e)
+    # One slot per manim process: a split render holds as many as it runs sections at once
+    width = min(n_sections, RENDER_SECTION_WORKERS) if n_sections >= 2 else 1
+    with RENDER_SCHEDULER.slot(workdir.name, predicted, width) as ticket:
+        started = time.perf_counter()
+        ok = False
+        try:
+            out, mp4 = _render_scene_uncached(workdir, file_name, scene_name, timeout, streamer, n_sections, ticket["width"])
+            ok = mp4 is not None
+            return out, mp4
+        finally:
+            seconds = time.perf_counter() - started
+            log.info("Render of %s took %.1fs (predicted %.1fs)", scene_name, seconds, predicted)
+            if rec is not None:
+                rec.renders.append({"features": features, "predicted": round(predicted, 3),
+                                    "seconds": round(seconds, 3), "ok": ok})
+                RENDER_COST_MODEL.logged()
+
+def _render_scene_uncached(workdir: pathlib.Path, file_name: str, scene_name: str, timeout: float,
+                           streamer: Optional["HLSStreamer"], n_sections: int = 0,
+                           workers: int = 1) -> Tuple[str, Optional[pathlib.Path]]:
+    """One manim run, or n_sections (from prepare_sections) run `workers` at a time."""
+    module = pathlib.Path(file_name).stem
+    if n_sections >= 2 and workers > 1:
+        try:
+            result = render_sections_parallel(workdir, file_name, scene_name, timeout, n_sections, workers, streamer)
+        except Exception as e:
+            log.warning("Section-parallel render failed, falling back to sequential: %s", e)
+            result = None
+        if result is not None:
+            return result
+    if streamer is not None:
+        streamer.watch([workdir / "videos" / module])
+    ok = False
+    try:
+        out = run_manim(workdir, file_name, scene_name, timeout)
+        ok = True
+    finally:
+        if streamer is not None:
+            streamer.close(complete=ok)
+    return out, find_rendered_mp4(workdir, module)
+
+# ---------- Section-parallel rendering ----------
+# Each section k is rendered by a small driver module that subclasses the generated scene and
+# marks every other section with skip_animations=True. Skipped sections still run construct(),
+# so mobjects built and transformed there are in place when section k starts; only its own
+# animations are written as partial movies. Skipping is not a faithful replay, though: manim
+# advances each skipped animation in a single step, so updaters that integrate dt see one large
+# step instead of one per frame and can start section k in a different state. Scenes with
+# add_updater/always_redraw (UPDATER_CALLS) are therefore rendered sequentially. The per-section
+# movies are concatenated with the same stream-copy concat manim itself uses.
+SECTION_DRIVER_TEMPLATE = textwrap.dedent("""\
+    import os, sys
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from {module} import *
+    from {module} import {scene} as _SectionBase
+
+    _TARGET_SECTION = {index}
+
+
+    class {scene}(_SectionBase):
+        _section_counter = 0
+
+        def setup(self):
+            super().setup()
+            self.renderer.file_writer.sections[-1].skip_animations = _TARGET_SECTION != 0
+
+        def next_section(self, name="unnamed", section_type=DefaultSectionType.NORMAL, skip_animations=False):
+            self._section_counter += 1
+            super().next_section(name, section_type, skip_animations=self._section_counter != _TARGET_SECTION)
+""")
+
+def _find_construct(tree: ast.Module, scene_name: str) -> Optional[ast.FunctionDef]:
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and node.name == scene_name:
+            for item in node.body:
+                if isinstance(item, ast.FunctionDef) and item.name == "construct":
+                    return item
+    return None
+
+def _estimated_stmt_seconds(stmt: ast.stmt) -> float:
+    """Rough static run time of one statement: run_time=/wait() literals, 1s otherwise."""
+    return sum(_call_seconds(node) or 0.0 for node in ast.walk(stmt))
+
+def count_scene_sections(code: str, scene_name: str) -> int:
+    """
+    Number of sections the scene will produce, or 0 if it cannot be split safely
+    (next_section() called anywhere other than directly in construct's top-level body).
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return 0
+    construct = _find_construct(tree, scene_name)
+    if construct is None:
+        return 0
+    top_level = [st for st in construct.body
+                 if isinstance(st, ast.Expr) and _is_self_call(st.value, "next_section")]
+    total = sum(1 for node in ast.walk(tree) if _is_self_call(node, "next_section"))
+    if total != len(top_level):
+        return 0
+    return len(top_level) + 1
+
+def insert_section_breaks(code: str, scene_name: str, cues: List["SubtitleCue"], n_sections: int) -> str:
+    """
+    Insert self.next_section() before top-level play/wait statements of construct(), at the
+    statements closest to subtitle-cue starts that split the estimated runtime into n_sections.
+    Only statements that begin their own line are candidates, since the break is a new line.
+    """
+    if n_sections < 2:
+        return code
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return code
+    construct = _find_construct(tree, scene_name)
+    if construct is None:
+        return code
+    lines = code.split("\n")
+    # (start time, statement) for every top-level play/wait that starts its line: the only places we cut
+    boundaries = []
+    t = 0.0
+    for st in construct.body:
+        line = lines[st.lineno - 1]
+        starts_line = st.col_offset == len(line) - len(line.lstrip())
+        if starts_line and isinstance(st, ast.Expr) and (_is_self_call(st.value, "play") or _is_self_call(st.value, "wait")):
+            boundaries.append((t, st))
+        t += _estimated_stmt_seconds(st)
+    total = t
+    if total <= 0 or len(boundaries) < 2:
+        return code
+    cue_starts = sorted(float(c.start) for c in cues) or [total * k / n_sections for k in range(1, n_sections)]
+    cut_lines = set()
+    for k in range(1, n_sections):
+        target = total * k / n_sections
+        beat = min(cue_starts, key=lambda c: abs(c - target))
+        start, st = min(boundaries[1:], key=lambda b: abs(b[0] - beat))
+        cut_lines.add(st.lineno)
+    for lineno in sorted(cut_lines, reverse=True):
+        line = lines[lineno - 1]
+        indent = line[:len(line) - len(line.lstrip())]
+        lines.insert(lineno - 1, f"{indent}self.next_section()")
+    return "\n".join(lines)
+
+def uses_updaters(code: str) -> bool:
+    """Whether code calls add_updater/always_redraw anywhere (or does not parse, to be safe)."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return True
+    return any(isinstance(n, ast.Call) and _call_name(n) in UPDATER_CALLS for n in ast.walk(tree))
+
+def prepare_sections(workdir: pathlib.Path, file_name: str, scene_name: str, cues: List["SubtitleCue"]) -> int:
+    """
+    Write the sectioned module and one driver per section next to file_name. Returns the number
+    of sections, or 0 when the scene is not split (then nothing is written).
+    """
+    module = pathlib.Path(file_name).stem
+    if not module.isidentifier():
+        return 0
+    code = (workdir / file_name).read_text(encoding="utf-8")
+    if uses_updaters(code):
+        return 0
+    n_sections = count_scene_sections(code, scene_name)
+    if n_sections == 1:
+        # No explicit sections: cut at subtitle-cue beats
+        code = insert_section_breaks(code, scene_name, cues, RENDER_SECTION_WORKERS)
+        n_sections = count_scene_sections(code, scene_name)
+    if n_sections < 2:
+        return 0
+    sectioned_module = f"{module}_sectioned"
+    (workdir / f"{sectioned_module}.py").write_text(code, encoding="utf-8")
+    for k in range(n_sections):
+        driver = SECTION_DRIVER_TEMPLATE.format(module=sectioned_module, scene=scene_name, index=k)
+        (workdir / f"{module}_section{k}.py").write_text(driver, encoding="utf-8")
+    return n_sections
+
+def render_sections_parallel(workdir: pathlib.Path, file_name: str, scene_name: str, timeout: float,
+                             n_sections: int, workers: int,
+                             streamer: Optional["HLSStreamer"] = None) -> Optional[Tuple[str, pathlib.Path]]:
+    """Render the prepared sections in their own manim processes, `workers` at once, and concatenate."""
+    module = pathlib.Path(file_name).stem
+    sections_dir = workdir / "sections"
+    sections_dir.mkdir(exist_ok=True)
+
+    def render_one(k: int) -> Tuple[str, Optional[pathlib.Path]]:
+        media_dir = f"sections/{k}"
+        out = run_manim(workdir, f"{module}_section{k}.py", scene_name, timeout, media_dir=media_dir,
+                        log_path=sections_dir / f"{k}.log")
+        return out, find_rendered_mp4(workdir / media_dir, f"{module}_section{k}")
+
+    log.info("Rendering %s in %d sections with %d workers", scene_name, n_sections, workers)
+    if streamer is not None:
+        streamer.watch([sections_dir / str(k) / "videos" / f"{module}_section{k}" for k in range(n_sections)])
+    ok = False
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(render_one, range(n_sections)))
+        ok = True
+    finally:
+        if streamer is not None:
+            streamer.close(complete=ok)
+        # Section logs were written side by side; append them to the job's render.log in order
+        with open(workdir / "render.log", "a", encoding="utf-8") as dst:
+            for k in range(n_sections):
+                section_log = sections_dir / f"{k}.log"
+                if section_log.is_file():
+                    dst.write(f"\n[Section {k}]\n")
+                    with open(section_log, encoding="utf-8", errors="replace") as src:
+                        shutil.copyfileobj(src, dst)
+
+    # A section without animations produces no movie of its own
+    parts = [mp4 for _, mp4 in results if mp4 is not None]
+    if not parts:
+        return None
+    list_path = sections_dir / "concat.txt"
+    list_path.write_text("".join(f"file '{p.resolve().as_posix()}'\n" for p in parts), encoding="utf-8")
+    merged = sections_dir / "out.mp4"
+    run_logged(["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", str(list_path), "-c", "copy", str(merged)],
+               workdir, workdir / "render.log", timeout=timeout)
+    combined_log = "".join(f"\n[Section {k}]\n{out}" for k, (out, _) in enumerate(results))
+    return combined_log, merged
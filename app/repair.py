@@ -0,0 +1,382 @@
+"""The render/repair loop that drives a generated payload to a rendered video."""
+import json, subprocess, pathlib, traceback, shutil, time
+from typing import List, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+
+from app.core import (
+    LOCAL_FIX_MAX, RENDER_BUDGET_SECONDS, RENDER_MAX_ATTEMPTS, REPAIR_MODE, count, job_log, log, set_job,
+    write_atomic,
+)
+from app.schemas import ManimPayload
+from app.sanitize import sanitize_and_fix_code
+from app.media import write_vtt
+from app.process import RenderResourceExceeded, RenderStalled, append_log, read_log_tail
+from app.scheduler import RENDER_COST_MODEL, RENDER_SCHEDULER, render_features
+from app.complexity import apply_complexity_budget
+from app.index import JobRecord
+from app.render import render_scene
+from app.prompts import chat_completion
+from app.fixers import LOCAL_FIXERS, _error_snippet, classify_traceback, error_lines, local_fix
+
+# ---------- Render / repair loop ----------
+# render_with_repairs() drives a generated payload to a rendered silent.mp4 as an explicit state
+# machine:  validate (sanitize, complexity budget, compile) -> render -> done, and on failure
+# classify -> fix (local fixer) or repair (LLM) -> validate -> render ...  Every attempt keeps its
+# code, error tail and outcome under attempts/<n>/. The loop stops after RENDER_MAX_ATTEMPTS renders
+# (renders of locally fixed code not counted), or early once the rest of RENDER_BUDGET_SECONDS cannot
+# cover a repair call plus the predicted render.
+RENDER_ATTEMPT_TIMEOUTS = (480, 900)  # first render, renders of repaired code
+MIN_RENDER_TIMEOUT = 60
+REPAIR_CALL_ESTIMATE_SECONDS = 30.0  # until this job has timed a repair call of its own
+LATEX_ERROR_MARKERS = ("latex error", "latex compilation error", "missing }", "missing {",
+                       "undefined control", "missing $", "extra }")
+REPAIR_JSON_INSTRUCTION = "Return a JSON object with keys file_name, scene_name, subtitle_cues, code."
+REPAIR_INSTRUCTIONS = {
+    "syntax": "Please fix any syntax errors in the code while preserving the code's purpose and complexity. "
+              "Do not remove features or simplify the content to avoid errors. "
+              "Keep the same file_name and scene_name unless a change is required to fix the issue.",
+    "rejected": "Remove what was rejected (disallowed imports, file or network access) while preserving the code's purpose and complexity. "
+                "Keep the same file_name and scene_name.",
+    "latex": "Identify and fix any LaTeX syntax issues in the code (e.g., unmatched braces, missing braces around exponents, incorrect backslashes) that caused this error. "
+             "Do not simplify or change other parts of the code; preserve the code's purpose and complexity. "
+             "Keep the same file_name and scene_name unless absolutely necessary.",
+    "resource_exceeded": "Make the scene cheaper to render while keeping its content and narrative: lower surface and curve resolutions, "
+                         "use fewer simultaneous mobjects, updaters and 3D objects, and avoid rebuilding objects every frame. "
+                         "Keep the same file_name and scene_name.",
+    "stalled": "Find what never finishes (an updater or loop without an exit, a computation that does not converge, "
+               "an animation with an unbounded run time) and fix it while preserving the code's purpose and complexity. "
+               "Keep the same file_name and scene_name.",
+    "no_output": "Make sure construct() of the scene plays its animations (self.play / self.wait) so a video is written. "
+                 "Keep the same file_name and scene_name.",
+    "runtime": "Please fix the code to resolve the error while preserving the code's purpose and complexity. "
+               "Do not remove features or simplify the content to avoid errors. "
+               "Keep the same file_name and scene_name unless a change is required to fix the issue.",
+}
+REPAIR_INSTRUCTIONS["timeout"] = REPAIR_INSTRUCTIONS["resource_exceeded"]
+
+class RenderFailure(Exception):
+    """A failed attempt: class (see classify_render_failure), the error and the output tail to show the model."""
+
+    def __init__(self, failure: str, error: Optional[BaseException], output: str):
+        super().__init__(failure)
+        self.failure = failure
+        self.error = error
+        self.output = output
+
+def classify_render_failure(error: Optional[BaseException], output: str) -> str:
+    if isinstance(error, RenderResourceExceeded):
+        return "resource_exceeded"
+    if isinstance(error, RenderStalled):
+        return "stalled"
+    if isinstance(error, subprocess.TimeoutExpired):
+        return "timeout"
+    if isinstance(error, SyntaxError):
+        return "syntax"
+    if isinstance(error, ValueError):
+        return "rejected"
+    if error is None:
+        return "no_output"
+    low = output.lower()
+    if any(marker in low for marker in LATEX_ERROR_MARKERS):
+        return "latex"
+    return "runtime"
+
+def _repair_lead(failure: RenderFailure) -> str:
+    e = failure.error
+    if failure.failure == "syntax":
+        lead = "The Manim code of your last answer failed to compile with the following syntax error:"
+    elif failure.failure == "rejected":
+        lead = f"The Manim code of your last answer was rejected before rendering ({e}):"
+    elif failure.failure == "resource_exceeded":
+        lead = f"The render of your last answer was killed because it exceeded its {e.resource} limit ({e.detail}). The last output was:"
+    elif failure.failure == "stalled":
+        lead = f"The render of your last answer was killed because it stopped making progress: {e.detail}. The last output was:"
+    elif failure.failure == "timeout":
+        lead = "The render of your last answer did not finish within its time limit. The last output was:"
+    elif failure.failure == "latex":
+        lead = "The Manim code of your last answer failed to render due to a LaTeX syntax error. The error was:"
+    elif failure.failure == "no_output":
+        lead = "Manim ran your last answer without writing a video. The last output was:"
+    else:
+        lead = "The Manim code of your last answer failed to render with the following error:"
+    return lead
+
+def build_repair_prompt(failure: RenderFailure, code: Optional[str] = None) -> str:
+    """
+    Follow-up request for a complete new payload. code: the current code, when it is no longer
+    the code of the last full answer in the conversation (it has been patched since).
+    """
+    current = f"The current code (after your patches) is:\n```python\n{code}\n```\n" if code else ""
+    return (
+        f"{_repair_lead(failure)}\n```text\n{_error_snippet(failure.output)}\n```\n"
+        f"{current}{REPAIR_INSTRUCTIONS[failure.failure]} {REPAIR_JSON_INSTRUCTION}"
+    ).strip()
+
+# Patch repairs (REPAIR_MODE=patch): instead of a whole new payload the model gets the error and
+# a numbered window of the code that ran, around the lines the traceback points at, and answers
+# {"edits": [{"start": a, "end": b, "replacement": "..."}]}: lines a..b (1-based, inclusive;
+# b = a - 1 inserts before a) are replaced. Edits are checked against the window and applied
+# locally; a patch that does not apply falls back to a full repair.
+REPAIR_WINDOW_CONTEXT = 15  # lines shown around each error line
+REPAIR_WINDOW_MAX_LINES = 160  # larger windows (or whole files without an error line) get a full repair
+
+def repair_window(code: str, lines: List[int]) -> Optional[Tuple[int, int]]:
+    """(first, last) line of the code to show for a patch repair, or None when a window would not be focused."""
+    total = len(code.splitlines())
+    lines = [n for n in lines if 1 <= n <= total]
+    if not lines:
+        return (1, total) if 0 < total <= REPAIR_WINDOW_MAX_LINES else None
+    for focus in (lines[-3:], lines[-1:]):
+        first, last = max(1, min(focus) - REPAIR_WINDOW_CONTEXT), min(total, max(focus) + REPAIR_WINDOW_CONTEXT)
+        if last - first + 1 <= REPAIR_WINDOW_MAX_LINES:
+            return first, last
+    return None
+
+def build_patch_prompt(failure: RenderFailure, file_name: str, code: str, window: Tuple[int, int]) -> str:
+    first, last = window
+    lines = code.splitlines()
+    numbered = "\n".join(f"{n:4d}| {lines[n - 1]}" for n in range(first, last + 1))
+    return (
+        f"{_repair_lead(failure)}\n```text\n{_error_snippet(failure.output)}\n```\n"
+        f"The code that ran is {file_name} ({len(lines)} lines); lines {first}-{last} are:\n```text\n{numbered}\n```\n"
+        f"{REPAIR_INSTRUCTIONS[failure.failure]}\n"
+        'Fix it with a patch: return a JSON object {"edits": [{"start": <first line>, "end": <last line>, '
+        '"replacement": "<new text for those lines>"}]}. Lines are numbered as above and inclusive; '
+        f"edits must stay within lines {first}-{last} and must not overlap; use end = start - 1 to insert "
+        "before a line. Write replacement lines without the number prefix, with their full indentation, "
+        "and change only what the fix needs."
+    )
+
+def apply_patch(code: str, raw: str, window: Tuple[int, int], base: Optional[str] = None) -> str:
+    """
+    code with the edits of a patch answer applied; raises ValueError when the patch does not apply
+    cleanly. base: the code the window was numbered from, when it may since have changed; a patch
+    whose window no longer reads the same is stale (its line numbers point elsewhere).
+    """
+    try:
+        edits = json.loads(raw)["edits"]
+        edits = [(int(e["start"]), int(e["end"]), str(e["replacement"])) for e in edits]
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"unreadable patch: {e!r}")
+    if not edits:
+        raise ValueError("empty patch")
+    first, last = window
+    lines = code.splitlines(keepends=True)
+    if base is not None and base.splitlines()[first - 1:last] != code.splitlines()[first - 1:last]:
+        raise ValueError(f"stale patch: lines {first}-{last} changed since they were shown")
+    taken_until = 0
+    for start, end, _ in sorted(edits):
+        if not (first <= start <= last + 1 and start - 1 <= end <= last):
+            raise ValueError(f"edit {start}-{end} is outside lines {first}-{last}")
+        if start <= taken_until:
+            raise ValueError(f"edit {start}-{end} overlaps another edit")
+        taken_until = max(taken_until, end)
+    for start, end, replacement in sorted(edits, reverse=True):
+        if replacement and not replacement.endswith("\n"):
+            replacement += "\n"
+        lines[start - 1:end] = [replacement] if replacement else []
+    patched = "".join(lines)
+    if patched == code:
+        raise ValueError("patch changes nothing")
+    return patched
+
+def _failure_response(failure: RenderFailure, attempts: int, stop_reason: str) -> JSONResponse:
+    if failure.failure in ("resource_exceeded", "stalled", "rejected"):
+        error = str(failure.error)
+    elif failure.failure == "timeout":
+        error = "Manim render timed out"
+    elif failure.failure == "no_output":
+        error = "Render finished but out.mp4 was not found"
+    else:
+        error = "Manim render failed"
+    return JSONResponse({"error": error, "details": failure.output[-8000:], "errorClass": failure.failure,
+                         "attempts": attempts, "stopReason": stop_reason}, status_code=500)
+
+def _validate_payload(workdir: pathlib.Path, payload: ManimPayload) -> str:
+    """Sanitized, budgeted code of payload; raises ValueError (rejected) or SyntaxError."""
+    fixed = apply_complexity_budget(workdir, sanitize_and_fix_code(payload.code))
+    compile(fixed, str(workdir / payload.file_name), "exec")
+    return fixed
+
+def _render_attempt(workdir: pathlib.Path, payload: ManimPayload, timeout: float, streamer, rec: "JobRecord") -> None:
+    """One render of the code already written to workdir; silent.mp4 on success, RenderFailure otherwise."""
+    try:
+        out, mp4 = render_scene(workdir, payload.file_name, payload.scene_name, timeout, payload.subtitle_cues, streamer, rec)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        output = e.output if isinstance(e.output, str) else (e.output or b"").decode("utf-8", errors="replace")
+        raise RenderFailure(classify_render_failure(e, output), e, output or str(e))
+    if mp4 is None:
+        raise RenderFailure("no_output", None, out or read_log_tail(workdir / "render.log"))
+    shutil.copy2(mp4, workdir / "silent.mp4")
+
+def _request_repair(messages: List[dict], rec: "JobRecord") -> Tuple[ManimPayload, str]:
+    """Ask the model for repaired code: (payload, raw answer); raises on a failed call or an unusable answer."""
+    chat = chat_completion(rec, "repair", messages, response_format={"type": "json_object"})
+    raw = (chat.choices[0].message.content or "").strip()
+    log.info("LLM repair returned %d chars of JSON", len(raw))
+    if not raw:
+        raise ValueError("empty repair response")
+    return ManimPayload.model_validate(json.loads(raw)), raw
+
+def render_with_repairs(job_id: str, workdir: pathlib.Path, conversation: List[dict], payload: ManimPayload,
+                        rec: "JobRecord", new_streamer):
+    """
+    Validate, render and repair payload until workdir/silent.mp4 exists. Returns the payload that
+    rendered, or a JSONResponse (errorClass, attempts, stopReason) once attempts or budget run out.
+    conversation ends with the answer payload came from; repair requests and answers are appended.
+    """
+    started = time.monotonic()
+    attempt, state = 0, "validate"
+    fixed, failure = "", None
+    patched_since_answer = False
+    repair_seconds = REPAIR_CALL_ESTIMATE_SECONDS
+    attempt_started = time.time()
+    tb_class, local_code, pending_fix = "", None, None
+    local_fixes, tried_fixes = 0, set()
+
+    def record(outcome: str, detail: str = "", **extra) -> None:
+        adir = workdir / "attempts" / str(attempt)
+        info = {"attempt": attempt, "fileName": payload.file_name, "sceneName": payload.scene_name,
+                "outcome": outcome, "detail": detail[:2000], "seconds": round(time.time() - attempt_started, 3), **extra}
+        write_atomic(adir / "attempt.json", json.dumps(info, indent=2))
+        job_log(workdir, f"attempt {attempt}: {outcome}" + (f" ({detail[:300]})" if detail else ""))
+
+    while True:
+        set_job(job_id, renderState=state, renderAttempt=attempt)
+        if state == "validate":
+            attempt += 1
+            rec.render_attempts = attempt
+            attempt_started = time.time()
+            rec.begin("sanitize")
+            payload.file_name = (payload.file_name or "explainer.py").strip()
+            payload.scene_name = payload.scene_name.strip()
+            adir = workdir / "attempts" / str(attempt)
+            adir.mkdir(parents=True, exist_ok=True)
+            (adir / payload.file_name).write_text(payload.code, encoding="utf-8")
+            fixed = ""
+            try:
+                fixed = apply_complexity_budget(workdir, sanitize_and_fix_code(payload.code))
+                compile(fixed, str(workdir / payload.file_name), "exec")
+            except SyntaxError as se:
+                output = "Traceback (most recent call last):\n" + "".join(traceback.format_exception_only(type(se), se))
+                failure = RenderFailure("syntax", se, output)
+                append_log(workdir / "render.log", f"\n[Attempt {attempt}] syntax error\n{output}")
+                state = "classify"
+                continue
+            except ValueError as ve:
+                failure = RenderFailure("rejected", ve, str(ve))
+                state = "classify"
+                continue
+            (workdir / payload.file_name).write_text(fixed, encoding="utf-8")
+            write_vtt(workdir, payload.subtitle_cues)
+            state = "render"
+
+        elif state == "render":
+            rec.begin("render")
+            predicted = RENDER_COST_MODEL.predict(render_features(fixed, payload.scene_name))
+            estimate = RENDER_SCHEDULER.estimate(predicted)
+            set_job(job_id, renderEstimate=estimate)
+            log.info("Render estimate for %s (attempt %d): %s", job_id, attempt, estimate)
+            timeout = RENDER_ATTEMPT_TIMEOUTS[0 if attempt == 1 else 1]
+            if attempt > 1:
+                timeout = max(MIN_RENDER_TIMEOUT, min(timeout, RENDER_BUDGET_SECONDS - (time.monotonic() - started)))
+            append_log(workdir / "render.log", f"\n[Attempt {attempt}] {payload.file_name} {payload.scene_name}\n")
+            try:
+                _render_attempt(workdir, payload, timeout, new_streamer(payload.subtitle_cues), rec)
+            except RenderFailure as f:
+                failure = f
+                state = "classify"
+                continue
+            if pending_fix:
+                count(f"local_fix_{pending_fix}_resolved")
+            record("ok")
+            return payload
+
+        elif state == "classify":
+            count(f"render_failures_{failure.failure}")
+            log.error("Attempt %d of job %s failed (%s):\n%s", attempt, job_id, failure.failure, failure.output[-4000:])
+            (workdir / "attempts" / str(attempt) / "error.txt").write_text(failure.output[-8000:], encoding="utf-8")
+            tb_class, tb_info = classify_traceback(failure.output, payload.file_name)
+            count(f"traceback_class_{tb_class}")
+            if pending_fix:
+                count(f"local_fix_{pending_fix}_{'missed' if tb_class == pending_fix else 'resolved'}")
+                pending_fix = None
+            record(failure.failure, str(failure.error) if failure.error is not None else "", tracebackClass=tb_class)
+            remaining = RENDER_BUDGET_SECONDS - (time.monotonic() - started)
+            render_seconds = RENDER_COST_MODEL.predict(render_features(fixed, payload.scene_name) if fixed else None)
+            fix_key = (tb_class, tb_info.get("line"), tb_info.get("name"))
+            if (tb_class in LOCAL_FIXERS and fix_key not in tried_fixes and local_fixes < LOCAL_FIX_MAX
+                    and remaining >= render_seconds):
+                tried_fixes.add(fix_key)
+                local_code = local_fix(fixed, tb_class, tb_info)
+                if local_code is not None:
+                    state = "fix"
+                    continue
+                count(f"local_fix_{tb_class}_missed")
+            needed = repair_seconds + render_seconds
+            if attempt - local_fixes >= RENDER_MAX_ATTEMPTS:
+                stop_reason = "max_attempts"
+            elif remaining < needed:
+                stop_reason = "budget"
+                job_log(workdir, f"stopping: {remaining:.0f}s of budget left, a repair and render need ~{needed:.0f}s")
+            else:
+                state = "repair"
+                continue
+            if (workdir / "render.log").is_file():
+                shutil.copyfile(workdir / "render.log", workdir / "error.txt")
+            return _failure_response(failure, attempt, stop_reason)
+
+        elif state == "fix":
+            count(f"local_fix_{tb_class}_applied")
+            job_log(workdir, f"local fix applied for {tb_class}; re-rendering without a repair call")
+            log.info("Local fix %s applied for %s (attempt %d)", tb_class, job_id, attempt)
+            payload = ManimPayload(file_name=payload.file_name, scene_name=payload.scene_name,
+                                   code=local_code, subtitle_cues=payload.subtitle_cues)
+            local_fixes += 1
+            pending_fix = tb_class
+            patched_since_answer = True
+            state = "validate"
+
+        elif state == "repair":
+            rec.begin("repair")
+            t0 = time.monotonic()
+            window = repair_window(fixed, error_lines(failure.output, payload.file_name)) if fixed and REPAIR_MODE == "patch" else None
+            if window is not None:
+                request = {"role": "user", "content": build_patch_prompt(failure, payload.file_name, fixed, window)}
+                try:
+                    chat = chat_completion(rec, "repair_patch", conversation + [request], response_format={"type": "json_object"})
+                    raw = (chat.choices[0].message.content or "").strip()
+                    patched = apply_patch(fixed, raw, window)
+                except Exception as e:
+                    count("repair_patch_fallbacks")
+                    job_log(workdir, f"patch repair failed ({e}); asking for a full repair")
+                else:
+                    count("repair_patches_applied")
+                    write_atomic(workdir / "attempts" / str(attempt) / "patch.json", raw)
+                    job_log(workdir, f"patch repair applied to lines {window[0]}-{window[1]}")
+                    repair_seconds = time.monotonic() - t0
+                    conversation = conversation + [request, {"role": "assistant", "content": raw}]
+                    payload = ManimPayload(file_name=payload.file_name, scene_name=payload.scene_name,
+                                           code=patched, subtitle_cues=payload.subtitle_cues)
+                    patched_since_answer = True
+                    state = "validate"
+                    continue
+            request = {"role": "user", "content": build_repair_prompt(failure, payload.code if patched_since_answer else None)}
+            try:
+                repaired, raw = _request_repair(conversation + [request], rec)
+            except Exception as e:
+                log.error("OpenAI repair request failed: %s\n%s", repr(e), traceback.format_exc())
+                job_log(workdir, f"repair request failed: {e!r}")
+                return _failure_response(failure, attempt, "repair_failed")
+            repair_seconds = time.monotonic() - t0
+            conversation = conversation + [request, {"role": "assistant", "content": raw}]
+            patched_since_answer = False
+            payload = ManimPayload(
+                file_name=(repaired.file_name or payload.file_name).strip(),
+                scene_name=repaired.scene_name,
+                code=repaired.code,
+                subtitle_cues=repaired.subtitle_cues,
+            )
+            log.info("Repaired code received for %s (%s)", payload.file_name, payload.scene_name)
+            state = "validate"
@@ -0,0 +1,111 @@
+"""Retention of app/renders job dirs: garbage collection and the manifest backfill."""
+import shutil, threading, time
+
+from app.core import (
+    JOBS, JOBS_LOCK, RENDERS_DIR, RENDERS_FAILED_TTL_HOURS, RENDERS_GC_DRY_RUN, RENDERS_GC_GRACE_SECONDS,
+    RENDERS_GC_INTERVAL, RENDERS_KEEP_LAST, RENDERS_MAX_AGE_DAYS, RENDERS_MAX_BYTES, get_job, log,
+)
+from app.artifacts import JOB_ID_RE, MANIFEST, _scan_job_dir, prune_orphan_blobs, publish_manifest
+from app.index import JOB_INDEX
+from app.store import STORE
+
+# ---------- Retention / garbage collection ----------
+def _is_in_flight(job_id: str, newest_mtime: float, now: float) -> bool:
+    job = get_job(job_id)
+    if job is not None and job.get("status") == "running":
+        return True
+    # Jobs run by another process are only visible through their files
+    return now - newest_mtime < RENDERS_GC_GRACE_SECONDS
+
+def collect_garbage(dry_run: bool = False) -> dict:
+    """
+    Apply the retention policies to app/renders and delete (or, on a dry run, report) job dirs:
+    failed jobs older than RENDERS_FAILED_TTL_HOURS, successes older than RENDERS_MAX_AGE_DAYS,
+    then the oldest jobs until the total is under RENDERS_MAX_BYTES. The newest RENDERS_KEEP_LAST
+    successes and in-flight jobs are never deleted. Artifacts a job published to the store are
+    deleted with its dir. Deleted jobs stay in the job index, marked
+    purged, so the history stops listing them while the usage and outcome stats keep them.
+    """
+    now = time.time()
+    jobs = []
+    for workdir in RENDERS_DIR.iterdir():
+        if not workdir.is_dir() or not JOB_ID_RE.match(workdir.name):
+            continue
+        size, newest = _scan_job_dir(workdir)
+        succeeded = (workdir / MANIFEST).is_file() or (workdir / "out.mp4").is_file()
+        jobs.append({"jobId": workdir.name, "bytes": size, "mtime": newest, "succeeded": succeeded,
+                     "inFlight": _is_in_flight(workdir.name, newest, now)})
+    jobs.sort(key=lambda j: j["mtime"], reverse=True)
+    total_bytes = sum(j["bytes"] for j in jobs)
+
+    protected = {j["jobId"] for j in jobs if j["inFlight"]}
+    protected |= {j["jobId"] for j in [j for j in jobs if j["succeeded"]][:RENDERS_KEEP_LAST]}
+    doomed = {}
+    for j in jobs:
+        if j["jobId"] in protected:
+            continue
+        age = now - j["mtime"]
+        if not j["succeeded"] and RENDERS_FAILED_TTL_HOURS > 0 and age > RENDERS_FAILED_TTL_HOURS * 3600:
+            doomed[j["jobId"]] = "failed-ttl"
+        elif j["succeeded"] and RENDERS_MAX_AGE_DAYS > 0 and age > RENDERS_MAX_AGE_DAYS * 86400:
+            doomed[j["jobId"]] = "max-age"
+    if RENDERS_MAX_BYTES > 0:
+        remaining = total_bytes - sum(j["bytes"] for j in jobs if j["jobId"] in doomed)
+        for j in reversed(jobs):  # oldest first
+            if remaining <= RENDERS_MAX_BYTES:
+                break
+            if j["jobId"] in protected or j["jobId"] in doomed:
+                continue
+            doomed[j["jobId"]] = "max-bytes"
+            remaining -= j["bytes"]
+
+    deleted = []
+    for j in jobs:
+        reason = doomed.get(j["jobId"])
+        if reason is None:
+            continue
+        if not dry_run:
+            if _is_in_flight(j["jobId"], _scan_job_dir(RENDERS_DIR / j["jobId"])[1], time.time()):
+                continue  # picked up again since the scan
+            shutil.rmtree(RENDERS_DIR / j["jobId"], ignore_errors=True)
+            try:
+                STORE.delete(j["jobId"])
+            except Exception as e:  # the bucket's objects outlive the dir; a lifecycle rule can still expire them
+                log.warning("Renders GC: stored artifacts of job %s not deleted: %s", j["jobId"], e)
+            with JOBS_LOCK:
+                JOBS.pop(j["jobId"], None)
+            JOB_INDEX.submit("UPDATE jobs SET purged_at = ? WHERE job_id = ?", (time.time(), j["jobId"]))
+        deleted.append({"jobId": j["jobId"], "reason": reason, "bytes": j["bytes"]})
+    orphan_blobs, orphan_bytes = prune_orphan_blobs(dry_run)
+    freed = sum(d["bytes"] for d in deleted) + orphan_bytes
+    log.info("Renders GC%s: %d jobs, %d bytes; %s %d jobs (%d bytes)", " (dry run)" if dry_run else "",
+             len(jobs), total_bytes, "would delete" if dry_run else "deleted", len(deleted), freed)
+    return {"dryRun": dry_run, "scanned": len(jobs), "totalBytes": total_bytes,
+            "deleted": deleted, "orphanBlobs": orphan_blobs, "freedBytes": freed, "kept": len(jobs) - len(deleted)}
+
+def _gc_loop():
+    while True:
+        time.sleep(RENDERS_GC_INTERVAL)
+        try:
+            collect_garbage(dry_run=RENDERS_GC_DRY_RUN)
+        except Exception as e:
+            log.error("Renders GC failed: %s", e)
+
+def start_renders_gc():
+    if RENDERS_GC_INTERVAL > 0:
+        threading.Thread(target=_gc_loop, daemon=True, name="renders-gc").start()
+
+def backfill_manifests():
+    """Publish finished job dirs that predate manifest.json, so /renders serves them; in-flight dirs are left alone."""
+    now, published = time.time(), 0
+    for workdir in RENDERS_DIR.iterdir():
+        if (not workdir.is_dir() or not JOB_ID_RE.match(workdir.name) or (workdir / MANIFEST).is_file()
+                or not (workdir / "out.mp4").is_file()):
+            continue
+        _, newest = _scan_job_dir(workdir)
+        if _is_in_flight(workdir.name, newest, now):
+            continue
+        publish_manifest(workdir)
+        published += 1
+    if published:
+        log.info("Published manifests for %d job dirs that predate them", published)
@@ -0,0 +1,270 @@
+"""Sanitizer for generated scene code: blocked imports, the Manim prelude and LaTeX fixes."""
+import textwrap, re
+from typing import List
+
+# ---------- Sanitizer ----------
+# Standard imports and fallbacks prepended to every generated scene
+MANIM_PRELUDE = textwrap.dedent("""\
+    from manim import *
+    import numpy as np
+    import math
+    # Optional utilities (guarded against missing)
+    try:
+        from manim.utils.color import Color
+    except Exception:
+        def Color(x): return x  # accept hex strings or color names
+    try:
+        from manim.utils.space_ops import rotate_vector
+    except Exception:
+        pass
+    try:
+        from manim.utils.bezier import bezier
+    except Exception:
+        pass
+    try:
+        from manim.utils.rate_functions import smooth
+    except Exception:
+        pass
+    # ParametricSurface fallback for compatibility
+    try:
+        ParametricSurface
+    except NameError:
+        ParametricSurface = Surface
+""") + "\n"
+
+# Rewriting generated code works on a light lexer instead of text search, so only real code is
+# touched: string literals and comments are recognized (and skipped) as whole tokens, and the
+# rewrites hang off call and import tokens, in a single left-to-right pass. Every alternative of
+# CODE_TOKEN_RE starts with a fixed character, which lets the regex engine skip plain code fast;
+# the first character of a match tells its kind (string prefixes are read back where they matter).
+STRING_LITERAL = (r'"""[^"\\]*(?:(?:\\[\s\S]|"(?!""))[^"\\]*)*"""|\'\'\'[^\'\\]*(?:(?:\\[\s\S]|\'(?!\'\'))[^\'\\]*)*\'\'\''
+                  r'|"[^"\\\n]*(?:\\[\s\S][^"\\\n]*)*"|\'[^\'\\\n]*(?:\\[\s\S][^\'\\\n]*)*\'')
+CODE_TOKEN_RE = re.compile(
+    STRING_LITERAL + r"|#[^\n]*"
+    r"|Tex[ \t]*\(|MathTex[ \t]*\(|SingleStringMathTex[ \t]*\(|interpolate_color[ \t]*\("
+    r"|import\b|from\b"
+)
+IMPORT_STMT_RE = re.compile(r"(?:import|from)\b(?:[^\n;#(\\]|\\\n)*(?:\([^)]*\)[^\n;#]*)?")
+STRING_TOKEN = rf"(?<!\w)[rRbBuUfF]{{0,2}}(?:{STRING_LITERAL})"
+CALL_ARG_RE = re.compile(rf"(?P<str>{STRING_TOKEN})|(?P<comment>#[^\n]*)|(?P<open>[(\[{{])|(?P<close>[)\]}}])|(?P<comma>,)")
+KEYWORD_ARG_RE = re.compile(r"\s*[A-Za-z_]\w*\s*=(?!=)")
+TEX_CALLS = ("Tex", "MathTex", "SingleStringMathTex")
+FORBIDDEN_MODULES = {"os", "subprocess", "sys", "pathlib", "requests", "pickle", "shutil"}
+# Imports the prelude already provides: repeated at top level they are dropped, nested ones become "pass"
+PRELUDE_IMPORTS = {
+    "from manim import *",
+    "import numpy as np",
+    "import math",
+    "from manim.utils.color import Color",
+    "from manim.utils.space_ops import rotate_vector",
+    "from manim.utils.bezier import bezier",
+    "from manim.utils.rate_functions import smooth",
+}
+LATEX_EXPONENT_RE = re.compile(r'e\^((?:[A-Za-z0-9]|\\[A-Za-z]+)+)')
+
+def fix_latex_expr(expr: str) -> str:
+    """Correct common LaTeX syntax errors: unmatched braces, double backslashes, unbraced exponents of e."""
+    result_chars = []
+    brace_stack = 0
+    i = 0
+    while i < len(expr):
+        c = expr[i]
+        if c == '\\':
+            if i + 1 < len(expr) and expr[i+1] in '{}':
+                # Preserve escaped braces
+                result_chars.append(c)
+                result_chars.append(expr[i+1])
+                i += 2
+                continue
+            elif i + 1 < len(expr) and expr[i+1] == '\\':
+                # Normalize double backslashes (e.g., \\theta -> \\theta)
+                if i + 2 >= len(expr) or expr[i+2].isspace():
+                    result_chars.append('\\')
+                    result_chars.append('\\')
+                    i += 2
+                    continue
+                else:
+                    result_chars.append(c)
+                    i += 1
+                    continue
+            else:
+                result_chars.append(c)
+                i += 1
+                continue
+        elif c == '{':
+            brace_stack += 1
+            result_chars.append(c)
+        elif c == '}':
+            if brace_stack > 0:
+                brace_stack -= 1
+                result_chars.append(c)
+            # Skip unmatched closing brace
+        else:
+            result_chars.append(c)
+        i += 1
+    # Append missing braces if any remain open
+    result = "".join(result_chars)
+    if brace_stack > 0:
+        result += '}' * brace_stack
+    # Add braces around multi-character exponents after e^
+    result = LATEX_EXPONENT_RE.sub(r'e^{\1}', result)
+    # Handle exponents written as e^(...) without braces
+    return _brace_paren_exponents(result) if "e^(" in result else result
+
+def _brace_paren_exponents(expr: str) -> str:
+    """e^(...) -> e^{(...)}, nested ones included, in one left-to-right pass; stops at an unbalanced one."""
+    out = []
+    pos = 0
+    while True:
+        idx = expr.find("e^(", pos)
+        if idx == -1:
+            break
+        depth = 0
+        match_idx = -1
+        for j in range(idx + 2, len(expr)):
+            if expr[j] == '(':
+                depth += 1
+            elif expr[j] == ')':
+                depth -= 1
+                if depth == 0:
+                    match_idx = j
+                    break
+        if match_idx == -1:
+            break
+        out += [expr[pos:idx + 2], "{", _brace_paren_exponents(expr[idx + 2:match_idx + 1]), "}"]
+        pos = match_idx + 1
+    out.append(expr[pos:])
+    return "".join(out)
+
+def _call_args(s: str, pos: int) -> List[dict]:
+    """
+    Split the arguments of the call whose "(" ends at pos (an unclosed call runs to the end of the code).
+    Each argument is {start, end, strings: [(start, end)] of its top-level string literals, pure: only strings}.
+    """
+    args = []
+    arg = {"start": pos, "strings": [], "pure": True}
+    last = pos  # end of the previous top-level token
+    depth = 0
+    for m in CALL_ARG_RE.finditer(s, pos):
+        kind = m.lastgroup
+        if depth > 0:
+            depth += {"open": 1, "close": -1}.get(kind, 0)
+            last = m.end()
+            continue
+        if s[last:m.start()].strip():
+            arg["pure"] = False  # bare code between tokens: names, numbers, operators
+        last = m.end()
+        if kind == "str":
+            arg["strings"].append((m.start(), m.end()))
+        elif kind in ("comment", "open"):
+            arg["pure"] = False
+            depth += kind == "open"
+        else:  # "," or the closing paren
+            arg["end"] = m.start()
+            if s[arg["start"]:m.start()].strip():
+                args.append(arg)
+            if kind == "close":
+                return args
+            arg = {"start": m.end(), "strings": [], "pure": True}
+    arg["end"] = len(s)
+    if s[arg["start"]:].strip():
+        args.append(arg)
+    return args
+
+def _raw_tex_string(literal: str, fix_latex: bool) -> str:
+    """r-prefix a plain Tex/MathTex string literal (and optionally fix its LaTeX); other literals are returned as is."""
+    q = min(i for i in (literal.find('"'), literal.find("'")) if i != -1)
+    prefix, body = literal[:q], literal[q:]
+    if prefix.lower() not in ("", "r"):
+        return literal
+    if not prefix and "\\\\" not in body:
+        prefix = "r"  # a string escaped by hand (\\\\) keeps its prefix: raw would double the backslashes
+    quote = body[:3] if body[:3] in ('"""', "'''") else body[0]
+    inner = body[len(quote):-len(quote)]
+    if fix_latex and len(quote) == 1:
+        inner = fix_latex_expr(inner)
+    return prefix + quote + inner + quote
+
+def _check_import(stmt: str) -> None:
+    m = re.match(r"from\s+(\.*)([\w.]*)", stmt)
+    if m:
+        modules = [] if m.group(1) else [m.group(2)]
+    else:
+        modules = [part.split()[0] for part in stmt[len("import"):].replace("\\\n", " ").split(",") if part.split()]
+    if any(mod.split(".")[0] in FORBIDDEN_MODULES for mod in modules):
+        raise ValueError("Generated code contains forbidden imports or IO modules.")
+
+def sanitize_and_fix_code(src: str) -> str:
+    """
+    Minimal guardrails + standard Manim prelude, in one pass over the code's tokens.
+    - Blocks dangerous imports.
+    - Injects common Manim/numpy/math imports.
+    - Provides ParametricSurface fallback for compatibility.
+    - Strips imports the prelude (or, at top level, an earlier line) already provides.
+    - Makes MathTex/Tex string arguments raw to avoid escape issues (unless already escaped with \\\\).
+    - Wraps the colors passed to interpolate_color() in Color().
+    - Fixes common LaTeX syntax issues (unmatched braces, missing braces around exponents, double backslashes, etc.)
+      in single-string Tex/MathTex calls; multi-part calls may balance braces across parts and are left alone.
+    """
+    s = (src or "").replace("\r\n", "\n")
+    # Code that already carries the prelude is not prefixed twice
+    if s.startswith(MANIM_PRELUDE):
+        s = s[len(MANIM_PRELUDE):]
+
+    edits = []  # (start, end, replacement), in source order
+    seen_imports = set(PRELUDE_IMPORTS)
+    for m in CODE_TOKEN_RE.finditer(s):
+        tok, start = m.group(), m.start()
+        if tok[0] in "\"'#":
+            continue  # string literals and comments are only rewritten as Tex/MathTex arguments
+        if start and (s[start - 1].isalnum() or s[start - 1] == "_"):
+            continue  # tail of a longer name
+        if tok in ("import", "from"):
+            line_start = s.rfind("\n", 0, start) + 1
+            before = s[line_start:start]
+            if before.strip() and not before.rstrip().endswith((";", ":")):
+                continue  # "yield from", "raise ... from"
+            stmt = IMPORT_STMT_RE.match(s, start).group().rstrip()
+            _check_import(stmt)
+            end = start + len(stmt)
+            if before.strip() or s[end:end + 1] not in ("", "\n"):
+                continue  # shares its line with other code
+            key = " ".join(stmt.split())
+            if not before:
+                if key in seen_imports:
+                    edits.append((start, end + 1, ""))  # the whole line
+                seen_imports.add(key)
+            elif key in PRELUDE_IMPORTS:
+                edits.append((start, end, "pass"))  # keeps the enclosing block non-empty
+        else:
+            callee = tok.rstrip("( \t")
+            args = _call_args(s, m.end())
+            if callee in TEX_CALLS:
+                positional = [a for a in args if not KEYWORD_ARG_RE.match(s, a["start"])]
+                fix = len(positional) == 1 and positional[0]["pure"]
+                for a in positional:
+                    if not a["pure"]:
+                        continue
+                    for lo, hi in a["strings"]:
+                        new = _raw_tex_string(s[lo:hi], fix)
+                        if new != s[lo:hi]:
+                            edits.append((lo, hi, new))
+            elif len(args) >= 3 and s[start - 1:start] != ".":  # Mobject.interpolate_color takes mobjects
+                for a in args[:2]:
+                    text = s[a["start"]:a["end"]]
+                    if KEYWORD_ARG_RE.match(text) or text.lstrip().startswith("Color("):
+                        continue
+                    lead = len(text) - len(text.lstrip())
+                    trail = len(text.rstrip())
+                    edits.append((a["start"] + lead, a["start"] + lead, "Color("))
+                    edits.append((a["start"] + trail, a["start"] + trail, ")"))
+
+    out = []
+    pos = 0
+    for start, end, new in sorted(edits, key=lambda e: (e[0], e[1])):
+        if start < pos:
+            continue  # overlapping rewrite (nested calls); the outer one wins
+        out += [s[pos:start], new]
+        pos = end
+    out.append(s[pos:])
+    return MANIM_PRELUDE + "".join(out).strip() + "\n"
@@ -0,0 +1,338 @@
+"""Render cost model and the render slot scheduler."""
+import json, ast, threading, time, sqlite3, heapq, contextlib
+from typing import List, Optional, Tuple
+
+from app.core import MANIM_QUALITY_FLAG, RENDER_AGING_RATE, RENDER_CONCURRENCY, count, log, set_job
+from app.sanitize import TEX_CALLS
+from app.index import JOB_INDEX
+
+# ---------- Render cost model & scheduling ----------
+# render_features() reads the cost drivers off the scene's AST: video seconds (play/wait run times,
+# multiplied out over literal loops), 3D, parametric surface cells, updaters and Tex objects.
+# Frame-bound features are in -ql-equivalent seconds (scaled by the quality flag's pixel rate).
+# RENDER_COST_MODEL is linear in these features: it starts from DEFAULT_RENDER_COST_WEIGHTS and is
+# refit (ridge, pulled towards the defaults) on the renders logged in the job index. RENDER_SCHEDULER
+# admits manim runs shortest-predicted-first and publishes queue position and ETA on the job status.
+RENDER_COST_FEATURES = ("const", "video_seconds", "video_seconds_3d", "surface_cell_seconds",
+                        "updater_seconds", "tex_count", "play_count")
+DEFAULT_RENDER_COST_WEIGHTS = {
+    "const": 4.0,                  # manim start-up, scene setup, final concat
+    "video_seconds": 0.8,          # per second of 2D video
+    "video_seconds_3d": 2.5,       # extra per second of ThreeDScene video
+    "surface_cell_seconds": 0.02,  # per 1000 surface cells on screen, per second of video
+    "updater_seconds": 0.3,        # per updater, per second of video
+    "tex_count": 0.6,              # one LaTeX + dvisvgm run each
+    "play_count": 0.15,            # one partial movie file each
+}
+QUALITY_FRAME_SCALE = {"-ql": 1.0, "-qm": 4.5, "-qh": 20.0, "-qp": 36.0, "-qk": 81.0}  # pixels/s relative to -ql
+SURFACE_DEFAULT_RESOLUTION = {  # (u, v) resolution manim CE uses when resolution= is not given
+    "Surface": (32, 32), "ParametricSurface": (32, 32), "OpenGLSurface": (101, 101),
+    "Sphere": (101, 51), "Torus": (24, 24), "Cylinder": (24, 24), "Cone": (24, 24),
+}
+UPDATER_CALLS = ("add_updater", "always_redraw")
+RENDER_COST_UNKNOWN_LOOP = 3      # iterations assumed for loops over non-literal iterables
+RENDER_COST_MIN_SAMPLES = 8       # logged renders needed before the defaults are refit
+RENDER_COST_RIDGE = 4.0           # strength of the pull towards the defaults, in samples
+RENDER_COST_REFIT_EVERY = 10      # refit after this many new renders
+RENDER_COST_FALLBACK_SECONDS = 30.0  # prediction for code that does not parse
+
+def _is_self_call(node: ast.AST, method: str) -> bool:
+    return (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+            and node.func.attr == method and isinstance(node.func.value, ast.Name)
+            and node.func.value.id == "self")
+
+def _call_seconds(node: ast.AST) -> Optional[float]:
+    """Video seconds one self.play()/move_camera()/wait() call adds (run_time=/wait() literals, 1s otherwise); None for other nodes."""
+    if _is_self_call(node, "play") or _is_self_call(node, "move_camera"):
+        for kw in node.keywords:
+            if kw.arg == "run_time" and isinstance(kw.value, ast.Constant) and isinstance(kw.value.value, (int, float)):
+                return float(kw.value.value)
+        return 1.0
+    if _is_self_call(node, "wait"):
+        if node.args and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, (int, float)):
+            return float(node.args[0].value)
+        return 1.0
+    return None
+
+def _call_name(call: ast.Call) -> str:
+    f = call.func
+    return f.id if isinstance(f, ast.Name) else f.attr if isinstance(f, ast.Attribute) else ""
+
+def _loop_iterations(it: ast.AST) -> float:
+    """Iterations of a loop over a literal range()/list/tuple (through enumerate/reversed); a guess otherwise."""
+    if isinstance(it, (ast.List, ast.Tuple, ast.Set)):
+        return float(len(it.elts))
+    if isinstance(it, ast.Call) and isinstance(it.func, ast.Name) and it.args:
+        if it.func.id == "range" and all(isinstance(a, ast.Constant) and isinstance(a.value, int) for a in it.args):
+            try:
+                return float(min(len(range(*[a.value for a in it.args])), 1000))
+            except (TypeError, ValueError):
+                return float(RENDER_COST_UNKNOWN_LOOP)
+        if it.func.id in ("enumerate", "reversed"):
+            return _loop_iterations(it.args[0])
+    return float(RENDER_COST_UNKNOWN_LOOP)
+
+def _surface_resolution(call: ast.Call) -> Optional[Tuple[int, int]]:
+    """(u, v) resolution of a surface call: literal resolution=, the manim default, or None if not a literal."""
+    for kw in call.keywords:
+        if kw.arg == "resolution":
+            v = kw.value
+            if isinstance(v, ast.Constant) and isinstance(v.value, int):
+                return v.value, v.value
+            if (isinstance(v, (ast.Tuple, ast.List)) and len(v.elts) == 2
+                    and all(isinstance(e, ast.Constant) and isinstance(e.value, int) for e in v.elts)):
+                return v.elts[0].value, v.elts[1].value
+            return None
+    return SURFACE_DEFAULT_RESOLUTION[_call_name(call)]
+
+def _surface_cells(call: ast.Call) -> int:
+    u, v = _surface_resolution(call) or SURFACE_DEFAULT_RESOLUTION[_call_name(call)]
+    return u * v
+
+def _scan_render_cost(node: ast.AST, mult: float, acc: dict) -> None:
+    for child in ast.iter_child_nodes(node):
+        inner = mult
+        if isinstance(child, ast.For):
+            inner = mult * _loop_iterations(child.iter)
+        elif isinstance(child, ast.While):
+            inner = mult * RENDER_COST_UNKNOWN_LOOP
+        elif isinstance(child, (ast.ListComp, ast.SetComp, ast.GeneratorExp, ast.DictComp)):
+            for gen in child.generators:
+                inner *= _loop_iterations(gen.iter)
+        elif isinstance(child, ast.Call):
+            secs = _call_seconds(child)
+            if secs is not None:
+                acc["seconds"] += secs * mult
+                acc["plays"] += mult
+            name = _call_name(child)
+            if name in SURFACE_DEFAULT_RESOLUTION:
+                acc["cells"] += _surface_cells(child) * mult
+            elif name in UPDATER_CALLS:
+                acc["updaters"] += mult
+            elif name in TEX_CALLS:
+                acc["tex"] += mult
+        _scan_render_cost(child, min(inner, 1e4), acc)
+
+def render_features(code: str, scene_name: str) -> Optional[dict]:
+    """Render-cost features of scene_name and the module-level helpers it may use; None if code does not parse."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    scene = next((n for n in tree.body if isinstance(n, ast.ClassDef) and n.name == scene_name), None)
+    acc = dict.fromkeys(("seconds", "plays", "cells", "updaters", "tex"), 0.0)
+    for node in tree.body:
+        other_scene = (isinstance(node, ast.ClassDef) and node is not scene
+                       and any(ast.unparse(b).endswith("Scene") for b in node.bases))
+        if not other_scene:
+            _scan_render_cost(ast.Module(body=[node], type_ignores=[]), 1.0, acc)
+    is_3d = scene is not None and any("ThreeD" in ast.unparse(b) for b in scene.bases)
+    frames = acc["seconds"] * QUALITY_FRAME_SCALE.get(MANIM_QUALITY_FLAG, 1.0)
+    return {
+        "const": 1.0,
+        "video_seconds": round(frames, 3),
+        "video_seconds_3d": round(frames, 3) if is_3d else 0.0,
+        "surface_cell_seconds": round(acc["cells"] / 1000 * frames, 3),
+        "updater_seconds": round(acc["updaters"] * frames, 3),
+        "tex_count": acc["tex"],
+        "play_count": acc["plays"],
+    }
+
+def _solve(a: List[List[float]], b: List[float]) -> Optional[List[float]]:
+    """Solve a x = b by Gaussian elimination with partial pivoting; None if a is singular."""
+    n = len(b)
+    m = [row[:] + [b[i]] for i, row in enumerate(a)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(m[r][col]))
+        if abs(m[pivot][col]) < 1e-12:
+            return None
+        m[col], m[pivot] = m[pivot], m[col]
+        for r in range(col + 1, n):
+            f = m[r][col] / m[col][col]
+            for c in range(col, n + 1):
+                m[r][c] -= f * m[col][c]
+    x = [0.0] * n
+    for r in range(n - 1, -1, -1):
+        x[r] = (m[r][n] - sum(m[r][c] * x[c] for c in range(r + 1, n))) / m[r][r]
+    return x
+
+class RenderCostModel:
+    """Linear render-time model over RENDER_COST_FEATURES, refit from logged renders."""
+
+    def __init__(self):
+        self.weights = dict(DEFAULT_RENDER_COST_WEIGHTS)
+        self.samples = 0
+        self.pending = 0  # renders logged since the last refit
+        self._lock = threading.Lock()
+
+    def predict(self, features: Optional[dict]) -> float:
+        if not features:
+            return RENDER_COST_FALLBACK_SECONDS
+        with self._lock:
+            w = self.weights
+        return max(1.0, sum(w[k] * features.get(k, 0.0) for k in RENDER_COST_FEATURES))
+
+    def fit(self, samples: List[Tuple[dict, float]]) -> bool:
+        """Ridge least squares pulled towards the default weights. Keeps the current weights on too few samples."""
+        if len(samples) < RENDER_COST_MIN_SAMPLES:
+            return False
+        n = len(RENDER_COST_FEATURES)
+        a = [[0.0] * n for _ in range(n)]
+        b = [0.0] * n
+        for features, seconds in samples:
+            x = [float(features.get(k, 0.0)) for k in RENDER_COST_FEATURES]
+            for i in range(n):
+                b[i] += x[i] * seconds
+                for j in range(n):
+                    a[i][j] += x[i] * x[j]
+        for i, k in enumerate(RENDER_COST_FEATURES):
+            # Penalty in the feature's own units: worth RENDER_COST_RIDGE samples at the default weight
+            lam = RENDER_COST_RIDGE * max(a[i][i] / len(samples), 1e-6)
+            a[i][i] += lam
+            b[i] += lam * DEFAULT_RENDER_COST_WEIGHTS[k]
+        w = _solve(a, b)
+        if w is None:
+            return False
+        with self._lock:
+            self.weights = {k: max(0.0, v) for k, v in zip(RENDER_COST_FEATURES, w)}
+            self.samples = len(samples)
+        return True
+
+    def logged(self) -> None:
+        """Count one newly logged render; refits in the background every RENDER_COST_REFIT_EVERY."""
+        with self._lock:
+            self.pending += 1
+            due = self.pending >= RENDER_COST_REFIT_EVERY
+            if due:
+                self.pending = 0
+        if due:
+            threading.Thread(target=calibrate_render_cost_model, daemon=True, name="render-cost-fit").start()
+
+RENDER_COST_MODEL = RenderCostModel()
+
+def calibrate_render_cost_model(limit: int = 1000) -> int:
+    """Refit RENDER_COST_MODEL on the successful renders of the last `limit` jobs. Returns the sample count."""
+    try:
+        conn = JOB_INDEX.connect()
+        try:
+            rows = conn.execute("SELECT renders FROM jobs WHERE renders IS NOT NULL ORDER BY created_at DESC LIMIT ?",
+                                (limit,)).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        log.error("Render cost calibration failed: %s", e)
+        return 0
+    samples = []
+    for row in rows:
+        try:
+            renders = json.loads(row["renders"])
+        except ValueError:
+            continue
+        samples.extend((r["features"], r["seconds"]) for r in renders if r.get("ok") and r.get("features"))
+    if RENDER_COST_MODEL.fit(samples):
+        log.info("Render cost model refit on %d renders: %s", len(samples),
+                 {k: round(v, 4) for k, v in RENDER_COST_MODEL.weights.items()})
+    return len(samples)
+
+def start_render_cost_calibration():
+    threading.Thread(target=calibrate_render_cost_model, daemon=True, name="render-cost-fit").start()
+
+class SlotCancelled(Exception):
+    """The cancel event of a render was set while it waited for its slots."""
+
+SLOT_CANCEL_POLL_SECONDS = 0.2
+
+class RenderScheduler:
+    """
+    Admits renders while their widths (manim processes each runs at once: 1, or its section
+    workers) fit in `slots`. When slots free up, the waiting render with the lowest predicted cost
+    minus RENDER_AGING_RATE x seconds waited goes next, once enough slots are free for its width.
+    """
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self._cond = threading.Condition()
+        self._waiting: List[dict] = []
+        self._running: List[dict] = []
+
+    def _priority(self, ticket: dict, now: float) -> float:
+        return ticket["predicted"] - RENDER_AGING_RATE * (now - ticket["queued"])
+
+    def _order(self, now: float) -> List[dict]:
+        return sorted(self._waiting, key=lambda t: (self._priority(t, now), t["queued"]))
+
+    def _start_times(self, order: List[dict], now: float) -> List[float]:
+        """Seconds from now until each render in order starts, if every prediction holds."""
+        free = [max(0.0, t["predicted"] - (now - t["started"])) for t in self._running for _ in range(t["width"])]
+        free += [0.0] * max(0, self.slots - len(free))
+        heapq.heapify(free)
+        starts = []
+        for t in order:
+            width = t.get("width", 1)
+            start = max(heapq.heappop(free) for _ in range(width))
+            starts.append(start)
+            for _ in range(width):
+                heapq.heappush(free, start + t["predicted"])
+        return starts
+
+    def _publish(self, now: float) -> None:
+        order = self._order(now)
+        for pos, (t, start) in enumerate(zip(order, self._start_times(order, now)), 1):
+            set_job(t["job_id"], renderQueue={
+                "position": pos, "waiting": len(order),
+                "predictedRenderSeconds": round(t["predicted"], 1),
+                "estimatedStartSeconds": round(start, 1),
+                "estimatedDoneSeconds": round(start + t["predicted"], 1),
+            })
+
+    def _in_use(self) -> int:
+        return sum(t["width"] for t in self._running)
+
+    def estimate(self, predicted: float) -> dict:
+        """Up-front latency estimate for a render of `predicted` seconds queued now."""
+        with self._cond:
+            now = time.time()
+            ahead = [t for t in self._order(now) if self._priority(t, now) <= predicted]
+            start = self._start_times(ahead + [{"predicted": predicted}], now)[-1]
+        return {"predictedRenderSeconds": round(predicted, 1), "estimatedStartSeconds": round(start, 1),
+                "estimatedDoneSeconds": round(start + predicted, 1)}
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"slots": self.slots, "slotsInUse": self._in_use(), "running": len(self._running),
+                    "waiting": len(self._waiting)}
+
+    @contextlib.contextmanager
+    def slot(self, job_id: str, predicted: float, width: int = 1, cancel: Optional[threading.Event] = None):
+        """
+        Hold `width` slots (capped at all of them) for a render; the ticket's width is what was
+        granted. Raises SlotCancelled when cancel is set before the slots are free.
+        """
+        ticket = {"job_id": job_id, "predicted": predicted, "queued": time.time(), "width": max(1, min(width, self.slots))}
+        with self._cond:
+            self._waiting.append(ticket)
+            while self._in_use() + ticket["width"] > self.slots or self._order(time.time())[0] is not ticket:
+                if cancel is not None and cancel.is_set():
+                    self._waiting.remove(ticket)
+                    self._cond.notify_all()
+                    raise SlotCancelled(job_id)
+                self._publish(time.time())
+                self._cond.wait(None if cancel is None else SLOT_CANCEL_POLL_SECONDS)
+            self._waiting.remove(ticket)
+            ticket["started"] = time.time()
+            self._running.append(ticket)
+            self._cond.notify_all()  # the next waiter may fit in a slot that is still free
+        waited = ticket["started"] - ticket["queued"]
+        if waited > 1:
+            count("render_queue_waits")
+            log.info("Render for %s waited %.1fs for a slot (predicted %.1fs)", job_id, waited, predicted)
+        set_job(job_id, renderQueue=None, renderStartedAt=ticket["started"],
+                predictedRenderSeconds=round(predicted, 1), renderQueuedSeconds=round(waited, 1))
+        try:
+            yield ticket
+        finally:
+            with self._cond:
+                self._running.remove(ticket)
+                self._cond.notify_all()
+
+RENDER_SCHEDULER = RenderScheduler(RENDER_CONCURRENCY)
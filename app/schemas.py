@@ -0,0 +1,16 @@
+"""Schemas for strict validation of generated payloads."""
+from typing import List
+
+from pydantic import BaseModel, Field
+
+# ---------- Schemas for strict validation ----------
+class SubtitleCue(BaseModel):
+    start: float = Field(ge=0)
+    end: float = Field(ge=0)
+    text: str
+
+class ManimPayload(BaseModel):
+    file_name: str
+    scene_name: str
+    code: str
+    subtitle_cues: List[SubtitleCue]
@@ -0,0 +1,114 @@
+"""Speculative candidates: several payloads per generate call, raced through dry runs."""
+import subprocess, pathlib, ast, threading, concurrent.futures
+from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core import (
+    SPECULATIVE_CANDIDATES, SPECULATIVE_DRY_RUN_TIMEOUT, SPECULATIVE_MAX_EXTRA_TOKENS, count, job_log, log,
+    set_job,
+)
+from app.schemas import ManimPayload
+from app.scheduler import RENDER_COST_MODEL, RENDER_SCHEDULER, render_features
+from app.render import run_manim
+from app.repair import RenderFailure, _validate_payload, classify_render_failure
+
+# ---------- Speculative candidates ----------
+# With SPECULATIVE_CANDIDATES > 1 the generate call asks for k payloads at once (n=k: the prompt
+# is billed once). Each candidate is sanitized, linted and dry-run (manim --dry_run runs
+# construct() without writing frames) in parallel under candidates/<i>/; the first one to pass
+# goes on to the full render and the other dry runs are killed. Dry runs execute construct() at
+# full cost minus the frame writing, so each one holds a RENDER_SCHEDULER slot like a render;
+# candidates still waiting for a slot when the race is decided drop out without running. A passing candidate is known to
+# execute, so it skips the critique/regenerate round, which could break it again. When none
+# passes, the first candidate takes the ordinary path. k is lowered so the expected completion
+# tokens of the extra candidates stay within SPECULATIVE_MAX_EXTRA_TOKENS.
+SPECULATION_DEFAULT_COMPLETION_TOKENS = 4000.0  # per candidate, until a generate call has been measured
+SPECULATION_TOKENS_SMOOTHING = 0.2
+_speculation_lock = threading.Lock()
+_completion_tokens_per_choice = SPECULATION_DEFAULT_COMPLETION_TOKENS
+
+def speculative_candidates() -> int:
+    """k for the next generate call, capped by the extra-spend budget."""
+    if SPECULATIVE_CANDIDATES <= 1:
+        return 1
+    with _speculation_lock:
+        per_choice = _completion_tokens_per_choice
+    affordable = int(SPECULATIVE_MAX_EXTRA_TOKENS // max(per_choice, 1.0))
+    return max(1, min(SPECULATIVE_CANDIDATES, 1 + affordable))
+
+def note_generate_usage(chat, n: int) -> None:
+    """Track completion tokens per candidate; the extra candidates' share is counted as speculation spend."""
+    global _completion_tokens_per_choice
+    usage = getattr(chat, "usage", None)
+    tokens = getattr(usage, "completion_tokens", None) if usage is not None else None
+    if not tokens or n < 1:
+        return
+    per_choice = tokens / n
+    with _speculation_lock:
+        _completion_tokens_per_choice += SPECULATION_TOKENS_SMOOTHING * (per_choice - _completion_tokens_per_choice)
+    if n > 1:
+        count("speculation_extra_tokens", int(per_choice * (n - 1)))
+
+def lint_candidate(code: str, scene_name: str) -> Optional[str]:
+    """Cheap structural checks on sanitized code; a problem description, or None."""
+    tree = ast.parse(code)
+    scene = next((n for n in tree.body if isinstance(n, ast.ClassDef) and n.name == scene_name), None)
+    if scene is None:
+        return f"no class named {scene_name}"
+    if not any(isinstance(n, ast.FunctionDef) and n.name == "construct" for n in scene.body):
+        return f"{scene_name} does not define construct()"
+    return None
+
+def check_candidate(job_id: str, workdir: pathlib.Path, payload: ManimPayload, cancel: threading.Event) -> None:
+    """Sanitize, lint and dry-run one candidate inside workdir; raises RenderFailure, or SlotCancelled."""
+    workdir.mkdir(parents=True, exist_ok=True)
+    try:
+        fixed = _validate_payload(workdir, payload)
+    except (SyntaxError, ValueError) as e:
+        raise RenderFailure(classify_render_failure(e, ""), e, str(e))
+    problem = lint_candidate(fixed, payload.scene_name)
+    if problem:
+        raise RenderFailure("runtime", None, problem)
+    (workdir / payload.file_name).write_text(fixed, encoding="utf-8")
+    predicted = RENDER_COST_MODEL.predict(render_features(fixed, payload.scene_name))
+    try:
+        with RENDER_SCHEDULER.slot(job_id, predicted, cancel=cancel):
+            count("speculation_dry_runs")
+            run_manim(workdir, payload.file_name, payload.scene_name, SPECULATIVE_DRY_RUN_TIMEOUT, dry_run=True, cancel=cancel)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        output = e.output if isinstance(e.output, str) else ""
+        raise RenderFailure(classify_render_failure(e, output), e, output or str(e))
+
+def race_candidates(job_id: str, workdir: pathlib.Path, candidates: List[ManimPayload]) -> Optional[int]:
+    """Index of the first candidate to pass check_candidate(), or None when all fail."""
+    cancel = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=len(candidates), thread_name_prefix=f"speculate-{job_id[:8]}")
+    futures = {pool.submit(check_candidate, job_id, workdir / "candidates" / str(i), c, cancel): i
+               for i, c in enumerate(candidates)}
+    winner, failed = None, []
+    try:
+        for fut in concurrent.futures.as_completed(futures):
+            i = futures[fut]
+            try:
+                fut.result()
+            except RenderFailure as f:
+                failed.append(i)
+                job_log(workdir, f"candidate {i}: {f.failure} ({f.output.strip()[-300:]})")
+                continue
+            except Exception as e:
+                failed.append(i)
+                log.error("Candidate %d of job %s crashed: %r", i, job_id, e)
+                continue
+            winner = i
+            break
+    finally:
+        cancel.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+    count("speculation_jobs")
+    if winner is None:
+        count("speculation_all_failed")
+    elif winner != 0 and 0 in failed:
+        count("speculation_saved_repairs")  # the candidate a plain job would have rendered had failed
+    job_log(workdir, f"speculation: {len(candidates)} candidates, winner {winner}, failed {sorted(failed)}")
+    set_job(job_id, speculation={"candidates": len(candidates), "winner": winner, "failed": sorted(failed)})
+    return winner
@@ -0,0 +1,210 @@
+"""Artifact storage backends: the local job dir or an S3-compatible bucket."""
+import os, json, pathlib, shutil, threading, time, mimetypes, collections
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response, RedirectResponse, StreamingResponse
+
+from app.core import RENDERS_DIR, count, log, write_atomic
+from app.hls import HLS_DIR
+from app.artifacts import ARTIFACT_MEDIA_TYPES, IMMUTABLE_CACHE_CONTROL, MANIFEST, _artifact_response, load_manifest
+
+# ---------- Artifact storage ----------
+# Where published artifacts live once a job is finalized. ARTIFACT_STORE=local keeps them in the
+# job dir under RENDERS_DIR. ARTIFACT_STORE=s3 uploads them to an S3-compatible bucket (AWS, MinIO,
+# or app/fake_s3.py for tests; boto3 is then required). Uploads stream from disk in
+# S3_PART_BYTES multipart chunks, manifest.json goes last, and the local copies are dropped
+# unless S3_KEEP_LOCAL=1. /renders/{job}/{file} serves stored artifacts by redirecting to a
+# presigned URL (ARTIFACT_URL_MODE=presign) or by proxying the bucket with Range passed through
+# (proxy). HLS playlists are always proxied: their relative segment URLs must resolve back here.
+# put() and fetch() carry the files a running job shares across hosts: its payload.json
+# checkpoint, read back when the job is redelivered, and its live stream, which a queue worker
+# uploads segment by segment for the API process to serve. delete() drops everything stored for a
+# job once the renders GC has deleted its dir.
+ARTIFACT_STORE = os.getenv("ARTIFACT_STORE", "local")  # local | s3
+ARTIFACT_URL_MODE = os.getenv("ARTIFACT_URL_MODE", "presign")  # presign | proxy
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_PREFIX = os.getenv("S3_PREFIX", "renders/")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "")  # MinIO and other S3-compatible stores (path-style addressing)
+S3_REGION = os.getenv("S3_REGION", "")
+S3_PART_BYTES = int(os.getenv("S3_PART_BYTES", str(8 * 1024 * 1024)))
+S3_UPLOAD_CONCURRENCY = int(os.getenv("S3_UPLOAD_CONCURRENCY", "4"))
+S3_PRESIGN_SECONDS = int(os.getenv("S3_PRESIGN_SECONDS", "3600"))
+S3_KEEP_LOCAL = os.getenv("S3_KEEP_LOCAL", "0") == "1"
+S3_MANIFEST_CACHE = 1024  # manifests never change once published
+
+class LocalStore:
+    """Artifacts stay in the job dir and are served from there."""
+    name = "local"
+
+    def publish(self, workdir: pathlib.Path, manifest: dict) -> dict:
+        return manifest
+
+    def put(self, job_id: str, name: str, path: pathlib.Path, immutable: bool = False) -> None:
+        """Make a job dir file (checkpoint, live stream segment) readable by other hosts: it already is here."""
+
+    def fetch(self, job_id: str, name: str, dest: pathlib.Path) -> bool:
+        """Fetch a file put() by another host to dest. Whether it exists."""
+        return dest.is_file()
+
+    def manifest(self, job_id: str) -> Optional[dict]:
+        return load_manifest(RENDERS_DIR / job_id)
+
+    def response(self, request: Request, job_id: str, name: str, headers: dict) -> Response:
+        return _artifact_response(request, RENDERS_DIR / job_id / name, headers)
+
+    def delete(self, job_id: str) -> int:
+        """Drop what is stored for a job: nothing beyond its job dir, which the GC removes."""
+        return 0
+
+class S3Store:
+    """Artifacts in an S3-compatible bucket under <S3_PREFIX><job_id>/<name>."""
+    name = "s3"
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+        self._manifests = collections.OrderedDict()
+
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    try:
+                        import boto3
+                        from botocore.config import Config
+                    except ImportError:
+                        raise RuntimeError("ARTIFACT_STORE=s3 needs boto3 (pip install boto3)")
+                    self._client = boto3.client(
+                        "s3", endpoint_url=S3_ENDPOINT_URL or None, region_name=S3_REGION or None,
+                        config=Config(s3={"addressing_style": "path" if S3_ENDPOINT_URL else "auto"},
+                                      retries={"max_attempts": 5, "mode": "standard"}))
+        return self._client
+
+    def key(self, job_id: str, name: str) -> str:
+        return f"{S3_PREFIX}{job_id}/{name}"
+
+    def upload(self, path: pathlib.Path, key: str, cache_control: str) -> None:
+        from boto3.s3.transfer import TransferConfig
+        media_type = ARTIFACT_MEDIA_TYPES.get(path.suffix) or mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        config = TransferConfig(multipart_threshold=S3_PART_BYTES, multipart_chunksize=S3_PART_BYTES,
+                                max_concurrency=S3_UPLOAD_CONCURRENCY)
+        self.client().upload_file(str(path), S3_BUCKET, key, Config=config,
+                                  ExtraArgs={"ContentType": media_type, "CacheControl": cache_control})
+
+    def put(self, job_id: str, name: str, path: pathlib.Path, immutable: bool = False) -> None:
+        self.upload(path, self.key(job_id, name), IMMUTABLE_CACHE_CONTROL if immutable else "no-cache")
+        count("artifact_uploads")
+
+    def fetch(self, job_id: str, name: str, dest: pathlib.Path) -> bool:
+        from botocore.exceptions import ClientError
+        tmp = dest.with_name(f".{dest.name}.download")
+        try:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            self.client().download_file(S3_BUCKET, self.key(job_id, name), str(tmp))
+        except ClientError as e:
+            tmp.unlink(missing_ok=True)
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return False
+            raise
+        os.replace(tmp, dest)
+        return True
+
+    def publish(self, workdir: pathlib.Path, manifest: dict) -> dict:
+        """Upload the published artifacts and the stream segments, then the manifest (listing them) last."""
+        names = [n for n in manifest["artifacts"] if (workdir / n).is_file()]
+        if (workdir / HLS_DIR).is_dir():
+            names += sorted(p.relative_to(workdir).as_posix() for p in (workdir / HLS_DIR).rglob("*") if p.is_file())
+        started, size = time.monotonic(), 0
+        for name in names:
+            self.upload(workdir / name, self.key(workdir.name, name), IMMUTABLE_CACHE_CONTROL)
+            size += (workdir / name).stat().st_size
+        manifest = {**manifest, "store": {"backend": self.name, "bucket": S3_BUCKET, "files": names}}
+        write_atomic(workdir / MANIFEST, json.dumps(manifest, indent=2))
+        self.upload(workdir / MANIFEST, self.key(workdir.name, MANIFEST), "no-cache")
+        log.info("Job %s: %d artifacts (%d bytes) uploaded to s3://%s/%s in %.1fs", workdir.name, len(names), size,
+                 S3_BUCKET, self.key(workdir.name, ""), time.monotonic() - started)
+        count("artifact_uploads", len(names) + 1)
+        if not S3_KEEP_LOCAL:
+            for name in names:
+                (workdir / name).unlink(missing_ok=True)
+            shutil.rmtree(workdir / HLS_DIR, ignore_errors=True)
+        return manifest
+
+    def manifest(self, job_id: str) -> Optional[dict]:
+        """The job's manifest: the local copy, else the bucket's (cached; other hosts published it)."""
+        local = load_manifest(RENDERS_DIR / job_id)
+        if local is not None:
+            return local
+        with self._lock:
+            if job_id in self._manifests:
+                self._manifests.move_to_end(job_id)
+                return self._manifests[job_id]
+        from botocore.exceptions import ClientError
+        try:
+            obj = self.client().get_object(Bucket=S3_BUCKET, Key=self.key(job_id, MANIFEST))
+            manifest = json.loads(obj["Body"].read())
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None
+            raise
+        with self._lock:
+            self._manifests[job_id] = manifest
+            while len(self._manifests) > S3_MANIFEST_CACHE:
+                self._manifests.popitem(last=False)
+        return manifest
+
+    def delete(self, job_id: str) -> int:
+        """Delete every object under the job's prefix (artifacts, stream, checkpoint). Returns how many."""
+        client, deleted = self.client(), 0
+        for page in client.get_paginator("list_objects_v2").paginate(Bucket=S3_BUCKET, Prefix=self.key(job_id, "")):
+            keys = [{"Key": obj["Key"]} for obj in page.get("Contents", [])]  # at most 1000, a DeleteObjects batch
+            if not keys:
+                continue
+            errors = client.delete_objects(Bucket=S3_BUCKET, Delete={"Objects": keys, "Quiet": True}).get("Errors", [])
+            for e in errors:
+                log.warning("Job %s: s3://%s/%s not deleted: %s", job_id, S3_BUCKET, e.get("Key"), e.get("Message"))
+            deleted += len(keys) - len(errors)
+        with self._lock:
+            self._manifests.pop(job_id, None)
+        count("artifact_deletes", deleted)
+        return deleted
+
+    def response(self, request: Request, job_id: str, name: str, headers: dict) -> Response:
+        etag = headers.get("ETag")
+        if etag and etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+            return Response(status_code=304, headers=headers)
+        key = self.key(job_id, name)
+        if ARTIFACT_URL_MODE == "presign" and not name.endswith(".m3u8"):
+            url = self.client().generate_presigned_url("get_object", Params={"Bucket": S3_BUCKET, "Key": key},
+                                                       ExpiresIn=S3_PRESIGN_SECONDS)
+            count("artifact_presigned")
+            return RedirectResponse(url, status_code=307, headers={"Cache-Control": f"private, max-age={S3_PRESIGN_SECONDS // 2}"})
+        return self._proxy(request, key, name, headers)
+
+    def _proxy(self, request: Request, key: str, name: str, headers: dict) -> Response:
+        from botocore.exceptions import ClientError
+        params = {"Bucket": S3_BUCKET, "Key": key}
+        if request.headers.get("range"):
+            params["Range"] = request.headers["range"]
+        try:
+            obj = (self.client().head_object if request.method == "HEAD" else self.client().get_object)(**params)
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            if code == "InvalidRange":
+                return Response(status_code=416, headers={"Content-Range": "bytes */*"})
+            if code in ("NoSuchKey", "404"):
+                return JSONResponse({"error": "Not found"}, status_code=404)
+            raise
+        count("artifact_proxied")
+        media_type = ARTIFACT_MEDIA_TYPES.get(pathlib.PurePosixPath(name).suffix) or obj.get("ContentType")
+        out = {**headers, "Accept-Ranges": "bytes", "Content-Length": str(obj["ContentLength"])}
+        status = 200
+        if obj.get("ContentRange") and "Range" in params:
+            out["Content-Range"] = obj["ContentRange"]
+            status = 206
+        if request.method == "HEAD":
+            return Response(status_code=status, headers=out, media_type=media_type)
+        return StreamingResponse(obj["Body"].iter_chunks(1 << 16), status_code=status, headers=out, media_type=media_type)
+
+STORE = S3Store() if ARTIFACT_STORE == "s3" else LocalStore()
@@ -0,0 +1,185 @@
+"""Streaming generate call and its incremental JSON field scanner."""
+import json, pathlib, time, bisect
+from typing import List, Optional
+
+from app.core import OPENAI_MODEL, get_client, job_log, set_job
+
+# ---------- Streaming generate ----------
+# The generate call is streamed (GENERATE_STREAMING) through JSONFieldStream, which reports each
+# top-level field of the answer as soon as its value is complete, and each element of a
+# top-level array as soon as that element is. subtitle_cues is usually finished long before the
+# code, so the captions are written and the narration is synthesized (into the job's TTS cache)
+# while the code is still arriving; every finished cue is also published on /jobs/{id} as
+# narrationDraft. The full answer is still parsed and validated as a whole at the end.
+class JSONFieldStream:
+    """
+    Incremental scanner over the text of one JSON object. The text is kept as the list of fed
+    chunks (joined only on demand), so feeding stays linear in the answer's length.
+    """
+
+    def __init__(self, on_field=None, on_item=None):
+        self.on_field = on_field  # (key, value) once a top-level field is complete
+        self.on_item = on_item  # (key, index, value) once an element of a top-level array is complete
+        self._chunks: List[str] = []
+        self._starts: List[int] = []  # offset of each chunk in the text
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key_start: Optional[int] = None
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+        self._array_key: Optional[str] = None
+        self._item_start: Optional[int] = None
+        self._items = 0
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far."""
+        if len(self._chunks) > 1:
+            self._chunks, self._starts = ["".join(self._chunks)], [0]
+        return self._chunks[0] if self._chunks else ""
+
+    def _slice(self, start: int, end: int) -> str:
+        """text[start:end], joined from the chunks it spans only."""
+        k = bisect.bisect_right(self._starts, start) - 1
+        parts = []
+        while k < len(self._chunks) and self._starts[k] < end:
+            offset = self._starts[k]
+            parts.append(self._chunks[k][max(start - offset, 0):end - offset])
+            k += 1
+        return "".join(parts)
+
+    def feed(self, chunk: str) -> None:
+        if not chunk:
+            return
+        base = self._pos
+        self._chunks.append(chunk)
+        self._starts.append(base)
+        self._pos += len(chunk)
+        for j, ch in enumerate(chunk):
+            i = base + j
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._key_start is not None:
+                        self._key = self._decode(self._slice(self._key_start, i + 1))
+                        self._key_start = None
+                continue
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._value_start is None:
+                    self._key_start = i
+            elif ch == ":" and self._depth == 1 and self._value_start is None:
+                self._value_start = i + 1
+            elif ch in "{[":
+                if ch == "[" and self._depth == 1 and self._value_start is not None:
+                    self._array_key, self._item_start, self._items = self._key, i + 1, 0
+                self._depth += 1
+            elif ch in "}]":
+                if ch == "]" and self._depth == 2 and self._array_key is not None:
+                    self._item(self._slice(self._item_start, i))
+                    self._array_key = None
+                self._depth -= 1
+                if self._depth == 0:
+                    self._field(self._slice(self._value_start, i) if self._value_start is not None else "")
+            elif ch == ",":
+                if self._depth == 1:
+                    self._field(self._slice(self._value_start, i) if self._value_start is not None else "")
+                elif self._depth == 2 and self._array_key is not None:
+                    self._item(self._slice(self._item_start, i))
+                    self._item_start = i + 1
+
+    @staticmethod
+    def _decode(raw: str):
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
+
+    def _field(self, raw: str) -> None:
+        key, self._key, self._value_start = self._key, None, None
+        if key is None or not raw.strip():
+            return
+        value = self._decode(raw)
+        if self.on_field is not None and value is not None:
+            self.on_field(key, value)
+
+    def _item(self, raw: str) -> None:
+        if not raw.strip():
+            return
+        value = self._decode(raw)
+        if self.on_item is not None and value is not None:
+            self.on_item(self._array_key, self._items, value)
+        self._items += 1
+
+def normalize_cues(cues: list) -> list:
+    """Accept cues as {time, text} or {start, end, text}; fill in missing ends and coerce numbers."""
+    for i, cue in enumerate(cues):
+        # If only "time" exists, map to start/end
+        if "start" not in cue and "time" in cue:
+            try:
+                t = float(cue["time"])
+            except Exception:
+                t = 0.0
+            if i + 1 < len(cues) and "time" in cues[i + 1]:
+                try:
+                    next_t = float(cues[i + 1]["time"])
+                    cue["end"] = max(t + 0.2, next_t - 0.2)
+                except Exception:
+                    cue["end"] = t + 2.0
+            else:
+                cue["end"] = t + 2.0
+            cue["start"] = t
+            cue.pop("time", None)
+        # If start exists but no end, default to +2.0s
+        if "start" in cue and "end" not in cue:
+            try:
+                st = float(cue["start"])
+            except Exception:
+                st = 0.0
+            cue["end"] = st + 2.0
+        # Ensure numeric types
+        if "start" in cue:
+            cue["start"] = float(cue["start"])
+        if "end" in cue:
+            cue["end"] = float(cue["end"])
+    return cues
+
+def stream_generate(messages: List[dict], job_id: str, workdir: pathlib.Path, on_cues=None):
+    """
+    Streamed generate call (JSON mode). Returns (answer text, last chunk: it carries the usage);
+    on_cues(raw cue list) runs as soon as subtitle_cues is complete, before the rest of the answer.
+    """
+    started = time.monotonic()
+    drafts: List[str] = []
+
+    def on_item(key, index, value):
+        if key == "subtitle_cues" and isinstance(value, dict) and value.get("text"):
+            drafts.append(str(value["text"]))
+            set_job(job_id, narrationDraft=list(drafts))
+
+    def on_field(key, value):
+        job_log(workdir, f"generate: {key} complete after {time.monotonic() - started:.1f}s")
+        if key == "subtitle_cues" and isinstance(value, list) and on_cues is not None:
+            on_cues(value)
+
+    parser = JSONFieldStream(on_field, on_item)
+    last = None
+    response = get_client().chat.completions.create(
+        model=OPENAI_MODEL,
+        messages=messages,
+        response_format={"type": "json_object"},
+        temperature=1,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    for chunk in response:
+        last = chunk
+        if chunk.choices and chunk.choices[0].delta.content:
+            parser.feed(chunk.choices[0].delta.content)
+    return parser.text, last
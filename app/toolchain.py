@@ -0,0 +1,73 @@
+"""Toolchain probe: paths and versions of manim, ffmpeg, ffprobe and latex."""
+import subprocess, threading, time, importlib.util
+from typing import List, Optional
+
+from shutil import which
+
+from app.core import TOOLCHAIN_PROBE_INTERVAL, TOOLCHAIN_PROBE_TIMEOUT, log
+
+# ---------- Toolchain probe ----------
+# Paths and versions of the external tools, probed once at startup (in the background: `manim
+# --version` alone takes seconds) and again every TOOLCHAIN_PROBE_INTERVAL seconds, so requests
+# read a cached dict instead of searching PATH. /ready and /diag report the last probe.
+TOOLCHAIN_TOOLS = {  # tool -> version command
+    "manim": ["manim", "--version"],
+    "ffmpeg": ["ffmpeg", "-version"],
+    "ffprobe": ["ffprobe", "-version"],
+    "latex": ["latex", "--version"],
+}
+TOOLCHAIN_REQUIRED = ("manim", "ffmpeg")  # jobs are refused without these; ffprobe/latex only degrade
+TOOLCHAIN_MODULES = ("openai", "pydub")  # checked with find_spec, not imported
+TOOLCHAIN = {}
+TOOLCHAIN_LOCK = threading.Lock()
+
+def _tool_version(cmd: List[str]) -> Optional[str]:
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True, timeout=TOOLCHAIN_PROBE_TIMEOUT)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    lines = (proc.stdout or proc.stderr or "").strip().splitlines()
+    return lines[0].strip()[:200] if lines else None
+
+def probe_toolchain() -> dict:
+    """Probe the tools and Python modules the pipeline needs and cache the result in TOOLCHAIN."""
+    started = time.monotonic()
+    tools = {}
+    for name, cmd in TOOLCHAIN_TOOLS.items():
+        path = which(cmd[0])
+        tools[name] = {"path": path, "version": _tool_version([path] + cmd[1:]) if path else None}
+    probe = {
+        "probedAt": time.time(),
+        "seconds": round(time.monotonic() - started, 3),
+        "tools": tools,
+        "modules": {m: importlib.util.find_spec(m) is not None for m in TOOLCHAIN_MODULES},
+        "missing": [t for t in TOOLCHAIN_REQUIRED if not tools[t]["path"]],
+    }
+    with TOOLCHAIN_LOCK:
+        TOOLCHAIN.clear()
+        TOOLCHAIN.update(probe)
+    return probe
+
+def toolchain(wait: bool = True) -> dict:
+    """The last probe. Before the first one has finished: probes now, or {} when wait is False."""
+    with TOOLCHAIN_LOCK:
+        if TOOLCHAIN or not wait:
+            return dict(TOOLCHAIN)
+    return probe_toolchain()
+
+def _toolchain_loop():
+    while True:
+        try:
+            probe = probe_toolchain()
+            if probe["missing"]:
+                log.warning("Toolchain: %s not found on PATH", ", ".join(probe["missing"]))
+            log.info("Toolchain probed in %.1fs: %s", probe["seconds"],
+                     {k: v["version"] for k, v in probe["tools"].items()})
+        except Exception as e:
+            log.error("Toolchain probe failed: %s", e)
+        if TOOLCHAIN_PROBE_INTERVAL <= 0:
+            return
+        time.sleep(TOOLCHAIN_PROBE_INTERVAL)
+
+def start_toolchain_probe():
+    threading.Thread(target=_toolchain_loop, daemon=True, name="toolchain-probe").start()
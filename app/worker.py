@@ -0,0 +1,43 @@
+"""
+Render worker: claims jobs from the Redis queue at QUEUE_URL and runs them, without serving HTTP.
+
+The API process runs with JOB_QUEUE=1 QUEUE_WORKERS=0 and only enqueues; next to it, on the
+same host or on others, run
+
+    JOB_QUEUE=1 QUEUE_URL=redis://queue-host:6379/0 ARTIFACT_STORE=s3 S3_BUCKET=renders \
+        python -m app.worker --slots 2
+
+Workers share only the queue and the artifact store: RENDERS_DIR is local scratch space, the
+payload.json checkpoint and the live stream go through the store, and the job index writes go
+back to the API process through the queue. Workers on the API's host may keep
+ARTIFACT_STORE=local if they share its RENDERS_DIR.
+
+Ctrl-C or SIGTERM stops claiming, lets the running jobs finish and deregisters the worker; a worker that dies instead loses its leases, and its jobs are redelivered.
+"""
+import os, sys, signal, argparse, threading
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slots", type=int, default=max(1, int(os.getenv("QUEUE_WORKERS", "1"))),
+                        help="jobs run at once by this worker")
+    args = parser.parse_args(argv)
+
+    os.environ["JOB_QUEUE"] = "1"  # read by app.jobqueue at import
+    from app.scheduler import calibrate_render_cost_model
+    from app.jobqueue import QueueWorker
+
+    threading.Thread(target=calibrate_render_cost_model, daemon=True, name="render-cost-fit").start()
+    worker = QueueWorker(args.slots, forward_index=True)
+    if not worker.start():
+        sys.exit(1)
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    while not stop.wait(1):
+        pass
+    print("[worker] stopping: waiting for running jobs", file=sys.stderr)
+    worker.stop()
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,76 @@
+"""downscale_complexity(): over-budget literals clamped to the quality tier, everything else left as written."""
+import ast, os, re
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from app import complexity  # noqa: E402
+from app.complexity import downscale_complexity  # noqa: E402
+
+HEAD = "from manim import *\nclass S(ThreeDScene):\n    def construct(self):\n"
+
+def scene(*lines: str) -> str:
+    return HEAD + "".join(f"        {line}\n" for line in lines)
+
+@pytest.fixture(params=["-ql", "-qh"])
+def tier(request, monkeypatch):
+    monkeypatch.setattr(complexity, "MANIM_QUALITY_FLAG", request.param)
+    return request.param
+
+def call(code: str, name: str) -> ast.Call:
+    return next(n for n in ast.walk(ast.parse(code)) if isinstance(n, ast.Call) and ast.unparse(n.func).endswith(name))
+
+def number(node: ast.AST) -> float:
+    return complexity._number(node)
+
+def test_surface_resolution_fits_the_cell_budget(tier):
+    code, notes = downscale_complexity(scene("s = Surface(lambda u, v: [u, v, 0], resolution=(120, 60))  # keep me"))
+    u, v = (number(e) for e in complexity._keyword(call(code, "Surface"), "resolution").elts)
+    assert u * v <= complexity.COMPLEXITY_BUDGETS[tier]["surface_cells"]
+    assert u / v == pytest.approx(2, rel=0.1)  # aspect ratio kept
+    assert "# keep me" in code and len(notes) == 1 and "120x60" in notes[0]
+
+def test_default_resolution_over_budget_gets_an_explicit_one(monkeypatch):
+    monkeypatch.setattr(complexity, "MANIM_QUALITY_FLAG", "-ql")
+    code, notes = downscale_complexity(scene("s = Sphere(radius=2)", "t = Surface(lambda u, v: [u, v, 0])"))
+    assert "Sphere(radius=2, resolution=(" in code
+    assert "Surface(lambda u, v: [u, v, 0])\n" in code  # 32x32 default is within the -ql budget
+    assert len(notes) == 1 and "101x51" in notes[0]
+
+def test_curve_step_is_coarsened_to_the_sample_budget(tier):
+    code, notes = downscale_complexity(scene(
+        "g = ParametricFunction(lambda t: [t, t, 0], t_range=[0, TAU, 0.001])",
+        "f = ax.plot(lambda x: x, x_range=[-5, 5, 0.01])",
+        "h = ax.plot(lambda x: x, x_range=[-5, 5, 0.5])"))
+    budget = complexity.COMPLEXITY_BUDGETS[tier]["curve_samples"]
+    for name, key in (("ParametricFunction", "t_range"), ("plot", "x_range")):
+        lo, hi, step = complexity._range_triple(complexity._keyword(call(code, name), key))
+        assert abs(hi - lo) / step <= budget
+    assert "x_range=[-5, 5, 0.5]" in code and len(notes) == 2
+
+def test_stream_lines_density_and_anchors(tier):
+    code, notes = downscale_complexity(scene(
+        "sl = StreamLines(func, x_range=[-7, 7, 0.1], y_range=[-4, 4, 0.1], max_anchors_per_line=500)"))
+    budget = complexity.COMPLEXITY_BUDGETS[tier]
+    sl = call(code, "StreamLines")
+    xr, yr = (complexity._range_triple(complexity._keyword(sl, k)) for k in ("x_range", "y_range"))
+    lines = (xr[1] - xr[0]) / xr[2] * (yr[1] - yr[0]) / yr[2]
+    assert budget["stream_lines"] * 0.9 <= lines <= budget["stream_lines"] * 1.1
+    assert number(complexity._keyword(sl, "max_anchors_per_line")) == budget["stream_anchors"]
+    assert len(notes) == 2
+
+def test_camera_rotation_is_capped_per_frame(tier):
+    code, notes = downscale_complexity(scene("self.begin_ambient_camera_rotation(rate=-3)",
+                                             "self.begin_ambient_camera_rotation(0.2)"))
+    cap = complexity.AMBIENT_MAX_RADIANS_PER_FRAME * complexity.QUALITY_FPS[tier]
+    rates = [float(r) for r in re.findall(r"begin_ambient_camera_rotation\((?:rate=)?(-?[\d.]+)\)", code)]
+    assert rates == [pytest.approx(-cap, abs=1e-3), 0.2]
+    assert len(notes) == 1
+
+def test_within_budget_or_unparseable_code_is_unchanged(tier):
+    ok = scene("s = Surface(lambda u, v: [u, v, 0], resolution=(8, 8))",
+               "g = ParametricFunction(lambda t: [t, t, 0], t_range=[0, 1, n])")  # non-literal step
+    assert downscale_complexity(ok) == (ok, [])
+    broken = scene("s = Surface(resolution=(999, 999)")
+    assert downscale_complexity(broken) == (broken, [])
@@ -0,0 +1,104 @@
+"""finalize_job() and prune_orphan_blobs() on temp job dirs: atomic publish, cleanup, blob dedupe and its GC."""
+import errno, json, os, shutil
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from app import artifacts  # noqa: E402
+from app.artifacts import MANIFEST, file_sha256, finalize_job, prune_orphan_blobs  # noqa: E402
+from app.hls import HLS_DIR, HLS_PLAYLIST  # noqa: E402
+
+VIDEO = b"mp4" * 1000
+NARRATION = b"mp3" * 500
+
+@pytest.fixture
+def renders(tmp_path, monkeypatch):
+    """A temp renders dir with its blob store; no ffmpeg: the thumbnail is a fixed file."""
+    monkeypatch.setattr(artifacts, "BLOBS_DIR", tmp_path / "_blobs")
+    monkeypatch.setattr(artifacts, "probe_duration", lambda path: 2.0)
+    monkeypatch.setattr(artifacts, "make_thumbnail", lambda workdir: (workdir / "thumb.jpg").write_bytes(b"jpg"))
+    return tmp_path
+
+def rendered_job(root, job_id: str, video: bytes = VIDEO):
+    """A job dir as the pipeline leaves it before finalize: the muxed video and its leftovers."""
+    workdir = root / job_id
+    for rel, data in (("merged.mp4", video), ("narration.mp3", NARRATION), ("scene.py", b"code"),
+                      ("job.log", b"log"), ("captions.vtt", b"WEBVTT\n"), ("silent.mp4", b"silent"),
+                      ("speech_chunk_0.mp3", b"c0"), ("speech_chunk_1.mp3", b"c1"), ("narration_preview.mp3", b"p"),
+                      ("scene_section1.py", b"s1"), ("scene_sectioned.py", b"s"), (".out.mp4.tmp", b"half"),
+                      ("media/videos/scene/480p15/S.mp4", b"v" * 100), ("videos/a.mp4", b"a"), ("Tex/x.svg", b"x"),
+                      (HLS_PLAYLIST, b"#EXTM3U\n"), (f"{HLS_DIR}/a1/seg_000.m4s", b"seg"), (f"{HLS_DIR}/a1/part_0.m3u8", b"p")):
+        path = workdir / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return workdir
+
+def files(workdir):
+    return sorted(p.relative_to(workdir).as_posix() for p in workdir.rglob("*") if p.is_file())
+
+def test_finalize_publishes_atomically_and_keeps_only_the_artifacts(renders):
+    workdir = rendered_job(renders, "0000000a")
+    manifest = finalize_job(workdir, workdir / "merged.mp4")
+    assert (workdir / "out.mp4").read_bytes() == VIDEO and not (workdir / "merged.mp4").exists()
+    assert files(workdir) == sorted(["out.mp4", "narration.mp3", "scene.py", "job.log", "captions.vtt", "thumb.jpg",
+                                     HLS_PLAYLIST, f"{HLS_DIR}/a1/seg_000.m4s", MANIFEST])
+    assert json.loads((workdir / MANIFEST).read_text()) == manifest
+    assert set(manifest["artifacts"]) == {"out.mp4", "captions.vtt", "thumb.jpg", HLS_PLAYLIST}
+    assert manifest["artifacts"]["out.mp4"] == {"sha256": file_sha256(workdir / "out.mp4"), "size": len(VIDEO)}
+    assert manifest["duration"] == 2.0
+
+def test_large_artifacts_are_hard_links_to_their_blob(renders):
+    workdir = rendered_job(renders, "0000000a")
+    finalize_job(workdir, workdir / "merged.mp4")
+    for name, data in (("out.mp4", VIDEO), ("narration.mp3", NARRATION)):
+        sha = file_sha256(workdir / name)
+        blob = renders / "_blobs" / sha[:2] / (sha + os.path.splitext(name)[1])
+        assert blob.read_bytes() == data
+        assert os.path.samefile(blob, workdir / name) and blob.stat().st_nlink == 2
+    assert not list((renders / "_blobs").glob("*/.*"))  # no temp links left behind
+
+def test_identical_outputs_share_one_inode(renders):
+    a = rendered_job(renders, "0000000a")
+    b = rendered_job(renders, "0000000b")
+    c = rendered_job(renders, "0000000c", video=b"other" * 100)
+    for workdir in (a, b, c):
+        finalize_job(workdir, workdir / "merged.mp4")
+    assert os.path.samefile(a / "out.mp4", b / "out.mp4")
+    assert not os.path.samefile(a / "out.mp4", c / "out.mp4")
+    assert (a / "out.mp4").stat().st_nlink == 3  # two job dirs and the blob
+    assert os.path.samefile(a / "narration.mp3", c / "narration.mp3")
+    assert len(list((renders / "_blobs").glob("*/*"))) == 3
+
+def test_without_hard_links_files_stay_plain_copies(renders, monkeypatch):
+    def no_links(src, dst, **kwargs):
+        raise OSError(errno.EPERM, "Operation not permitted")
+    monkeypatch.setattr(os, "link", no_links)
+    workdir = rendered_job(renders, "0000000a")
+    manifest = finalize_job(workdir, workdir / "merged.mp4")
+    assert (workdir / "out.mp4").read_bytes() == VIDEO and (workdir / "out.mp4").stat().st_nlink == 1
+    assert (workdir / MANIFEST).is_file() and "out.mp4" in manifest["artifacts"]
+    assert not list((renders / "_blobs").rglob("*.*"))
+    assert not (workdir / ".out.mp4.tmp").exists()
+    assert prune_orphan_blobs() == (0, 0)
+
+def test_blob_is_pruned_once_its_last_job_dir_is_gone(renders):
+    a = rendered_job(renders, "0000000a")
+    b = rendered_job(renders, "0000000b")
+    for workdir in (a, b):
+        finalize_job(workdir, workdir / "merged.mp4")
+    assert prune_orphan_blobs() == (0, 0)
+    shutil.rmtree(a)
+    assert prune_orphan_blobs() == (0, 0)  # b still links both blobs
+    shutil.rmtree(b)
+    assert prune_orphan_blobs(dry_run=True) == (2, len(VIDEO) + len(NARRATION))
+    assert len(list((renders / "_blobs").glob("*/*"))) == 2
+    assert prune_orphan_blobs() == (2, len(VIDEO) + len(NARRATION))
+    assert list((renders / "_blobs").glob("*/*")) == []
+    assert prune_orphan_blobs() == (0, 0)
+
+def test_temp_blobs_of_an_unfinished_link_are_not_pruned(renders):
+    tmp = renders / "_blobs" / "ab" / ".abcd.mp4.1234abcd.tmp"
+    tmp.parent.mkdir(parents=True)
+    tmp.write_bytes(b"in progress")
+    assert prune_orphan_blobs() == (0, 0) and tmp.exists()
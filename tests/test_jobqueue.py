@@ -0,0 +1,137 @@
+"""Redis job queue against app/fake_redis.py: leases, heartbeats, redelivery and racing workers."""
+import os, json, threading, time
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+pytest.importorskip("redis")
+
+from app import jobqueue  # noqa: E402
+from app.fake_redis import FakeRedisServer  # noqa: E402
+
+@pytest.fixture(scope="module")
+def server():
+    server = FakeRedisServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def queue(server, monkeypatch):
+    monkeypatch.setattr(jobqueue, "QUEUE_URL", server.url)
+    monkeypatch.setattr(jobqueue, "QUEUE_LEASE_SECONDS", 0.3)
+    monkeypatch.setattr(jobqueue, "QUEUE_HEARTBEAT_SECONDS", 0.1)
+    monkeypatch.setattr(jobqueue, "toolchain", lambda wait=True: {"missing": [], "tools": {}})
+    index_writes = []
+    monkeypatch.setattr(jobqueue.JOB_INDEX, "submit", lambda sql, params=(): index_writes.append((sql, params)))
+    jobqueue.queue_client().flushall()
+    return index_writes
+
+def test_claims_the_oldest_queued_job_once(queue):
+    jobqueue.enqueue_job("aaaaaaaa", "first", stream=False)
+    jobqueue.enqueue_job("bbbbbbbb", "second", stream=True)
+    row = jobqueue.claim_job("w1")
+    assert (row["job_id"], row["prompt"], row["stream"], row["deliveries"]) == ("aaaaaaaa", "first", 0, 0)
+    assert jobqueue.claim_job("w2")["job_id"] == "bbbbbbbb"
+    assert jobqueue.claim_job("w3") is None
+    assert jobqueue.queue_depth() == {"queued": 0, "leased": 2}
+
+def test_expired_lease_is_reclaimed_by_another_worker(queue):
+    jobqueue.enqueue_job("aaaaaaaa", "p", stream=False)
+    first = jobqueue.QueueWorker(1)
+    assert jobqueue.claim_job(first.worker_id)["deliveries"] == 0
+    assert jobqueue.claim_job("w2") is None  # leased, not expired
+    time.sleep(0.4)
+    row = jobqueue.claim_job("w2")
+    assert (row["job_id"], row["deliveries"]) == ("aaaaaaaa", 1)
+    # The first worker's late renewal and completion must not take the job back
+    first._running.add("aaaaaaaa")
+    first.heartbeat()
+    assert jobqueue.queued_job("aaaaaaaa")["jobQueue"]["worker"] == "w2"
+    assert first.complete("aaaaaaaa", {"jobId": "aaaaaaaa", "status": "done"}, 200) is False
+    assert jobqueue.queue_outcome("aaaaaaaa")["state"] == "leased"
+
+def test_job_fails_after_max_deliveries(queue, monkeypatch):
+    monkeypatch.setattr(jobqueue, "QUEUE_MAX_DELIVERIES", 2)
+    monkeypatch.setattr(jobqueue, "QUEUE_LEASE_SECONDS", 0.05)
+    jobqueue.enqueue_job("aaaaaaaa", "p", stream=False)
+    for n in range(2):
+        assert jobqueue.claim_job(f"w{n}")["deliveries"] == n
+        time.sleep(0.1)
+    assert jobqueue.claim_job("w9") is None
+    outcome = jobqueue.queue_outcome("aaaaaaaa")
+    assert (outcome["state"], outcome["http_status"]) == ("failed", 500)
+    assert json.loads(outcome["job"])["result"]["stage"] == "queue"
+    assert jobqueue.queue_depth() == {"queued": 0, "leased": 0}
+    assert [params[2] for sql, params in queue if "worker_lost" in sql] == ["aaaaaaaa"]
+
+def test_heartbeat_renews_the_lease_and_copies_status(queue):
+    worker = jobqueue.QueueWorker(1)
+    jobqueue.enqueue_job("aaaaaaaa", "p", stream=False)
+    jobqueue.claim_job(worker.worker_id)
+    worker._running.add("aaaaaaaa")
+    jobqueue.set_job("aaaaaaaa", status="running", stage="render")
+    for _ in range(4):  # 0.6s in all, twice the lease
+        time.sleep(0.15)
+        worker.heartbeat()
+        assert jobqueue.claim_job("thief") is None
+    job = jobqueue.queued_job("aaaaaaaa")
+    assert job["stage"] == "render" and job["jobQueue"]["worker"] == worker.worker_id
+    assert [w["worker_id"] for w in jobqueue.live_workers()] == [worker.worker_id]
+    assert jobqueue.live_workers()[0]["running"] == ["aaaaaaaa"]
+
+def test_completion_is_visible_to_waiters(queue):
+    worker = jobqueue.QueueWorker(1)
+    jobqueue.enqueue_job("aaaaaaaa", "p", stream=False)
+    jobqueue.claim_job(worker.worker_id)
+    assert worker.complete("aaaaaaaa", {"jobId": "aaaaaaaa", "status": "done", "result": {"jobId": "aaaaaaaa"}}, 200)
+    assert jobqueue.queue_depth() == {"queued": 0, "leased": 0}
+    import asyncio
+    assert asyncio.run(jobqueue.wait_for_queued_job("aaaaaaaa")) == {"jobId": "aaaaaaaa"}
+
+def test_two_workers_racing_for_one_job(queue, monkeypatch):
+    monkeypatch.setattr(jobqueue, "QUEUE_LEASE_SECONDS", 60)
+    for n in range(20):
+        job_id = f"{n:08x}"
+        jobqueue.enqueue_job(job_id, "p", stream=False)
+        barrier, claims = threading.Barrier(2), []
+
+        def race(worker_id):
+            barrier.wait()
+            claims.append((worker_id, jobqueue.claim_job(worker_id)))
+
+        threads = [threading.Thread(target=race, args=(w,)) for w in ("w1", "w2")]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        winners = [w for w, row in claims if row is not None]
+        assert len(winners) == 1
+        assert jobqueue.queued_job(job_id)["jobQueue"] == {"state": "leased", "deliveries": 1, "worker": winners[0]}
+
+def test_index_writes_are_forwarded_to_the_api_process(queue):
+    jobqueue.forward_index_write("UPDATE jobs SET status = ? WHERE job_id = ?", ("done", "aaaaaaaa"))
+    assert queue == []
+    assert jobqueue.drain_index_writes() == 1
+    assert queue == [("UPDATE jobs SET status = ? WHERE job_id = ?", ("done", "aaaaaaaa"))]
+    assert jobqueue.drain_index_writes() == 0
+
+def test_redelivery_reads_inputs_through_the_store(queue, monkeypatch, tmp_path):
+    calls = []
+
+    class Store:
+        def manifest(self, job_id):
+            return {"artifacts": {}} if job_id == "aaaaaaaa" else None
+
+        def fetch(self, job_id, name, dest):
+            calls.append(("fetch", job_id, name))
+            return False
+
+    monkeypatch.setattr(jobqueue, "STORE", Store())
+    monkeypatch.setattr(jobqueue, "RENDERS_DIR", tmp_path)
+    monkeypatch.setattr(jobqueue, "run_job", lambda prompt, job_id, stream, created_at: calls.append(("run", job_id)))
+    published = {"job_id": "aaaaaaaa", "prompt": "p", "stream": 0, "deliveries": 1, "enqueued_at": 0.0}
+    assert jobqueue.run_queued_job(published)["videoUrl"] == "/renders/aaaaaaaa/out.mp4"
+    jobqueue.run_queued_job({**published, "job_id": "bbbbbbbb"})
+    assert calls == [("fetch", "bbbbbbbb", jobqueue.CHECKPOINT), ("run", "bbbbbbbb")]
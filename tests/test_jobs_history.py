@@ -0,0 +1,85 @@
+"""GET /jobs: newest-first keyset pages over the job index, with ties, a status filter and bad cursors."""
+import base64, os
+
+import pytest
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from app import main  # noqa: E402
+from app.index import JobIndex, _decode_cursor, _encode_cursor  # noqa: E402
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    index = JobIndex(tmp_path / "jobs.sqlite3")
+    monkeypatch.setattr(main, "JOB_INDEX", index)
+    return index
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+def add_jobs(index, rows):
+    """rows: (job_id, created_at, status)."""
+    conn = index.connect()
+    with conn:
+        conn.executemany("INSERT INTO jobs (job_id, created_at, prompt, prompt_hash, status) VALUES (?, ?, ?, '', ?)",
+                         [(job_id, created, f"prompt {job_id}", status) for job_id, created, status in rows])
+    conn.close()
+
+def all_pages(client, **params):
+    pages, cursor = [], None
+    while True:
+        body = client.get("/jobs", params={**params, **({"cursor": cursor} if cursor else {})}).json()
+        pages.append([item["jobId"] for item in body["items"]])
+        cursor = body["nextCursor"]
+        if cursor is None:
+            return pages
+
+def test_cursor_round_trips():
+    for created_at, job_id in ((1792394385.1938305, "0000000a"), (0.1 + 0.2, "ffffffff"), (0.0, "0000|00")):
+        assert _decode_cursor(_encode_cursor(created_at, job_id)) == (created_at, job_id)
+
+def test_pages_cover_every_job_once_newest_first(index, client):
+    # Three jobs share each created_at: the job id breaks the tie, so no page boundary skips or repeats one
+    rows = [(f"{i:08x}", 1000.0 + i // 3, "done") for i in range(20)]
+    add_jobs(index, rows)
+    pages = all_pages(client, limit=4)
+    assert [len(p) for p in pages] == [4, 4, 4, 4, 4]
+    expected = [job_id for job_id, _, _ in sorted(rows, key=lambda r: (r[1], r[0]), reverse=True)]
+    assert sum(pages, []) == expected
+
+def test_last_full_page_has_no_next_cursor(index, client):
+    add_jobs(index, [(f"{i:08x}", 1000.0 + i, "done") for i in range(3)])
+    body = client.get("/jobs", params={"limit": 3}).json()
+    assert len(body["items"]) == 3 and body["nextCursor"] is None
+
+def test_status_filter_pages_within_the_status(index, client):
+    add_jobs(index, [(f"{i:08x}", 1000.0 + i, "done" if i % 3 else "error") for i in range(12)])
+    pages = all_pages(client, limit=2, status="error")
+    assert sum(pages, []) == ["00000009", "00000006", "00000003", "00000000"]
+    item = client.get("/jobs", params={"status": "error", "limit": 1}).json()["items"][0]
+    assert item["status"] == "error" and item["videoUrl"] is None
+
+def test_limit_is_clamped(index, client):
+    add_jobs(index, [(f"{i:08x}", 1000.0 + i, "done") for i in range(main.JOBS_PAGE_MAX + 5)])
+    assert len(client.get("/jobs", params={"limit": 1000}).json()["items"]) == main.JOBS_PAGE_MAX
+    assert len(client.get("/jobs", params={"limit": 0}).json()["items"]) == 1
+
+def b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode()
+
+@pytest.mark.parametrize("cursor", ["not base64!", b64(b"no separator"), b64(b"yesterday|0000000a"), b64(b"\xff\xfe|x")])
+def test_invalid_cursor_is_a_400(index, client, cursor):
+    r = client.get("/jobs", params={"cursor": cursor})
+    assert r.status_code == 400 and r.json() == {"error": "Invalid cursor"}
+
+def test_pages_are_index_range_scans(index):
+    conn = index.connect()
+    for status in ("", "done"):
+        plan = " ".join(row["detail"] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT job_id FROM jobs WHERE purged_at IS NULL" + (" AND status = ?" if status else "")
+            + " AND (created_at, job_id) < (?, ?) ORDER BY created_at DESC, job_id DESC LIMIT 21",
+            ((status,) if status else ()) + (1000.0, "0000000a")))
+        assert "USING INDEX" in plan and "TEMP B-TREE" not in plan, plan
+    conn.close()
@@ -0,0 +1,42 @@
+"""Local fixers of render_with_repairs(): they must only touch what the traceback points at."""
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from app import fixers  # noqa: E402
+
+SCENE = '''from manim import *
+class S(Scene):
+    def construct(self):
+        a, b = Square(), Circle()
+        c = a.copy()
+        c.interpolate(a, b, 0.5)
+        c.interpolate_color(a, b, 0.3)
+        col = interpolate_color("#ff0000", Color(BLUE), 0.5)
+        self.add(c)
+'''
+
+def test_string_color_wraps_only_the_interpolate_color_function_on_the_failing_line():
+    fixed = fixers.fix_string_color(SCENE, {"line": 8})
+    assert 'col = interpolate_color(ManimColor("#ff0000"), ManimColor(BLUE), 0.5)' in fixed
+    assert "c.interpolate(a, b, 0.5)" in fixed
+    assert "c.interpolate_color(a, b, 0.3)" in fixed
+    assert "Color(ManimColor" not in fixed
+
+def test_string_color_leaves_mobject_interpolation_alone():
+    assert fixers.fix_string_color(SCENE, {"line": 6}) is None
+    assert fixers.fix_string_color(SCENE, {"line": 7}) is None
+
+def test_literal_newline_keeps_escapes_inside_strings():
+    code = 'x = 1\\nt = Text("a\\nb")\\ny = 2\n'
+    fixed = fixers.fix_literal_newline(code, {"line": 1})
+    assert fixed == 'x = 1\nt = Text("a\\nb")\ny = 2\n'
+
+def test_unterminated_string_joins_without_changing_the_text():
+    fixed = fixers.fix_unterminated_string('x = Tex(r"$\na^2$")\n', {"line": 1})
+    assert fixed == 'x = Tex(r"$a^2$")\n'
+    fixed = fixers.fix_unterminated_string('y = Text("one\n    two")\n', {"line": 1})
+    assert fixed == 'y = Text("one\\ntwo")\n'
+
+def test_unterminated_string_gives_up_when_nothing_compiles():
+    assert fixers.fix_unterminated_string('x = Text("a\ny = (\n', {"line": 1}) is None
@@ -0,0 +1,111 @@
+"""Render cache: keys, hits and misses, single-flight of identical renders and LRU eviction by bytes."""
+import os, threading, time
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from app import render  # noqa: E402
+
+CODE = "from manim import *\nclass S(Scene):\n    def construct(self):\n        self.add(Square())\n"
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """A temp cache with manim 0.18.0 probed; _render_scene_scheduled is replaced by a counting fake render."""
+    probe = {"tools": {"manim": {"version": "0.18.0"}}}
+    renders = []
+    lock = threading.Lock()
+
+    def fake_render(workdir, file_name, scene_name, timeout, cues, streamer, code, rec):
+        with lock:
+            renders.append(workdir.name)
+        time.sleep(fake_render.seconds)
+        mp4 = workdir / "videos" / "scene" / "480p15" / f"{scene_name}.mp4"
+        mp4.parent.mkdir(parents=True, exist_ok=True)
+        mp4.write_bytes(b"mp4:" + code.encode())
+        return "rendered", mp4
+    fake_render.seconds = 0.0
+
+    monkeypatch.setattr(render, "RENDER_CACHE_DIR", tmp_path / "_render_cache")
+    monkeypatch.setattr(render, "RENDER_CACHE_MAX_BYTES", 1 << 20)
+    monkeypatch.setattr(render, "MANIM_QUALITY_FLAG", "-ql")
+    monkeypatch.setattr(render, "toolchain", lambda: probe)
+    monkeypatch.setattr(render, "probe_duration", lambda path: 2.0)
+    monkeypatch.setattr(render, "_render_scene_scheduled", fake_render)
+    return {"root": tmp_path, "probe": probe, "renders": renders, "fake": fake_render}
+
+def job_dir(root, name: str, code: str = CODE):
+    workdir = root / name
+    workdir.mkdir()
+    (workdir / "scene.py").write_text(code, encoding="utf-8")
+    return workdir
+
+def test_key_covers_code_scene_version_and_quality(cache, monkeypatch):
+    key = render.render_cache_key(CODE, "S")
+    assert key == render.render_cache_key(CODE, "S")
+    assert key != render.render_cache_key(CODE + "\n", "S")
+    assert key != render.render_cache_key(CODE, "T")
+    cache["probe"]["tools"]["manim"]["version"] = "0.19.0"
+    assert key != render.render_cache_key(CODE, "S")
+    cache["probe"]["tools"]["manim"]["version"] = "0.18.0"
+    monkeypatch.setattr(render, "MANIM_QUALITY_FLAG", "-qh")
+    assert key != render.render_cache_key(CODE, "S")
+
+def test_no_key_without_a_probed_manim_version(cache):
+    cache["probe"]["tools"] = {}
+    assert render.render_cache_key(CODE, "S") is None
+
+def test_same_code_is_a_hit(cache):
+    out, first = render.render_scene(job_dir(cache["root"], "0000000a"), "scene.py", "S", 60)
+    assert out == "rendered"
+    out, second = render.render_scene(job_dir(cache["root"], "0000000b"), "scene.py", "S", 60)
+    assert out.startswith("[render cache]")
+    assert cache["renders"] == ["0000000a"]
+    assert second.read_bytes() == first.read_bytes()
+    assert second.is_relative_to(cache["root"] / "0000000b")
+
+def test_other_version_or_quality_is_a_miss(cache, monkeypatch):
+    render.render_scene(job_dir(cache["root"], "0000000a"), "scene.py", "S", 60)
+    cache["probe"]["tools"]["manim"]["version"] = "0.19.0"
+    render.render_scene(job_dir(cache["root"], "0000000b"), "scene.py", "S", 60)
+    monkeypatch.setattr(render, "MANIM_QUALITY_FLAG", "-qh")
+    render.render_scene(job_dir(cache["root"], "0000000c"), "scene.py", "S", 60)
+    assert cache["renders"] == ["0000000a", "0000000b", "0000000c"]
+    assert render.render_cache_usage()[0] == 3
+
+def test_concurrent_identical_renders_coalesce(cache):
+    cache["fake"].seconds = 0.3
+    workdirs = [job_dir(cache["root"], f"0000000{i}") for i in range(4)]
+    results = {}
+
+    def run(workdir):
+        results[workdir.name] = render.render_scene(workdir, "scene.py", "S", 60)
+
+    threads = [threading.Thread(target=run, args=(w,)) for w in workdirs]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert len(cache["renders"]) == 1
+    assert all(mp4 is not None and mp4.read_bytes() == b"mp4:" + CODE.encode() for _, mp4 in results.values())
+    assert sum(out.startswith("[render cache]") for out, _ in results.values()) == 3
+    assert render.RENDER_CACHE_INFLIGHT == {}
+
+def test_eviction_drops_least_recently_used_until_under_the_cap(cache, monkeypatch):
+    monkeypatch.setattr(render, "RENDER_CACHE_MAX_BYTES", 2500)
+    keys = [f"{i:02d}" + "0" * 62 for i in range(3)]
+    for age, key in zip((300, 200, 100), keys):
+        src = cache["root"] / f"{key}.mp4"  # one file per render: entries are hard links to it
+        src.write_bytes(b"x" * 1000)
+        render.render_cache_put(key, src)
+        entry = render.RENDER_CACHE_DIR / key[:2] / f"{key}.mp4"
+        os.utime(entry, (time.time() - age, time.time() - age))
+    assert render.render_cache_usage() == (2, 2000)  # the third put evicted the oldest
+    assert render.render_cache_get(keys[0]) is None
+    assert render.render_cache_get(keys[1]) is not None  # refreshes it: keys[2] is now the LRU one
+    src = cache["root"] / "new.mp4"
+    src.write_bytes(b"y" * 1000)
+    render.render_cache_put("ff" + "0" * 62, src)
+    assert render.render_cache_get(keys[2]) is None
+    assert render.render_cache_get(keys[1]) is not None
+    assert render.render_cache_usage() == (2, 2000)
@@ -0,0 +1,99 @@
+"""RenderLimits: a leaf cgroup under a delegated parent when configured, rlimits on the manim process otherwise."""
+import os, signal, subprocess, sys, types
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from app import process  # noqa: E402
+from app.process import OutputSink, RenderLimits, supervise  # noqa: E402
+
+linux_only = pytest.mark.skipif(not hasattr(process.resource, "prlimit"), reason="needs resource.prlimit")
+
+@pytest.fixture
+def caps(monkeypatch):
+    monkeypatch.setattr(process, "RENDER_CGROUP_PARENT", "")
+    monkeypatch.setattr(process, "RENDER_MEMORY_MAX_MB", 512)
+    monkeypatch.setattr(process, "RENDER_ADDRESS_SPACE_FACTOR", 4.0)
+    monkeypatch.setattr(process, "RENDER_CPU_QUOTA", 1.5)
+    monkeypatch.setattr(process, "RENDER_CPU_SECONDS", 0.0)
+    monkeypatch.setattr(process, "RENDER_PIDS_MAX", 64)
+    return monkeypatch
+
+@pytest.fixture
+def cgroup_parent(tmp_path, caps):
+    """A directory standing in for a delegated cgroup v2 parent (its control files are plain files here)."""
+    parent = tmp_path / "renders.slice"
+    parent.mkdir()
+    caps.setattr(process, "RENDER_CGROUP_PARENT", str(parent))
+    caps.setattr(process, "time", types.SimpleNamespace(sleep=lambda s: None, monotonic=process.time.monotonic))
+    return parent
+
+@pytest.fixture
+def sleeper():
+    proc = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"], start_new_session=True)
+    yield proc
+    proc.kill()
+    proc.wait()
+
+def test_configured_parent_gets_a_leaf_cgroup_with_caps(cgroup_parent):
+    limits = RenderLimits("0000000a")
+    leaf = limits.cgroup
+    assert leaf is not None and leaf.parent == cgroup_parent and leaf.name.startswith("render-0000000a-")
+    assert (cgroup_parent / "cgroup.subtree_control").read_text() == "+memory +cpu +pids"
+    assert (leaf / "memory.max").read_text() == str(512 * 1024 * 1024)
+    assert (leaf / "memory.swap.max").read_text() == "0"
+    assert (leaf / "cpu.max").read_text() == "150000 100000"
+    assert (leaf / "pids.max").read_text() == "64"
+
+@linux_only
+def test_attach_moves_the_process_into_the_cgroup_without_rlimits(cgroup_parent, sleeper):
+    limits = RenderLimits("0000000a")
+    limits.attach(sleeper.pid)
+    assert (limits.cgroup / "cgroup.procs").read_text() == str(sleeper.pid)
+    assert process.resource.prlimit(sleeper.pid, process.resource.RLIMIT_AS)[0] == process.resource.RLIM_INFINITY
+
+def test_cgroup_counters_name_the_breached_cap(cgroup_parent):
+    limits = RenderLimits("0000000a")
+    assert limits.breach(-9, "") is None
+    (limits.cgroup / "pids.events").write_text("max 3\n")
+    assert limits.breach(-9, "") == "pids"
+    (limits.cgroup / "memory.events").write_text("low 0\nhigh 0\nmax 12\noom 1\noom_kill 1\n")
+    assert limits.breach(-9, "") == "memory"
+
+def test_release_kills_what_is_left_in_the_leaf(cgroup_parent):
+    limits = RenderLimits("0000000a")
+    leaf = limits.cgroup
+    limits.release()
+    assert (leaf / "cgroup.kill").read_text() == "1"
+    assert limits.cgroup is None
+    limits.release()  # idempotent
+
+def test_unusable_parent_falls_back_to_rlimits(caps, tmp_path):
+    caps.setattr(process, "RENDER_CGROUP_PARENT", str(tmp_path / "missing"))
+    assert RenderLimits("0000000a").cgroup is None
+
+@linux_only
+def test_without_a_cgroup_rlimits_are_applied(caps, sleeper):
+    caps.setattr(process, "RENDER_CPU_SECONDS", 30.0)
+    limits = RenderLimits("0000000a")
+    assert limits.cgroup is None
+    limits.attach(sleeper.pid)
+    address_space = int(512 * 4.0 * 1024 * 1024)
+    assert process.resource.prlimit(sleeper.pid, process.resource.RLIMIT_AS) == (address_space, address_space)
+    assert process.resource.prlimit(sleeper.pid, process.resource.RLIMIT_CPU) == (30, 35)
+
+@linux_only
+def test_cpu_seconds_breach_is_reported(caps, tmp_path):
+    caps.setattr(process, "RENDER_CPU_SECONDS", 1.0)
+    limits = RenderLimits("0000000a")
+    cmd = [sys.executable, "-c", "import time; time.sleep(0.2)\nwhile True: pass"]  # limit set before the spin
+    returncode, _ = supervise(cmd, tmp_path, 30, OutputSink(), on_start=limits.attach)
+    assert returncode == -signal.SIGXCPU
+    assert limits.breach(returncode, "") == "cpu"
+
+def test_output_names_memory_and_fork_failures(caps):
+    limits = RenderLimits("0000000a")
+    assert limits.breach(1, "Traceback ...\nMemoryError\n") == "memory"
+    assert limits.breach(1, "sh: fork: Resource temporarily unavailable\n") == "pids"
+    assert limits.breach(1, "NameError: name 'x' is not defined\n") is None
@@ -0,0 +1,136 @@
+"""Section-parallel rendering: where scenes are cut, which are not split, and the slots a split render holds."""
+import os, shutil, subprocess, threading
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from app import render  # noqa: E402
+from app.scheduler import RenderScheduler  # noqa: E402
+from app.schemas import SubtitleCue  # noqa: E402
+
+SCENE = '''from manim import *
+class S(Scene):
+    def construct(self):
+        sq = Square()
+        self.play(Create(sq), run_time=2)
+        self.wait(1)
+        x = 1; self.play(FadeOut(sq))
+        self.play(FadeIn(sq), run_time=3)
+        if x:
+            self.play(sq.animate.shift(UP))
+        self.wait(2)
+'''
+
+def cue(start: float) -> SubtitleCue:
+    return SubtitleCue(start=start, end=start + 1, text="t")
+
+def test_breaks_only_before_top_level_statements_that_start_a_line():
+    out = render.insert_section_breaks(SCENE, "S", [], 3)
+    lines = out.split("\n")
+    cuts = [i for i, line in enumerate(lines) if line.strip() == "self.next_section()"]
+    assert len(cuts) == 2
+    for i in cuts:
+        after = lines[i + 1].strip()
+        assert after.startswith(("self.play(", "self.wait(")), after
+        assert lines[i] == "        self.next_section()"
+    assert "x = 1; self.play(FadeOut(sq))" in out  # never split after a ';'
+    assert lines[cuts[0] + 1] != "        self.play(Create(sq), run_time=2)"  # nor before the first statement
+    assert render.count_scene_sections(out, "S") == 3
+
+def test_breaks_follow_cue_starts():
+    # Statement starts: 0 Create, 2 wait, 3 FadeOut (same line as x = 1), 4 FadeIn, 7 if, 8 wait(2)
+    out = render.insert_section_breaks(SCENE, "S", [cue(4.2)], 2)
+    lines = out.split("\n")
+    i = lines.index("        self.next_section()")
+    assert lines[i + 1].strip() == "self.play(FadeIn(sq), run_time=3)"
+
+def test_no_breaks_when_nothing_can_be_cut():
+    assert render.insert_section_breaks(SCENE, "S", [], 1) == SCENE
+    assert render.insert_section_breaks(SCENE, "Missing", [], 3) == SCENE
+    assert render.insert_section_breaks("def broken(:", "S", [], 3) == "def broken(:"
+
+def test_nested_next_section_is_not_splittable():
+    nested = SCENE.replace("            self.play(sq.animate.shift(UP))", "            self.next_section()")
+    assert render.count_scene_sections(nested, "S") == 0
+    assert render.count_scene_sections(SCENE, "S") == 1
+
+@pytest.mark.parametrize("code, expected", [
+    (SCENE, False),
+    (SCENE.replace("sq = Square()", "sq = Square()\n        sq.add_updater(lambda m, dt: m.rotate(dt))"), True),
+    (SCENE.replace("sq = Square()", "sq = always_redraw(lambda: Square())"), True),
+    ("class S(Scene:", True),  # unparsable: render sequentially to be safe
+])
+def test_uses_updaters(code, expected):
+    assert render.uses_updaters(code) is expected
+
+def test_updater_scenes_are_not_prepared(tmp_path, monkeypatch):
+    monkeypatch.setattr(render, "RENDER_SECTION_WORKERS", 3)
+    (tmp_path / "scene.py").write_text(SCENE.replace("sq = Square()", "sq = always_redraw(lambda: Square())"))
+    assert render.prepare_sections(tmp_path, "scene.py", "S", []) == 0
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["scene.py"]
+
+def test_prepared_sections_write_one_driver_each(tmp_path, monkeypatch):
+    monkeypatch.setattr(render, "RENDER_SECTION_WORKERS", 3)
+    (tmp_path / "scene.py").write_text(SCENE)
+    assert render.prepare_sections(tmp_path, "scene.py", "S", []) == 3
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "scene.py", "scene_section0.py", "scene_section1.py", "scene_section2.py", "scene_sectioned.py"]
+    assert "_TARGET_SECTION = 2" in (tmp_path / "scene_section2.py").read_text()
+
+def test_split_render_holds_one_slot_per_section_process(tmp_path, monkeypatch):
+    scheduler = RenderScheduler(4)
+    monkeypatch.setattr(render, "RENDER_SCHEDULER", scheduler)
+    monkeypatch.setattr(render, "RENDER_SECTION_WORKERS", 3)
+    (tmp_path / "scene.py").write_text(SCENE.replace("        self.wait(1)\n", "        self.wait(1)\n" * 4))
+    seen = []
+
+    def fake_render(workdir, file_name, scene_name, timeout, streamer, n_sections=0, workers=1):
+        seen.append((n_sections, workers, scheduler.stats()["slotsInUse"]))
+        return "", None
+
+    monkeypatch.setattr(render, "_render_scene_uncached", fake_render)
+    render._render_scene_scheduled(tmp_path, "scene.py", "S", 10, [], None, SCENE, None)
+    assert seen == [(3, 3, 3)]
+    # A scene that is not split takes one slot
+    (tmp_path / "plain.py").write_text(SCENE.replace("sq = Square()", "sq = always_redraw(lambda: Square())"))
+    render._render_scene_scheduled(tmp_path, "plain.py", "S", 10, [], None, SCENE, None)
+    assert seen[-1] == (0, 1, 1)
+
+def test_wide_tickets_wait_for_enough_free_slots():
+    scheduler = RenderScheduler(4)
+    order = []
+    with scheduler.slot("a", 1.0, width=3):
+        def wide():
+            with scheduler.slot("b", 1.0, width=2):
+                order.append(("b", scheduler.stats()["slotsInUse"]))
+
+        t = threading.Thread(target=wide, daemon=True)
+        t.start()
+        t.join(0.2)
+        assert t.is_alive() and scheduler.stats()["slotsInUse"] == 3
+        order.append(("a released", None))
+    t.join(2)
+    assert order == [("a released", None), ("b", 2)]
+    with scheduler.slot("c", 1.0, width=9) as ticket:
+        assert ticket["width"] == 4
+
+MANIM = shutil.which("manim") and shutil.which("ffprobe")
+
+def frame_count(mp4) -> int:
+    out = subprocess.run(["ffprobe", "-v", "error", "-count_frames", "-select_streams", "v:0",
+                          "-show_entries", "stream=nb_read_frames", "-of", "csv=p=0", str(mp4)],
+                         capture_output=True, text=True, check=True).stdout
+    return int(out.strip())
+
+@pytest.mark.skipif(not MANIM, reason="needs manim and ffprobe on PATH")
+def test_split_and_sequential_renders_have_the_same_frames(tmp_path, monkeypatch):
+    monkeypatch.setattr(render, "RENDER_SECTION_WORKERS", 3)
+    for name in ("split", "seq"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "scene.py").write_text(SCENE)
+    n = render.prepare_sections(tmp_path / "split", "scene.py", "S", [])
+    _, split = render._render_scene_uncached(tmp_path / "split", "scene.py", "S", 300, None, n, 3)
+    _, seq = render._render_scene_uncached(tmp_path / "seq", "scene.py", "S", 300, None)
+    assert split.parent.name == "sections"  # really rendered in sections
+    assert frame_count(split) == frame_count(seq)
@@ -0,0 +1,92 @@
+"""/renders/{job}/{file}: published artifacts with strong ETags and ranges, 202 while running, 404 otherwise."""
+import os, time
+
+import pytest
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from app import core, main, retention, store  # noqa: E402
+from app.artifacts import MANIFEST, file_sha256, publish_manifest  # noqa: E402
+
+VIDEO = bytes(range(256)) * 40
+
+@pytest.fixture
+def renders(tmp_path, monkeypatch):
+    for module in (main, store, retention):
+        monkeypatch.setattr(module, "RENDERS_DIR", tmp_path)
+    monkeypatch.setattr(main, "STORE", store.LocalStore())
+    return tmp_path
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+def finished_job(root, job_id: str, publish: bool = True):
+    workdir = root / job_id
+    workdir.mkdir()
+    (workdir / "out.mp4").write_bytes(VIDEO)
+    (workdir / "captions.vtt").write_text("WEBVTT\n")
+    (workdir / "job.log").write_text("done\n")
+    if publish:
+        publish_manifest(workdir)
+    return workdir
+
+def test_published_artifact_has_a_strong_etag(renders, client):
+    workdir = finished_job(renders, "0000000a")
+    r = client.get("/renders/0000000a/out.mp4")
+    assert r.status_code == 200 and r.content == VIDEO
+    assert r.headers["etag"] == f'"{file_sha256(workdir / "out.mp4")}"'
+    assert "immutable" in r.headers["cache-control"]
+    assert r.headers["content-type"] == "video/mp4"
+
+def test_matching_if_none_match_is_not_modified(renders, client):
+    finished_job(renders, "0000000a")
+    etag = client.get("/renders/0000000a/captions.vtt").headers["etag"]
+    r = client.get("/renders/0000000a/captions.vtt", headers={"If-None-Match": f'"other", {etag}'})
+    assert r.status_code == 304 and r.content == b""
+    assert r.headers["etag"] == etag
+    assert client.get("/renders/0000000a/captions.vtt", headers={"If-None-Match": '"other"'}).status_code == 200
+
+def test_range_request_gets_partial_content(renders, client):
+    finished_job(renders, "0000000a")
+    r = client.get("/renders/0000000a/out.mp4", headers={"Range": "bytes=100-299"})
+    assert r.status_code == 206
+    assert r.content == VIDEO[100:300]
+    assert r.headers["content-range"] == f"bytes 100-299/{len(VIDEO)}"
+
+def test_running_job_is_accepted_not_served(renders, client):
+    finished_job(renders, "0000000a", publish=False)
+    core.set_job("0000000a", status="running")
+    try:
+        r = client.get("/renders/0000000a/out.mp4")
+    finally:
+        with core.JOBS_LOCK:
+            core.JOBS.pop("0000000a", None)
+    assert r.status_code == 202
+    assert r.json() == {"status": "running", "statusUrl": "/jobs/0000000a"}
+    assert r.headers["retry-after"] == "2"
+
+def test_unpublished_or_unknown_files_are_not_found(renders, client):
+    finished_job(renders, "0000000a", publish=False)
+    finished_job(renders, "0000000b")
+    assert client.get("/renders/0000000a/out.mp4").status_code == 404  # no manifest
+    assert client.get("/renders/0000000b/missing.mp4").status_code == 404
+    assert client.get(f"/renders/0000000b/{MANIFEST}").status_code == 404
+    assert client.get("/renders/not-a-job/out.mp4").status_code == 404
+    r = client.get("/renders/0000000b/job.log")  # served, but not as an immutable artifact
+    assert r.status_code == 200 and r.headers["cache-control"] == "no-cache"
+
+def test_backfill_publishes_finished_legacy_dirs(renders, client, monkeypatch):
+    monkeypatch.setattr(retention, "RENDERS_GC_GRACE_SECONDS", 60)
+    legacy = finished_job(renders, "0000000a", publish=False)
+    recent = finished_job(renders, "0000000b", publish=False)
+    old = time.time() - 3600
+    for p in (*legacy.iterdir(), legacy):
+        os.utime(p, (old, old))
+    assert client.get("/renders/0000000a/out.mp4").status_code == 404
+    retention.backfill_manifests()
+    assert (legacy / MANIFEST).is_file()
+    assert not (recent / MANIFEST).exists()  # touched within the grace period: may still be in flight
+    r = client.get("/renders/0000000a/out.mp4")
+    assert r.status_code == 200 and r.headers["etag"] == f'"{file_sha256(legacy / "out.mp4")}"'
@@ -0,0 +1,149 @@
+"""render_with_repairs() on a fake manim and a fake model: state order, local fixes, patch repairs, budget."""
+import json, os, re, subprocess, types
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from app import core, render, repair  # noqa: E402
+from app.index import JobRecord  # noqa: E402
+from app.scheduler import RenderScheduler  # noqa: E402
+from app.schemas import ManimPayload  # noqa: E402
+
+SCENE = """from manim import *
+class S(Scene):
+    def construct(self):
+        sq = Square()
+        self.play(ShowCreation(sq))
+        x = 1 / 0
+        self.wait(1)
+"""
+
+def payload(code: str = SCENE) -> ManimPayload:
+    return ManimPayload(file_name="scene.py", scene_name="S", code=code, subtitle_cues=[])
+
+def traceback_at(path, code: str, needle: str, error: str) -> str:
+    line = next(n for n, text in enumerate(code.splitlines(), 1) if needle in text)
+    return (f"Traceback (most recent call last):\n  File \"{path}\", line {line}, in construct\n"
+            f"    {code.splitlines()[line - 1].strip()}\n{error}\n")
+
+@pytest.fixture
+def loop(monkeypatch):
+    """
+    A fake manim that fails on ShowCreation (a renamed name, fixed locally) and on 1 / 0 (left to
+    the model) and renders anything else; a fake model answering from env["answers"][call name].
+    """
+    env = {"renders": [], "calls": [], "states": [], "answers": {}}
+
+    def fake_run_manim(workdir, file_name, scene_name, timeout, media_dir=".", log_path=None, dry_run=False, cancel=None):
+        code = (workdir / file_name).read_text()
+        env["renders"].append(code)
+        for needle, error in (("ShowCreation(", "NameError: name 'ShowCreation' is not defined"),
+                              ("1 / 0", "ZeroDivisionError: division by zero")):
+            if needle in code:
+                raise subprocess.CalledProcessError(1, ["manim"], output=traceback_at(workdir / file_name, code, needle, error))
+        out = workdir / "videos" / file_name[:-3] / "480p15" / "out.mp4"
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_bytes(b"mp4")
+        return "File ready at out.mp4\n"
+
+    def fake_chat(rec, call, messages, response_format=None):
+        env["calls"].append(call)
+        answer = env["answers"][call]
+        content = answer(messages[-1]["content"]) if callable(answer) else answer
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))])
+
+    def set_job(job_id, **fields):
+        if "renderState" in fields:
+            env["states"].append(fields["renderState"])
+
+    monkeypatch.setattr(render, "run_manim", fake_run_manim)
+    monkeypatch.setattr(render, "RENDER_CACHE_MAX_BYTES", 0)
+    monkeypatch.setattr(render, "RENDER_SECTION_WORKERS", 0)
+    monkeypatch.setattr(render, "RENDER_SCHEDULER", RenderScheduler(2))
+    monkeypatch.setattr(repair, "RENDER_SCHEDULER", RenderScheduler(2))
+    monkeypatch.setattr(repair, "chat_completion", fake_chat)
+    monkeypatch.setattr(repair, "set_job", set_job)
+    monkeypatch.setattr(repair, "REPAIR_MODE", "patch")
+    monkeypatch.setattr(repair, "RENDER_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(repair, "RENDER_BUDGET_SECONDS", 1500)
+    monkeypatch.setattr(repair, "LOCAL_FIX_MAX", 4)
+    return env
+
+def run(tmp_path, code: str = SCENE):
+    workdir = tmp_path / "0000000a"
+    workdir.mkdir()
+    rec = JobRecord("0000000a", "a square")
+    return workdir, rec, repair.render_with_repairs("0000000a", workdir, [], payload(code), rec, lambda cues: None)
+
+def patch_for(needle: str, replacement: str):
+    """A model answering a patch prompt by replacing the numbered line that contains needle."""
+    def answer(prompt: str) -> str:
+        for n, text in re.findall(r"^\s*(\d+)\| (.*)$", prompt, re.M):
+            if needle in text:
+                indent = text[:len(text) - len(text.lstrip())]
+                return json.dumps({"edits": [{"start": int(n), "end": int(n), "replacement": indent + replacement}]})
+        raise AssertionError(f"{needle!r} is not in the patch window")
+    return answer
+
+def test_local_fix_then_patch_repair(tmp_path, loop):
+    loop["answers"]["repair_patch"] = patch_for("1 / 0", "x = 1")
+    workdir, rec, result = run(tmp_path)
+    assert isinstance(result, ManimPayload)
+    assert loop["states"] == ["validate", "render", "classify", "fix",
+                              "validate", "render", "classify", "repair",
+                              "validate", "render"]
+    assert loop["calls"] == ["repair_patch"]
+    assert "Create(sq)" in loop["renders"][1] and "ShowCreation" not in loop["renders"][1]
+    assert "x = 1\n" in loop["renders"][2] and "1 / 0" not in loop["renders"][2]
+    assert (workdir / "silent.mp4").read_bytes() == b"mp4"
+    assert rec.render_attempts == 3
+    outcomes = [json.loads((workdir / "attempts" / str(n) / "attempt.json").read_text())["outcome"] for n in (1, 2, 3)]
+    assert outcomes == ["runtime", "runtime", "ok"]
+    assert (workdir / "attempts" / "2" / "patch.json").is_file()
+
+def test_patch_that_does_not_apply_falls_back_to_a_full_repair(tmp_path, loop):
+    loop["answers"]["repair_patch"] = json.dumps({"edits": [{"start": 1, "end": 1, "replacement": "# out of the window"}]})
+    loop["answers"]["repair"] = payload(SCENE.replace("ShowCreation", "Create").replace("1 / 0", "2")).model_dump_json()
+    _, _, result = run(tmp_path)
+    assert isinstance(result, ManimPayload) and "x = 2" in result.code
+    assert loop["calls"] == ["repair_patch", "repair"]
+    assert loop["states"][-4:] == ["classify", "repair", "validate", "render"]
+
+def test_syntax_errors_are_fixed_before_any_render(tmp_path, loop):
+    broken = SCENE.replace("ShowCreation(sq)", "Write(Text(\"two\n  lines\"))").replace("1 / 0", "1")
+    _, _, result = run(tmp_path, broken)
+    assert isinstance(result, ManimPayload)
+    assert loop["states"] == ["validate", "classify", "fix", "validate", "render"]
+    assert len(loop["renders"]) == 1 and loop["calls"] == []
+
+def test_stops_when_the_budget_cannot_cover_a_repair(tmp_path, loop, monkeypatch):
+    monkeypatch.setattr(repair, "RENDER_BUDGET_SECONDS", 20)  # < a repair call estimate (30s) plus the render
+    workdir, _, result = run(tmp_path, SCENE.replace("ShowCreation", "Create"))
+    body = json.loads(result.body)
+    assert result.status_code == 500
+    assert body["stopReason"] == "budget" and body["attempts"] == 1 and body["errorClass"] == "runtime"
+    assert loop["calls"] == [] and len(loop["renders"]) == 1
+    assert loop["states"] == ["validate", "render", "classify"]
+    assert (workdir / "error.txt").is_file()
+
+def test_stops_after_max_attempts(tmp_path, loop, monkeypatch):
+    monkeypatch.setattr(repair, "RENDER_MAX_ATTEMPTS", 2)
+    loop["answers"]["repair_patch"] = patch_for("1 / 0", "x = 1 / 0  # still broken")
+    _, _, result = run(tmp_path, SCENE.replace("ShowCreation", "Create"))
+    body = json.loads(result.body)
+    assert body["stopReason"] == "max_attempts" and body["attempts"] == 2
+    assert loop["calls"] == ["repair_patch"]
+
+def counters(*names):
+    with core.METRICS_LOCK:
+        return [core.METRICS.get(name, 0) for name in names]
+
+def test_local_fix_outcomes_are_counted_per_class(tmp_path, loop):
+    names = ("local_fix_renamed_name_applied", "local_fix_renamed_name_resolved", "local_fix_renamed_name_missed",
+             "traceback_class_renamed_name", "traceback_class_unrecognized")
+    before = counters(*names)
+    loop["answers"]["repair_patch"] = patch_for("1 / 0", "x = 1")
+    run(tmp_path)
+    # The fixed render failed again, but on another class: the fix itself resolved its error
+    assert [a - b for a, b in zip(counters(*names), before)] == [1, 1, 0, 1, 1]
@@ -0,0 +1,49 @@
+"""apply_patch(): patch answers apply only inside their window, without overlaps, to the code they were made for."""
+import json, os
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from app.repair import apply_patch  # noqa: E402
+
+CODE = "".join(f"line {n}\n" for n in range(1, 11))
+
+def edits(*triples) -> str:
+    return json.dumps({"edits": [{"start": s, "end": e, "replacement": r} for s, e, r in triples]})
+
+def test_apply_patch_replaces_inserts_and_deletes():
+    patched = apply_patch(CODE, edits((3, 3, "three"), (5, 4, "before 5"), (7, 8, "")), (2, 9))
+    assert patched.splitlines() == ["line 1", "line 2", "three", "line 4", "before 5", "line 5", "line 6",
+                                    "line 9", "line 10"]
+
+@pytest.mark.parametrize("triples", [
+    [(1, 1, "x")],     # before the window
+    [(9, 10, "x")],    # runs past it
+    [(10, 10, "x")],   # after it
+    [(5, 3, "x")],     # ends before it starts
+])
+def test_apply_patch_refuses_lines_outside_the_window(triples):
+    with pytest.raises(ValueError, match="outside"):
+        apply_patch(CODE, edits(*triples), (2, 9))
+
+def test_apply_patch_refuses_overlapping_edits():
+    with pytest.raises(ValueError, match="overlaps"):
+        apply_patch(CODE, edits((3, 5, "a"), (5, 6, "b")), (2, 9))
+    with pytest.raises(ValueError, match="overlaps"):
+        apply_patch(CODE, edits((3, 6, "a"), (4, 4, "b")), (2, 9))
+
+def test_apply_patch_refuses_a_stale_base():
+    moved = "line 0\n" + CODE  # a line was inserted above the window after it was shown
+    with pytest.raises(ValueError, match="stale"):
+        apply_patch(moved, edits((3, 3, "three")), (2, 9), base=CODE)
+    assert apply_patch(CODE, edits((3, 3, "three")), (2, 9), base=CODE).splitlines()[2] == "three"
+
+@pytest.mark.parametrize("raw", ["not json", "{}", '{"edits": [{"start": 3}]}', '{"edits": []}'])
+def test_apply_patch_refuses_unreadable_or_empty_answers(raw):
+    with pytest.raises(ValueError):
+        apply_patch(CODE, raw, (2, 9))
+
+def test_apply_patch_refuses_a_no_op():
+    with pytest.raises(ValueError, match="nothing"):
+        apply_patch(CODE, edits((3, 3, "line 3")), (2, 9))
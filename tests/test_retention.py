@@ -0,0 +1,119 @@
+"""Renders GC: one test per retention policy, on a temp RENDERS_DIR with its own job index."""
+import os, time
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from app import artifacts, core, main, retention  # noqa: E402
+from app.index import JobIndex  # noqa: E402
+
+HOUR = 3600
+
+@pytest.fixture
+def renders(tmp_path, monkeypatch):
+    root = tmp_path / "renders"
+    root.mkdir()
+    index = JobIndex(tmp_path / "jobs.sqlite3")
+    monkeypatch.setattr(retention, "RENDERS_DIR", root)
+    monkeypatch.setattr(artifacts, "BLOBS_DIR", root / "_blobs")
+    monkeypatch.setattr(retention, "JOB_INDEX", index)
+    monkeypatch.setattr(main, "JOB_INDEX", index)
+    monkeypatch.setattr(retention, "RENDERS_FAILED_TTL_HOURS", 24)
+    monkeypatch.setattr(retention, "RENDERS_MAX_AGE_DAYS", 0)
+    monkeypatch.setattr(retention, "RENDERS_MAX_BYTES", 0)
+    monkeypatch.setattr(retention, "RENDERS_KEEP_LAST", 0)
+    monkeypatch.setattr(retention, "RENDERS_GC_GRACE_SECONDS", HOUR)
+    return root, index
+
+def make_job(root, index, job_id: str, age_hours: float, succeeded: bool = True, size: int = 100):
+    """A job dir last touched age_hours ago, with its index row."""
+    workdir = root / job_id
+    workdir.mkdir()
+    (workdir / ("out.mp4" if succeeded else "scene.py")).write_bytes(b"x" * size)
+    created = time.time() - age_hours * HOUR
+    for p in (*workdir.iterdir(), workdir):
+        os.utime(p, (created, created))
+    conn = index.connect()
+    with conn:
+        conn.execute("INSERT INTO jobs (job_id, created_at, prompt, prompt_hash, status) VALUES (?, ?, ?, ?, ?)",
+                     (job_id, created, job_id, job_id, "done" if succeeded else "error"))
+    conn.close()
+
+def purged(index, job_id: str, timeout: float = 5.0):
+    """purged_at of the job's row, once the index writer got to it."""
+    deadline = time.monotonic() + timeout
+    while True:
+        conn = index.connect()
+        value = conn.execute("SELECT purged_at FROM jobs WHERE job_id = ?", (job_id,)).fetchone()["purged_at"]
+        conn.close()
+        if value is not None or time.monotonic() > deadline:
+            return value
+        time.sleep(0.02)
+
+def deleted(report) -> dict:
+    return {d["jobId"]: d["reason"] for d in report["deleted"]}
+
+def test_failed_jobs_expire_after_their_ttl(renders):
+    root, index = renders
+    make_job(root, index, "0000000a", 30, succeeded=False)
+    make_job(root, index, "0000000b", 5, succeeded=False)
+    make_job(root, index, "0000000c", 30)
+    assert deleted(retention.collect_garbage()) == {"0000000a": "failed-ttl"}
+    assert not (root / "0000000a").exists() and (root / "0000000b").exists() and (root / "0000000c").exists()
+
+def test_successes_expire_after_the_max_age(renders, monkeypatch):
+    root, index = renders
+    monkeypatch.setattr(retention, "RENDERS_MAX_AGE_DAYS", 2)
+    make_job(root, index, "0000000a", 72)
+    make_job(root, index, "0000000b", 24)
+    assert deleted(retention.collect_garbage()) == {"0000000a": "max-age"}
+
+def test_max_bytes_deletes_the_oldest_first(renders, monkeypatch):
+    root, index = renders
+    monkeypatch.setattr(retention, "RENDERS_MAX_BYTES", 250)
+    for i, age in enumerate((4, 3, 2, 1)):
+        make_job(root, index, f"0000000{i}", age)
+    report = retention.collect_garbage()
+    assert deleted(report) == {"00000000": "max-bytes", "00000001": "max-bytes"}
+    assert report["totalBytes"] == 400 and report["freedBytes"] == 200
+
+def test_keep_last_protects_the_newest_successes(renders, monkeypatch):
+    root, index = renders
+    monkeypatch.setattr(retention, "RENDERS_MAX_AGE_DAYS", 1)
+    monkeypatch.setattr(retention, "RENDERS_KEEP_LAST", 2)
+    for i, age in enumerate((100, 90, 80, 70)):
+        make_job(root, index, f"0000000{i}", age)
+    make_job(root, index, "0000000f", 60, succeeded=False)
+    assert deleted(retention.collect_garbage()) == {"00000000": "max-age", "00000001": "max-age", "0000000f": "failed-ttl"}
+
+def test_in_flight_jobs_are_kept(renders, monkeypatch):
+    root, index = renders
+    monkeypatch.setattr(retention, "RENDERS_MAX_BYTES", 1)
+    make_job(root, index, "0000000a", 0.5, succeeded=False)  # inside the grace period: another process's job
+    make_job(root, index, "0000000b", 48, succeeded=False)
+    with core.JOBS_LOCK:
+        core.JOBS["0000000b"] = {"status": "running"}
+    try:
+        assert deleted(retention.collect_garbage()) == {}
+    finally:
+        with core.JOBS_LOCK:
+            core.JOBS.pop("0000000b", None)
+    assert deleted(retention.collect_garbage()) == {"0000000b": "failed-ttl"}
+
+def test_dry_run_deletes_nothing(renders):
+    root, index = renders
+    make_job(root, index, "0000000a", 30, succeeded=False)
+    assert deleted(retention.collect_garbage(dry_run=True)) == {"0000000a": "failed-ttl"}
+    assert (root / "0000000a").exists()
+    assert purged(index, "0000000a", timeout=0.2) is None
+
+def test_deleted_jobs_are_purged_from_the_history(renders):
+    root, index = renders
+    make_job(root, index, "0000000a", 30, succeeded=False)
+    make_job(root, index, "0000000b", 30)
+    retention.collect_garbage()
+    assert purged(index, "0000000a") is not None
+    assert purged(index, "0000000b", timeout=0.2) is None
+    assert [item["jobId"] for item in main.list_jobs()["items"]] == ["0000000b"]
+    assert main.list_jobs(status="error")["items"] == []
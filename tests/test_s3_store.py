@@ -0,0 +1,136 @@
+"""S3Store against app/fake_s3.py over HTTP: multipart uploads, presigned and proxied serving, put/fetch, deletion."""
+import os, socket, threading, time
+
+import pytest
+from fastapi.testclient import TestClient
+
+pytest.importorskip("boto3")
+httpx = pytest.importorskip("httpx")
+uvicorn = pytest.importorskip("uvicorn")
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from app import fake_s3, main, retention, store  # noqa: E402
+from app.artifacts import MANIFEST, publish_manifest  # noqa: E402
+from app.hls import HLS_DIR  # noqa: E402
+from app.index import JobIndex  # noqa: E402
+
+MB = 1024 * 1024
+VIDEO = bytes(range(256)) * (44 * 1024)  # 11 MB: three 5 MB parts
+
+@pytest.fixture(scope="module")
+def endpoint(tmp_path_factory):
+    """fake_s3 served by uvicorn on a free local port for the module's tests."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    fake_s3.FAKE_S3_DIR = tmp_path_factory.mktemp("fake-s3")
+    server = uvicorn.Server(uvicorn.Config(fake_s3.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        assert time.monotonic() < deadline, "fake_s3 did not start"
+        time.sleep(0.02)
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join(10)
+
+@pytest.fixture
+def s3(endpoint, tmp_path, monkeypatch):
+    """An S3Store on a fresh bucket of the fake, serving a temp RENDERS_DIR through main."""
+    for name, value in (("AWS_ACCESS_KEY_ID", "fake"), ("AWS_SECRET_ACCESS_KEY", "fake"), ("AWS_DEFAULT_REGION", "us-east-1")):
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(store, "S3_ENDPOINT_URL", endpoint)
+    monkeypatch.setattr(store, "S3_BUCKET", f"b{tmp_path.name[-20:].lower().replace('_', '-')}")
+    monkeypatch.setattr(store, "S3_PART_BYTES", 5 * MB)
+    monkeypatch.setattr(store, "S3_KEEP_LOCAL", False)
+    s3 = store.S3Store()
+    for module in (main, store, retention):
+        monkeypatch.setattr(module, "RENDERS_DIR", tmp_path)
+        monkeypatch.setattr(module, "STORE", s3)
+    return s3
+
+@pytest.fixture
+def client():
+    return TestClient(main.app, follow_redirects=False)
+
+def published_job(root, s3, job_id: str = "0000000a"):
+    workdir = root / job_id
+    (workdir / HLS_DIR).mkdir(parents=True)
+    (workdir / "out.mp4").write_bytes(VIDEO)
+    (workdir / "captions.vtt").write_text("WEBVTT\n")
+    (workdir / HLS_DIR / "seg-000.ts").write_bytes(b"ts" * 100)
+    (workdir / "job.log").write_text("done\n")
+    s3.publish(workdir, publish_manifest(workdir))
+    return workdir
+
+def keys(s3, job_id: str = "0000000a"):
+    page = s3.client().list_objects_v2(Bucket=store.S3_BUCKET, Prefix=s3.key(job_id, ""))
+    return sorted(obj["Key"][len(s3.key(job_id, "")):] for obj in page.get("Contents", []))
+
+def test_publish_uploads_in_parts_and_drops_local_copies(tmp_path, s3):
+    workdir = published_job(tmp_path, s3)
+    assert keys(s3) == sorted([MANIFEST, "captions.vtt", f"{HLS_DIR}/seg-000.ts", "out.mp4"])
+    head = s3.client().head_object(Bucket=store.S3_BUCKET, Key=s3.key("0000000a", "out.mp4"))
+    assert head["ETag"].endswith('-3"') and head["ContentLength"] == len(VIDEO)
+    assert head["ContentType"] == "video/mp4" and "immutable" in head["CacheControl"]
+    assert not (workdir / "out.mp4").exists() and not (workdir / HLS_DIR).exists()
+    assert (workdir / MANIFEST).is_file() and (workdir / "job.log").is_file()
+
+def test_presigned_redirect(tmp_path, s3, client, monkeypatch):
+    monkeypatch.setattr(store, "ARTIFACT_URL_MODE", "presign")
+    published_job(tmp_path, s3)
+    r = client.get("/renders/0000000a/out.mp4")
+    assert r.status_code == 307 and r.headers["location"].startswith(f"{store.S3_ENDPOINT_URL}/{store.S3_BUCKET}/")
+    assert r.headers["cache-control"] == f"private, max-age={store.S3_PRESIGN_SECONDS // 2}"
+    assert httpx.get(r.headers["location"]).content == VIDEO  # the fake does not check signatures
+    etag = f'"{s3.manifest("0000000a")["artifacts"]["out.mp4"]["sha256"]}"'
+    assert client.get("/renders/0000000a/out.mp4", headers={"If-None-Match": etag}).status_code == 304
+
+def test_proxy_passes_ranges_through(tmp_path, s3, client, monkeypatch):
+    monkeypatch.setattr(store, "ARTIFACT_URL_MODE", "proxy")
+    published_job(tmp_path, s3)
+    r = client.get("/renders/0000000a/out.mp4", headers={"Range": "bytes=100-299"})
+    assert r.status_code == 206 and r.content == VIDEO[100:300]
+    assert r.headers["content-range"] == f"bytes 100-299/{len(VIDEO)}"
+    full = client.get("/renders/0000000a/out.mp4")
+    assert full.status_code == 200 and full.content == VIDEO and full.headers["content-type"] == "video/mp4"
+    assert client.get("/renders/0000000a/out.mp4", headers={"Range": f"bytes={len(VIDEO)}-"}).status_code == 416
+    assert client.get(f"/renders/0000000a/{HLS_DIR}/seg-000.ts").content == b"ts" * 100
+
+def test_manifest_comes_from_the_bucket_without_a_local_copy(tmp_path, s3):
+    workdir = published_job(tmp_path, s3)
+    (workdir / MANIFEST).unlink()
+    assert set(s3.manifest("0000000a")["store"]["files"]) == {"out.mp4", "captions.vtt", f"{HLS_DIR}/seg-000.ts"}
+    assert s3.manifest("0000000b") is None
+
+def test_put_and_fetch_share_files_across_hosts(tmp_path, s3):
+    src = tmp_path / "payload.json"
+    src.write_text('{"code": "x"}')
+    s3.put("0000000a", "payload.json", src)
+    dest = tmp_path / "other-host" / "payload.json"
+    assert s3.fetch("0000000a", "payload.json", dest) and dest.read_text() == '{"code": "x"}'
+    assert not s3.fetch("0000000a", "missing.json", tmp_path / "missing.json")
+    assert not (tmp_path / "other-host" / ".missing.json.download").exists()
+
+def test_delete_removes_every_object_of_the_job(tmp_path, s3):
+    published_job(tmp_path, s3, "0000000a")
+    published_job(tmp_path, s3, "0000000b")
+    assert s3.delete("0000000a") == 4
+    assert keys(s3, "0000000a") == [] and s3.manifest("0000000a") is not None  # the local manifest is still there
+    assert len(keys(s3, "0000000b")) == 4
+    assert s3.delete("0000000a") == 0
+
+def test_gc_deletes_stored_artifacts_with_the_dir(tmp_path, s3, monkeypatch):
+    monkeypatch.setattr(retention, "JOB_INDEX", JobIndex(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(retention, "RENDERS_MAX_AGE_DAYS", 1)
+    monkeypatch.setattr(retention, "RENDERS_KEEP_LAST", 0)
+    workdir = published_job(tmp_path, s3)
+    old = time.time() - 3 * 86400
+    for p in (*workdir.rglob("*"), workdir):
+        os.utime(p, (old, old))
+    report = retention.collect_garbage()
+    assert [d["jobId"] for d in report["deleted"]] == ["0000000a"]
+    assert not workdir.exists() and keys(s3) == []
+    assert s3.manifest("0000000a") is None
@@ -0,0 +1,239 @@
+"""
+sanitize_and_fix_code() against a corpus of generated-code fragments.
+
+Each case is (name, source, expected, before_lexer): expected is the sanitized code after the
+prelude, or BLOCKED when the source must be rejected; before_lexer is what the text-search
+sanitizer the lexer replaced produced, kept next to it so every behavior change is visible here
+(SAME where it did not change).
+"""
+import ast, os, warnings
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from app.sanitize import FORBIDDEN_MODULES, MANIM_PRELUDE, sanitize_and_fix_code  # noqa: E402
+
+BLOCKED = "BLOCKED"
+SAME = "SAME"
+
+CORPUS = [
+    ('import_plain', 'import random\nx = random.random()',
+     'import random\nx = random.random()\n',
+     SAME),
+    ('import_dotted_alias', 'import numpy.linalg as la',
+     'import numpy.linalg as la\n',
+     SAME),
+    ('import_prefix_name', 'import osmnx',
+     'import osmnx\n',
+     BLOCKED),
+    ('import_forbidden', 'import os',
+     BLOCKED,
+     SAME),
+    ('import_forbidden_dotted', 'import os.path',
+     BLOCKED,
+     SAME),
+    ('import_forbidden_alias', 'import subprocess as sp',
+     BLOCKED,
+     SAME),
+    ('import_list', 'import a, os',
+     BLOCKED,
+     'import a, os\n'),
+    ('import_list_continued', 'import a, \\\n    shutil',
+     BLOCKED,
+     'import a, \\\n    shutil\n'),
+    ('import_after_semicolon', 'x=1; import os',
+     BLOCKED,
+     SAME),
+    ('import_after_colon', 'if True: import sys',
+     BLOCKED,
+     SAME),
+    ('import_nested', 'def f():\n    import pickle\n    return pickle',
+     BLOCKED,
+     SAME),
+    ('from_import', 'from random import choice',
+     'from random import choice\n',
+     SAME),
+    ('from_forbidden', 'from os import path',
+     BLOCKED,
+     SAME),
+    ('from_forbidden_sub', 'from os.path import join',
+     BLOCKED,
+     SAME),
+    ('from_parenthesized', 'from pathlib import (\n    Path,\n)',
+     BLOCKED,
+     SAME),
+    ('from_relative', 'from . import helpers',
+     'from . import helpers\n',
+     SAME),
+    ('from_relative_named', 'from .os import x',
+     'from .os import x\n',
+     SAME),
+    ('import_in_string', 's = \'import os\'\nt = """\nfrom sys import argv\n"""',
+     's = \'import os\'\nt = """\nfrom sys import argv\n"""\n',
+     BLOCKED),
+    ('import_in_comment', 'x = 1  # import os',
+     'x = 1  # import os\n',
+     BLOCKED),
+    ('yield_from', 'def g():\n    yield from range(3)',
+     'def g():\n    yield from range(3)\n',
+     SAME),
+    ('raise_from', 'try:\n    pass\nexcept KeyError as e:\n    raise ValueError() from e',
+     'try:\n    pass\nexcept KeyError as e:\n    raise ValueError() from e\n',
+     SAME),
+    ('prelude_duplicates', 'from manim import *\nimport numpy as np\nimport math\nclass S(Scene):\n    pass',
+     'class S(Scene):\n    pass\n',
+     SAME),
+    ('prelude_duplicate_spacing', 'from  manim  import  *\nx = 1',
+     'x = 1\n',
+     SAME),
+    ('prelude_nested', 'try:\n    from manim.utils.color import Color\nexcept ImportError:\n    pass',
+     'try:\n    pass\nexcept ImportError:\n    pass\n',
+     'try:\n\nexcept ImportError:\n    pass\n'),
+    ('repeated_import', 'import random\nimport random\nx = 1',
+     'import random\nx = 1\n',
+     'import random\nimport random\nx = 1\n'),
+    ('tex_raw_prefix', 'MathTex("\\frac{a}{b}")',
+     'MathTex(r"\\frac{a}{b}")\n',
+     SAME),
+    ('tex_single_quotes', "Tex('\\alpha')",
+     "Tex(r'\\alpha')\n",
+     SAME),
+    ('tex_already_raw', 'MathTex(r"\\beta")',
+     'MathTex(r"\\beta")\n',
+     SAME),
+    ('tex_hand_escaped', 'MathTex("\\\\frac{a}{b}")',
+     'MathTex("\\\\frac{a}{b}")\n',
+     'MathTex(r"\\\\frac{a}{b}")\n'),
+    ('tex_unmatched_close', 'MathTex(r"a}+b")',
+     'MathTex(r"a+b")\n',
+     SAME),
+    ('tex_missing_close', 'MathTex(r"\\frac{a}{b")',
+     'MathTex(r"\\frac{a}{b}")\n',
+     SAME),
+    ('tex_escaped_braces', 'MathTex(r"\\{x\\}")',
+     'MathTex(r"\\{x\\}")\n',
+     SAME),
+    ('tex_double_backslash_newline', 'MathTex(r"a \\\\ b")',
+     'MathTex(r"a \\\\ b")\n',
+     SAME),
+    ('tex_double_backslash_end', 'MathTex(r"a\\\\")',
+     'MathTex(r"a\\\\")\n',
+     SAME),
+    ('tex_exponent_letters', 'MathTex(r"e^xy")',
+     'MathTex(r"e^{xy}")\n',
+     SAME),
+    ('tex_exponent_command', 'MathTex(r"e^\\pi i")',
+     'MathTex(r"e^{\\pi} i")\n',
+     SAME),
+    ('tex_exponent_paren', 'MathTex(r"e^(i t)")',
+     'MathTex(r"e^{(i t)}")\n',
+     SAME),
+    ('tex_exponent_paren_nested', 'MathTex(r"e^(a e^(b) c)")',
+     'MathTex(r"e^{(a e^{(b)} c)}")\n',
+     SAME),
+    ('tex_exponent_paren_unbalanced', 'MathTex(r"e^(x")',
+     'MathTex(r"e^(x")\n',
+     SAME),
+    ('tex_single_string', 'SingleStringMathTex("\\sum")',
+     'SingleStringMathTex(r"\\sum")\n',
+     SAME),
+    ('tex_multi_part', 'MathTex("\\frac{a", "}{b}")',
+     'MathTex(r"\\frac{a", r"}{b}")\n',
+     'MathTex(r"\\frac{a}", "}{b}")\n'),
+    ('tex_keyword_arg', 'MathTex("x", tex_template="\\alpha")',
+     'MathTex(r"x", tex_template="\\alpha")\n',
+     SAME),
+    ('tex_fstring', 'MathTex(f"{n}\\cdot")',
+     'MathTex(f"{n}\\cdot")\n',
+     SAME),
+    ('tex_bytes', "Tex(b'x')",
+     "Tex(b'x')\n",
+     SAME),
+    ('tex_name_arg', 'MathTex(label)',
+     'MathTex(label)\n',
+     SAME),
+    ('tex_concat', 'MathTex("a" + b)',
+     'MathTex("a" + b)\n',
+     'MathTex(r"a" + b)\n'),
+    ('tex_triple_quoted', 'MathTex("""\\int x""")',
+     'MathTex(r"""\\int x""")\n',
+     SAME),
+    ('tex_in_string', 's = \'MathTex("\\\\alpha")\'',
+     's = \'MathTex("\\\\alpha")\'\n',
+     's = \'MathTex(r"\\\\alpha")\'\n'),
+    ('tex_in_comment', '# MathTex("\\alpha")\nx = 1',
+     '# MathTex("\\alpha")\nx = 1\n',
+     '# MathTex(r"\\alpha")\nx = 1\n'),
+    ('tex_name_suffix', 'MyTex("\\alpha")',
+     'MyTex("\\alpha")\n',
+     'MyTex(r"\\alpha")\n'),
+    ('tex_nested_calls', 'VGroup(MathTex("a^{2"), Tex("b}"))',
+     'VGroup(MathTex(r"a^{2}"), Tex(r"b"))\n',
+     SAME),
+    ('interpolate_color', 'c = interpolate_color(RED, BLUE, 0.5)',
+     'c = interpolate_color(Color(RED), Color(BLUE), 0.5)\n',
+     SAME),
+    ('interpolate_color_exprs', "c = interpolate_color(colors[i], ManimColor('#fff'), t)",
+     "c = interpolate_color(Color(colors[i]), Color(ManimColor('#fff')), t)\n",
+     SAME),
+    ('interpolate_color_wrapped', 'c = interpolate_color(Color(RED), Color(BLUE), 0.5)',
+     'c = interpolate_color(Color(RED), Color(BLUE), 0.5)\n',
+     'c = interpolate_color(Color(Color(RED)), Color(Color(BLUE)), 0.5)\n'),
+    ('interpolate_color_method', 'm.interpolate_color(a, b, 0.5)',
+     'm.interpolate_color(a, b, 0.5)\n',
+     'm.interpolate_color(Color(a), Color(b), 0.5)\n'),
+    ('interpolate_color_keywords', 'c = interpolate_color(color1=RED, color2=BLUE, alpha=0.5)',
+     'c = interpolate_color(color1=RED, color2=BLUE, alpha=0.5)\n',
+     'c = interpolate_color(Color(color1=RED), Color(color2=BLUE), alpha=0.5)\n'),
+    ('crlf', 'x = 1\r\ny = 2\r\n',
+     'x = 1\ny = 2\n',
+     SAME),
+]
+
+def sanitize(src: str) -> str:
+    try:
+        out = sanitize_and_fix_code(src)
+    except ValueError:
+        return BLOCKED
+    assert out.startswith(MANIM_PRELUDE)
+    return out[len(MANIM_PRELUDE):]
+
+def imports_forbidden(src: str) -> bool:
+    """What the ast module says: an absolute import of a forbidden module anywhere in the tree."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", SyntaxWarning)  # the unescaped LaTeX in the Tex cases
+        warnings.simplefilter("ignore", DeprecationWarning)
+        tree = ast.parse(src)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and not node.level:
+            modules = [node.module]
+        else:
+            continue
+        if any(mod.split(".")[0] in FORBIDDEN_MODULES for mod in modules):
+            return True
+    return False
+
+@pytest.mark.parametrize("name,src,expected,before_lexer", CORPUS, ids=[c[0] for c in CORPUS])
+def test_corpus(name, src, expected, before_lexer):
+    assert sanitize(src) == expected
+
+@pytest.mark.parametrize("name,src,expected,before_lexer", CORPUS, ids=[c[0] for c in CORPUS])
+def test_blocking_agrees_with_ast(name, src, expected, before_lexer):
+    try:
+        forbidden = imports_forbidden(src)
+    except SyntaxError:
+        pytest.skip("not parseable on its own")
+    assert (expected == BLOCKED) == forbidden
+
+@pytest.mark.parametrize("name,src,expected,before_lexer", CORPUS, ids=[c[0] for c in CORPUS])
+def test_sanitizing_twice_changes_nothing(name, src, expected, before_lexer):
+    if expected == BLOCKED:
+        return
+    once = sanitize_and_fix_code(src)
+    assert sanitize_and_fix_code(once) == once
+
+def test_prelude_is_not_prefixed_twice():
+    assert sanitize(MANIM_PRELUDE + "x = 1") == "x = 1\n"
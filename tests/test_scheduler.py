@@ -0,0 +1,162 @@
+"""RenderScheduler admission order and aging on a fake clock; RenderCostModel fits on synthetic renders."""
+import json, os, random, threading, time, types
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from app import scheduler  # noqa: E402
+from app.index import JobIndex  # noqa: E402
+from app.scheduler import DEFAULT_RENDER_COST_WEIGHTS, RENDER_COST_FEATURES, RenderCostModel, RenderScheduler  # noqa: E402
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    """scheduler's time.time() on a clock the test moves; job status updates are collected instead of published."""
+    fake = FakeClock()
+    published = {}
+    monkeypatch.setattr(scheduler, "time", types.SimpleNamespace(time=fake.time))
+    monkeypatch.setattr(scheduler, "set_job", lambda job_id, **fields: published.setdefault(job_id, {}).update(fields))
+    fake.published = published
+    return fake
+
+def wait_until(predicate, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+def admission_order(sched: RenderScheduler, clock: FakeClock, renders, release_at: float):
+    """
+    Queue renders [(job_id, predicted, queued_at)] behind a render holding every slot, then free
+    the slots at release_at and return the job ids in the order they got a slot.
+    """
+    order = []
+    hold = threading.Event()
+
+    def blocker():
+        with sched.slot("blocker", 1.0, width=sched.slots):
+            hold.wait(10)
+
+    def waiter(job_id, predicted):
+        with sched.slot(job_id, predicted):
+            order.append(job_id)
+
+    threads = [threading.Thread(target=blocker)]
+    threads[0].start()
+    wait_until(lambda: sched.stats()["running"] == 1)
+    for job_id, predicted, queued_at in renders:
+        clock.now = queued_at
+        threads.append(threading.Thread(target=waiter, args=(job_id, predicted)))
+        threads[-1].start()
+        wait_until(lambda: sched.stats()["waiting"] == len(threads) - 1)
+    clock.now = release_at
+    hold.set()
+    for t in threads:
+        t.join(10)
+    return order
+
+def test_shortest_predicted_render_goes_first(clock, monkeypatch):
+    monkeypatch.setattr(scheduler, "RENDER_AGING_RATE", 0.5)
+    renders = [("long", 60.0, 1000.0), ("short", 5.0, 1001.0), ("medium", 20.0, 1002.0)]
+    assert admission_order(RenderScheduler(1), clock, renders, 1003.0) == ["short", "medium", "long"]
+
+def test_equal_priorities_go_in_queue_order(clock, monkeypatch):
+    monkeypatch.setattr(scheduler, "RENDER_AGING_RATE", 0.0)
+    renders = [("first", 10.0, 1000.0), ("second", 10.0, 1001.0), ("third", 10.0, 1002.0)]
+    assert admission_order(RenderScheduler(1), clock, renders, 1003.0) == ["first", "second", "third"]
+
+def test_waiting_ages_a_long_render_ahead(clock, monkeypatch):
+    # At 1170 the long render has waited 170s: 100 - 0.5 * 170 = 15 beats the short one's 20
+    monkeypatch.setattr(scheduler, "RENDER_AGING_RATE", 0.5)
+    renders = [("long", 100.0, 1000.0), ("short", 20.0, 1170.0)]
+    assert admission_order(RenderScheduler(1), clock, renders, 1170.0) == ["long", "short"]
+    monkeypatch.setattr(scheduler, "RENDER_AGING_RATE", 0.0)
+    assert admission_order(RenderScheduler(1), clock, renders, 1170.0) == ["short", "long"]
+
+def test_queue_position_and_eta_are_published(clock, monkeypatch):
+    monkeypatch.setattr(scheduler, "RENDER_AGING_RATE", 0.0)
+    sched = RenderScheduler(2)
+    sched._running = [{"job_id": "a", "predicted": 30.0, "started": 990.0, "width": 1},
+                      {"job_id": "b", "predicted": 50.0, "started": 1000.0, "width": 1}]
+    sched._waiting = [{"job_id": "c", "predicted": 40.0, "queued": 1000.0, "width": 1},
+                      {"job_id": "d", "predicted": 10.0, "queued": 1000.0, "width": 2}]
+    sched._publish(1000.0)
+    # Slots free at 20s (a) and 50s (b); d needs both, then c starts after d
+    assert clock.published["d"]["renderQueue"] == {"position": 1, "waiting": 2, "predictedRenderSeconds": 10.0,
+                                                   "estimatedStartSeconds": 50.0, "estimatedDoneSeconds": 60.0}
+    assert clock.published["c"]["renderQueue"]["position"] == 2
+    assert clock.published["c"]["renderQueue"]["estimatedStartSeconds"] == 60.0
+    clock.now = 1000.0
+    # A new render only queues behind those with a lower priority than its own
+    assert sched.estimate(5.0) == {"predictedRenderSeconds": 5.0, "estimatedStartSeconds": 20.0,
+                                   "estimatedDoneSeconds": 25.0}
+    assert sched.estimate(15.0)["estimatedStartSeconds"] == 60.0
+
+TRUE_WEIGHTS = {"const": 3.0, "video_seconds": 1.4, "video_seconds_3d": 4.0, "surface_cell_seconds": 0.05,
+                "updater_seconds": 0.6, "tex_count": 0.9, "play_count": 0.25}
+
+def synthetic_renders(n: int, seed: int = 7):
+    rng = random.Random(seed)
+    samples = []
+    for _ in range(n):
+        video = rng.uniform(2, 60)
+        features = {"const": 1.0, "video_seconds": video, "video_seconds_3d": video * rng.choice((0, 1)),
+                    "surface_cell_seconds": rng.uniform(0, 200), "updater_seconds": video * rng.randint(0, 3),
+                    "tex_count": rng.randint(0, 12), "play_count": rng.randint(1, 30)}
+        seconds = sum(TRUE_WEIGHTS[k] * features[k] for k in RENDER_COST_FEATURES)
+        samples.append((features, seconds))
+    return samples
+
+def prediction_error(model: RenderCostModel, samples) -> float:
+    return sum(abs(model.predict(f) - seconds) / seconds for f, seconds in samples) / len(samples)
+
+def test_fit_converges_on_the_true_weights():
+    model = RenderCostModel()
+    assert model.fit(synthetic_renders(5000))
+    assert model.samples == 5000
+    for k in RENDER_COST_FEATURES:
+        assert model.weights[k] == pytest.approx(TRUE_WEIGHTS[k], rel=0.05), k
+
+def test_predictions_improve_with_more_samples():
+    held_out = synthetic_renders(300, seed=99)
+    errors = []
+    for n in (0, 20, 100, 400):
+        model = RenderCostModel()
+        model.fit(synthetic_renders(n))
+        errors.append(prediction_error(model, held_out))
+    assert errors == sorted(errors, reverse=True)
+    assert errors[-1] < 0.02
+
+def test_fit_keeps_the_defaults_on_too_few_samples():
+    model = RenderCostModel()
+    assert not model.fit(synthetic_renders(scheduler.RENDER_COST_MIN_SAMPLES - 1))
+    assert model.weights == DEFAULT_RENDER_COST_WEIGHTS
+
+def test_unobserved_features_stay_at_their_default():
+    samples = [({**f, "surface_cell_seconds": 0.0}, s) for f, s in synthetic_renders(200)]
+    model = RenderCostModel()
+    assert model.fit(samples)
+    assert model.weights["surface_cell_seconds"] == pytest.approx(DEFAULT_RENDER_COST_WEIGHTS["surface_cell_seconds"])
+
+def test_calibration_reads_successful_renders_from_the_job_index(tmp_path, monkeypatch):
+    index = JobIndex(tmp_path / "jobs.sqlite3")
+    model = RenderCostModel()
+    monkeypatch.setattr(scheduler, "JOB_INDEX", index)
+    monkeypatch.setattr(scheduler, "RENDER_COST_MODEL", model)
+    conn = index.connect()
+    with conn:
+        for i, (features, seconds) in enumerate(synthetic_renders(300)):
+            renders = [{"features": features, "seconds": seconds, "ok": True},
+                       {"features": features, "seconds": 9999.0, "ok": False}]  # failed renders are not samples
+            conn.execute("INSERT INTO jobs (job_id, created_at, prompt, prompt_hash, status, renders) VALUES (?, ?, '', '', 'done', ?)",
+                         (f"{i:08x}", float(i), json.dumps(renders)))
+    conn.close()
+    assert scheduler.calibrate_render_cost_model() == 300
+    assert model.weights["video_seconds"] == pytest.approx(TRUE_WEIGHTS["video_seconds"], rel=0.1)
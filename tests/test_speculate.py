@@ -0,0 +1,92 @@
+"""race_candidates: the first passing dry run wins, losers are cancelled, dry runs hold render slots."""
+import os, subprocess, threading, time
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from app import speculate  # noqa: E402
+from app.core import get_job  # noqa: E402
+from app.process import RenderCancelled  # noqa: E402
+from app.scheduler import RenderScheduler, SlotCancelled  # noqa: E402
+from app.schemas import ManimPayload  # noqa: E402
+
+def candidate(behavior: str) -> ManimPayload:
+    code = f"# {behavior}\nfrom manim import *\nclass S(Scene):\n    def construct(self):\n        pass\n"
+    return ManimPayload(file_name="scene.py", scene_name="S", code=code, subtitle_cues=[])
+
+@pytest.fixture
+def dry_runs(monkeypatch):
+    """Fake dry runs steered by the candidate's first line: pass <s>, fail <s> or hang."""
+    runs = {"started": [], "cancelled": [], "running": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def fake_run_manim(workdir, file_name, scene_name, timeout, dry_run=False, cancel=None):
+        assert dry_run
+        behavior = (workdir / file_name).read_text().split("\n")[0][2:]
+        with lock:
+            runs["started"].append(workdir.name)
+            runs["running"] += 1
+            runs["peak"] = max(runs["peak"], runs["running"])
+        try:
+            kind, _, seconds = behavior.partition(" ")
+            if kind == "hang":
+                if cancel.wait(5):
+                    runs["cancelled"].append(workdir.name)
+                    raise RenderCancelled(-9, ["manim"], "")
+                raise AssertionError("loser was never cancelled")
+            time.sleep(float(seconds))
+            if kind == "fail":
+                raise subprocess.CalledProcessError(1, ["manim"], output="NameError: name 'Foo' is not defined")
+            return ""
+        finally:
+            with lock:
+                runs["running"] -= 1
+
+    monkeypatch.setattr(speculate, "run_manim", fake_run_manim)
+    monkeypatch.setattr(speculate, "_validate_payload", lambda workdir, payload: payload.code)
+    monkeypatch.setattr(speculate, "RENDER_SCHEDULER", RenderScheduler(8))
+    return runs
+
+def test_first_passing_candidate_wins(tmp_path, dry_runs):
+    winner = speculate.race_candidates("aaaaaaaa", tmp_path, [candidate("fail 0"), candidate("pass 0.2"), candidate("pass 0.05")])
+    assert winner == 2
+    assert get_job("aaaaaaaa")["speculation"]["failed"] == [0]
+
+def test_all_failing_returns_none(tmp_path, dry_runs):
+    assert speculate.race_candidates("aaaaaaaa", tmp_path, [candidate("fail 0"), candidate("fail 0.05")]) is None
+    assert sorted(dry_runs["started"]) == ["0", "1"]
+    assert "candidate 0: " in (tmp_path / "job.log").read_text()
+
+def test_lint_failure_skips_the_dry_run(tmp_path, dry_runs):
+    broken = candidate("pass 0").model_copy(update={"scene_name": "Missing"})
+    assert speculate.race_candidates("aaaaaaaa", tmp_path, [broken, candidate("pass 0")]) == 1
+    assert dry_runs["started"] == ["1"]
+
+def test_losers_are_cancelled(tmp_path, dry_runs):
+    assert speculate.race_candidates("aaaaaaaa", tmp_path, [candidate("hang"), candidate("pass 0.1"), candidate("hang")]) == 1
+    deadline = time.monotonic() + 2
+    while len(dry_runs["cancelled"]) < 2 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert sorted(dry_runs["cancelled"]) == ["0", "2"]
+
+def test_dry_runs_wait_for_render_slots(tmp_path, dry_runs, monkeypatch):
+    scheduler = RenderScheduler(1)
+    monkeypatch.setattr(speculate, "RENDER_SCHEDULER", scheduler)
+    assert speculate.race_candidates("aaaaaaaa", tmp_path, [candidate("pass 0.1")] * 3) is not None
+    deadline = time.monotonic() + 2
+    while scheduler.stats()["running"] + scheduler.stats()["waiting"] and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert dry_runs["peak"] == 1
+    assert scheduler.stats() == {"slots": 1, "slotsInUse": 0, "running": 0, "waiting": 0}
+
+def test_cancel_drops_a_waiting_ticket():
+    scheduler, cancel = RenderScheduler(1), threading.Event()
+    with scheduler.slot("a", 1.0):
+        threading.Timer(0.1, cancel.set).start()
+        started = time.monotonic()
+        with pytest.raises(SlotCancelled):
+            with scheduler.slot("b", 1.0, cancel=cancel):
+                pass
+        assert time.monotonic() - started < 1
+        assert scheduler.stats()["waiting"] == 0
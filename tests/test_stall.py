@@ -0,0 +1,73 @@
+"""StallWatch: progress read from manim's output and its session's CPU; a render without progress is killed."""
+import os, sys, textwrap
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from app import process  # noqa: E402
+from app.process import OutputSink, StallWatch, supervise  # noqa: E402
+
+needs_proc = pytest.mark.skipif(not os.path.isdir("/proc"), reason="needs /proc")
+
+def bar(animation: int, frame: int, total: int = 30) -> str:
+    return f"\rAnimation {animation}: Create(Square):  50%|#####     | {frame}/{total} [00:01<00:01, 9.8it/s]"
+
+@pytest.fixture
+def windows(monkeypatch):
+    monkeypatch.setattr(process, "SUPERVISE_POLL_SECONDS", 0.1)
+    monkeypatch.setattr(process, "RENDER_STALL_SECONDS", 1.0)
+    monkeypatch.setattr(process, "RENDER_STALL_STARTUP_SECONDS", 1.0)
+
+def fake_manim(tmp_path, body: str):
+    """A python child running body after a manim-like first line; returns (exit code, stall reason)."""
+    script = "import sys, time, subprocess\nprint('Manim Community v0.18.0', flush=True)\n" + textwrap.dedent(body)
+    watch = StallWatch()
+    sink = OutputSink(listeners=[watch.feed])
+    return supervise([sys.executable, "-c", script], tmp_path, 30, sink, on_start=watch.attach, check=watch.check)
+
+def test_progress_bar_frames_and_phases_count_as_progress():
+    watch = StallWatch()
+    watch.last_progress = 0.0
+    watch.feed("Manim Community v0.18.0\n")
+    assert watch.last_progress == 0.0 and watch.frame is None
+    watch.feed(bar(0, 3)[:30])  # split mid-line: the carry is parsed once it is complete
+    watch.feed(bar(0, 3)[30:])
+    assert (watch.animation, watch.frame) == (0, (3, 30)) and watch.last_progress > 0.0
+    watch.last_progress = 0.0
+    watch.feed(bar(0, 3))  # the same frame redrawn
+    assert watch.last_progress == 0.0
+    watch.feed("\nINFO     Partial movie file written in '/tmp/x.mp4'\n")
+    assert watch.last_progress > 0.0
+
+def test_no_stall_before_attach_or_within_the_window(windows):
+    watch = StallWatch()
+    assert watch.check() is None
+    watch.attach(os.getpid())
+    assert watch.check() is None
+
+@needs_proc
+def test_idle_render_is_killed_before_its_first_frame(tmp_path, windows):
+    returncode, reason = fake_manim(tmp_path, "time.sleep(30)\n")
+    assert returncode < 0
+    assert "before the first animation" in reason and "idle" in reason
+
+@needs_proc
+def test_busy_render_is_killed_where_it_stopped(tmp_path, windows):
+    returncode, reason = fake_manim(tmp_path, f"""
+        sys.stdout.write({bar(2, 7)!r}); sys.stdout.flush()
+        while True: pass
+    """)
+    assert returncode < 0
+    assert "animation 2, frame 7/30" in reason and "busy" in reason
+
+@needs_proc
+def test_steady_frames_and_new_processes_keep_a_render_alive(tmp_path, windows):
+    returncode, reason = fake_manim(tmp_path, f"""
+        for frame in range(6):
+            sys.stdout.write({bar(0, 0)!r}.replace(" 0/30", f" {{frame}}/30")); sys.stdout.flush()
+            time.sleep(0.4)
+        for _ in range(3):  # no output, but a new child (latex, ffmpeg) each time
+            subprocess.run([sys.executable, "-c", "import time; time.sleep(0.5)"])
+    """)
+    assert (returncode, reason) == (0, None)
@@ -0,0 +1,33 @@
+"""Startup: importing app.main stays cheap; the background threads start from the lifespan, in order."""
+import argparse, os, subprocess, sys
+
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from app import bench, main  # noqa: E402
+
+IMPORT_BUDGET_SECONDS = 1.5  # median cold import of app.main; fastapi itself is most of it
+LAZY_MODULES = ("openai", "jinja2", "numpy", "boto3", "redis", "httpx", "pydub", "manim")
+
+def test_import_time_is_within_budget():
+    report = bench.import_time(argparse.Namespace(repeat=3, top=5, max_seconds=IMPORT_BUDGET_SECONDS))
+    assert report["ok"], report
+
+def test_heavy_modules_are_imported_lazily():
+    script = f"import sys, app.main; print(' '.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    proc = subprocess.run([sys.executable, "-c", script], cwd=str(main.BASE_DIR.parent), capture_output=True, text=True,
+                          env=dict(os.environ, OPENAI_API_KEY="test"))
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    assert proc.stdout.split() == []
+
+def test_lifespan_starts_the_hooks_in_order(monkeypatch):
+    started = []
+    hooks = ("start_render_cost_calibration", "start_journal_exporter", "start_toolchain_probe",
+             "start_queue_worker", "start_index_backfill", "start_renders_gc")
+    for name in hooks:
+        monkeypatch.setattr(main, name, lambda name=name: started.append(name))
+    TestClient(main.app).get("/metrics")  # no lifespan without the context manager: nothing starts
+    assert started == []
+    with TestClient(main.app):
+        assert started == list(hooks)
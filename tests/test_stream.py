@@ -0,0 +1,65 @@
+"""JSONFieldStream: fields and array items reported once each, however the answer is chunked."""
+import json, os
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from app.stream import JSONFieldStream  # noqa: E402
+
+PAYLOAD = r'''{
+  "scene_name": "Say \"hi\", {world} [0]",
+  "subtitle_cues": [
+    {"start": 0, "end": 1.5, "text": "caf\u00e9 \u2192 na\u00efve"},
+    {"start": 1.5, "end": 3, "text": "a, [b], {c}: \"d\""},
+    {"start": 3, "text": "\ud83d\ude00 \\ done"}
+  ],
+  "matrix": [[1, 2], [3, [4, 5]], []],
+  "empty": [],
+  "meta": {"nested": [1, {"k\"ey": "}]"}], "n": null},
+  "code": "from manim import *\nclass S(Scene):\n    def construct(self):\n        t = MathTex(r\"\\frac{1}{2}\")\n        self.play(Write(t))\n",
+  "ok": true
+}'''
+EXPECTED = json.loads(PAYLOAD)
+
+def scan(chunks):
+    fields, items = [], []
+    parser = JSONFieldStream(lambda k, v: fields.append((k, v)), lambda k, i, v: items.append((k, i, v)))
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser, fields, items
+
+def expected_items():
+    return [(key, i, item) for key, value in EXPECTED.items() if isinstance(value, list) for i, item in enumerate(value)]
+
+def check(chunks):
+    parser, fields, items = scan(chunks)
+    assert fields == list(EXPECTED.items())
+    assert items == expected_items()
+    assert parser.text == PAYLOAD
+
+def test_whole_payload():
+    check([PAYLOAD])
+
+def test_split_at_every_boundary():
+    for cut in range(len(PAYLOAD) + 1):
+        check([PAYLOAD[:cut], PAYLOAD[cut:]])
+
+def test_split_around_every_character():
+    for cut in range(len(PAYLOAD) - 1):
+        check([PAYLOAD[:cut], PAYLOAD[cut:cut + 2], PAYLOAD[cut + 2:]])
+
+def test_one_character_at_a_time():
+    check(list(PAYLOAD))
+
+def test_cues_are_reported_before_the_code_arrives():
+    cut = PAYLOAD.index('"matrix"')
+    _, fields, items = scan([PAYLOAD[:cut]])
+    assert [k for k, _ in fields] == ["scene_name", "subtitle_cues"]
+    assert [i for k, i, _ in items if k == "subtitle_cues"] == [0, 1, 2]
+
+def test_text_is_readable_while_feeding():
+    parser = JSONFieldStream()
+    for ch in PAYLOAD[:40]:
+        parser.feed(ch)
+    assert parser.text == PAYLOAD[:40]
+    parser.feed(PAYLOAD[40:])
+    assert parser.text == PAYLOAD
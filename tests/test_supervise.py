@@ -0,0 +1,71 @@
+"""supervise() and OutputSink: streamed output, a bounded tail, redraws collapsed and noise counted, not logged."""
+import os, subprocess, sys
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from app import process  # noqa: E402
+from app.process import OutputSink, run_logged, supervise  # noqa: E402
+
+def python(script: str):
+    return [sys.executable, "-c", script]
+
+def test_tail_keeps_the_last_lines_and_the_log_keeps_all(tmp_path, monkeypatch):
+    monkeypatch.setattr(process, "PROCESS_TAIL_LINES", 50)
+    seen = []
+    sink = OutputSink(tmp_path / "job.log", listeners=[seen.append], header="[manim] render")
+    returncode, reason = supervise(python("for i in range(20000): print('line', i)"), tmp_path, 30, sink)
+    assert (returncode, reason) == (0, None)
+    assert list(sink.tail) == [f"line {i}" for i in range(19950, 20000)]
+    log = (tmp_path / "job.log").read_text().splitlines()
+    assert log[0] == "[manim] render" and len(log) == 20001 and log[-1] == "line 19999"
+    assert "".join(seen).count("\n") == 20000
+
+def test_redraws_collapse_and_noise_is_counted(tmp_path):
+    sink = OutputSink(tmp_path / "job.log")
+    for chunk in ("Rendering  10%\rRendering  50%\r", "Rendering 100%\r\n",
+                  "major issue: none\nMiKTeX: Major issue: So far, you have not checked for MiKTeX updates.\n",
+                  "Windows API error 5: Access is denied. (security risk)\n", "done"):
+        sink.feed(chunk)
+    sink.close()
+    assert sink.text() == "Rendering 100%\nmajor issue: none\ndone\n"
+    assert sink.noise == 2
+    assert (tmp_path / "job.log").read_text() == sink.text() + "[2 noise lines filtered]\n"
+
+def test_long_lines_and_endless_redraws_stay_bounded(monkeypatch):
+    monkeypatch.setattr(process, "PROCESS_MAX_LINE", 100)
+    sink = OutputSink()
+    sink.feed("x" * 1000 + "\n")
+    for i in range(5000):  # a progress bar redrawn forever without a newline
+        sink.feed(f"\r{i:05d}")
+    assert len(sink._carry) <= 4 * 100 + 6
+    sink.close()
+    assert list(sink.tail) == ["x" * 100, "04999"]
+
+def test_utf8_split_across_reads_is_decoded(tmp_path):
+    sink = OutputSink()
+    script = "import sys, time\nfor b in 'café → ok\\n'.encode(): sys.stdout.buffer.write(bytes([b])); sys.stdout.flush()"
+    supervise(python(script), tmp_path, 30, sink)
+    assert sink.text() == "café → ok\n"
+
+def test_check_reason_kills_the_process_tree(tmp_path, monkeypatch):
+    monkeypatch.setattr(process, "SUPERVISE_POLL_SECONDS", 0.1)
+    script = "import subprocess, sys, time\nsubprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])\ntime.sleep(60)"
+    started = []
+    returncode, reason = supervise(python(script), tmp_path, 30, OutputSink(), on_start=started.append,
+                                   check=lambda: "stop" if started else None)
+    assert reason == "stop" and returncode < 0
+
+def test_timeout_raises_with_the_tail(tmp_path, monkeypatch):
+    monkeypatch.setattr(process, "SUPERVISE_POLL_SECONDS", 0.1)
+    with pytest.raises(subprocess.TimeoutExpired) as e:
+        supervise(python("import time; print('working', flush=True); time.sleep(60)"), tmp_path, 0.5, OutputSink())
+    assert e.value.output == "working\n"
+
+def test_run_logged_raises_on_failure(tmp_path):
+    assert run_logged(python("print('ok')"), tmp_path) == "ok\n"
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        run_logged(python("import sys; print('bad input'); sys.exit(3)"), tmp_path, tmp_path / "job.log")
+    assert e.value.returncode == 3 and e.value.output == "bad input\n"
+    assert (tmp_path / "job.log").read_text().endswith("bad input\n")